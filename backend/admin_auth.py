@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Admin access for diagnostic options and endpoints
+Admin requests carry the shared token in the X-Admin-Token header. With no
+token configured every admin feature is off.
+
+Configuration (environment):
+    ADMIN_TOKEN   shared secret for admin requests (unset disables admin features)
+"""
+
+import functools
+import hmac
+import os
+
+from flask import jsonify, request
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ADMIN_HEADER = 'X-Admin-Token'
+
+
+def is_admin_request() -> bool:
+    supplied = request.headers.get(ADMIN_HEADER, '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def admin_denied():
+    return jsonify({
+        'success': False,
+        'message': f'Admin token required ({ADMIN_HEADER} header)'
+    }), 403
+
+
+def admin_required(view):
+    """Route decorator: 403 unless the request carries the admin token"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not is_admin_request():
+            return admin_denied()
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Admission control for invoice processing requests
+Every processing request gets an estimated cost in parsing worker-seconds,
+from its file count and each file's name and size (see batch_scheduler and
+cost_model). Requests
+are admitted against a shared budget kept in the SQLite store, so the limit
+holds across gunicorn workers:
+
+    running    admitted requests, whose costs add up to at most ADMISSION_MAX_COST
+    waiting    a bounded FIFO queue; small requests may start ahead of large ones
+    rejected   503 when the queue is full or the wait runs out,
+               429 when the client already has too many requests in the system
+
+Rejections carry Retry-After, estimated from the work ahead of the request.
+Tickets of web workers that died are dropped on the next admission.
+
+Configuration (environment):
+    ADMISSION_ENABLED          0 turns admission control off (default 1)
+    ADMISSION_MAX_COST         worker-seconds running at once (default 60 s of every parsing worker)
+    ADMISSION_MAX_WAITING      requests allowed to wait (default half of GUNICORN_THREADS)
+    ADMISSION_WAIT_SECONDS     seconds a request waits before it is rejected (default 30)
+    ADMISSION_PER_CLIENT       running plus waiting requests per client (default 2)
+    ADMISSION_SMALL_COST       requests up to this cost may pass larger waiting ones (default 5)
+    TRUSTED_PROXY_HOPS         proxies in front of gunicorn that append to X-Forwarded-For (default 1)
+"""
+
+import functools
+import json
+import logging
+import math
+import os
+import posixpath
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator
+
+from flask import jsonify, request
+
+from batch_scheduler import predict_upload_seconds
+from invoice_store import get_connection
+from worker_pool import POOL_SIZE
+from zip_upload import is_zip_upload, is_pdf_member
+
+logger = logging.getLogger(__name__)
+
+WEB_WORKERS = int(os.environ.get('WEB_CONCURRENCY', '2'))
+WEB_THREADS = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Parsing worker-seconds the whole deployment gets through per second
+THROUGHPUT = max(1, POOL_SIZE) * max(1, WEB_WORKERS)
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+ADMISSION_MAX_COST = float(os.environ.get('ADMISSION_MAX_COST', str(THROUGHPUT * 60)))
+# Waiting requests hold a web thread; the queue is shared, so all of them could
+# be on one web worker - keep at least half of its threads for other requests
+ADMISSION_MAX_WAITING = int(os.environ.get('ADMISSION_MAX_WAITING', str(max(1, WEB_THREADS // 2))))
+ADMISSION_WAIT_SECONDS = float(os.environ.get('ADMISSION_WAIT_SECONDS', '30'))
+ADMISSION_PER_CLIENT = int(os.environ.get('ADMISSION_PER_CLIENT', '2'))
+ADMISSION_SMALL_COST = float(os.environ.get('ADMISSION_SMALL_COST', '5'))
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '1'))
+
+CACHED_FILE_SECONDS = 0.01
+
+POLL_SECONDS = 0.25
+# Tickets older than the gunicorn timeout belong to requests that were killed
+STALE_SECONDS = int(os.environ.get('GUNICORN_TIMEOUT', '300')) + 60
+
+STATE_WAITING = 'waiting'
+STATE_RUNNING = 'running'
+
+
+class AdmissionRejected(Exception):
+    """Request not admitted - status is 429 or 503"""
+
+    def __init__(self, status: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _stream_size(stream) -> int:
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def estimate_upload_cost(files: List[Any], cached_count: int = 0) -> Dict[str, Any]:
+    """Files, bytes and estimated cost of the uploaded files (ZIPs by their central directory)"""
+    sizes = []
+    for file in files:
+        if file.filename and file.filename.endswith('.pdf'):
+            sizes.append((file.filename, _stream_size(file.stream)))
+        elif is_zip_upload(file.filename):
+            try:
+                with zipfile.ZipFile(file.stream) as archive:
+                    sizes += [(posixpath.basename(info.filename), info.file_size)
+                              for info in archive.infolist() if is_pdf_member(info)]
+            except zipfile.BadZipFile:
+                pass  # reported as a skipped file when the request runs
+            finally:
+                file.stream.seek(0)
+
+    return {
+        'files': len(sizes) + cached_count,
+        'bytes': sum(size for _, size in sizes),
+        'cost': round(sum(predict_upload_seconds(filename, size) for filename, size in sizes)
+                      + cached_count * CACHED_FILE_SECONDS, 2)
+    }
+
+
+def client_key() -> str:
+    """
+    Client address as seen by the outermost trusted proxy
+
+    Clients can send any X-Forwarded-For; only the hops appended by our own
+    proxies (the last TRUSTED_PROXY_HOPS entries) can be relied on.
+    """
+    hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    if TRUSTED_PROXY_HOPS > 0 and len(hops) >= TRUSTED_PROXY_HOPS:
+        return hops[-TRUSTED_PROXY_HOPS]
+    return request.remote_addr or 'unknown'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _prune(conn) -> None:
+    """Drop tickets of web workers that exited or requests that outlived the gunicorn timeout"""
+    conn.execute('DELETE FROM admission_tickets WHERE created_at < ?', (time.time() - STALE_SECONDS,))
+    pids = [row['pid'] for row in conn.execute('SELECT DISTINCT pid FROM admission_tickets')]
+    for pid in pids:
+        if not _pid_alive(pid):
+            conn.execute('DELETE FROM admission_tickets WHERE pid = ?', (pid,))
+
+
+def _retry_after(cost_ahead: float) -> int:
+    return int(min(300, max(1, math.ceil(cost_ahead / THROUGHPUT))))
+
+
+def _try_start(conn, ticket_id: int, cost: float) -> bool:
+    """Start a waiting ticket if it fits: FIFO, except small requests may pass larger ones"""
+    running = conn.execute(
+        'SELECT COALESCE(SUM(cost), 0) AS cost, COUNT(*) AS count FROM admission_tickets WHERE state = ?',
+        (STATE_RUNNING,)
+    ).fetchone()
+    # A request larger than the whole budget runs alone rather than never
+    fits = running['count'] == 0 or running['cost'] + cost <= ADMISSION_MAX_COST
+    if not fits:
+        return False
+
+    if cost > ADMISSION_SMALL_COST:
+        first = conn.execute(
+            'SELECT MIN(id) AS id FROM admission_tickets WHERE state = ? AND cost > ?',
+            (STATE_WAITING, ADMISSION_SMALL_COST)
+        ).fetchone()
+        if first['id'] != ticket_id:
+            return False
+
+    conn.execute('UPDATE admission_tickets SET state = ?, started_at = ? WHERE id = ?',
+                 (STATE_RUNNING, time.time(), ticket_id))
+    return True
+
+
+@contextmanager
+def admitted(client: str, cost: float) -> Iterator[None]:
+    """Hold a share of the processing budget for the duration of the block"""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        _prune(conn)
+        client_count = conn.execute(
+            'SELECT COUNT(*) FROM admission_tickets WHERE client = ?', (client,)
+        ).fetchone()[0]
+        totals = conn.execute(
+            '''SELECT COALESCE(SUM(cost), 0) AS cost,
+                      COALESCE(SUM(state = 'waiting'), 0) AS waiting
+               FROM admission_tickets'''
+        ).fetchone()
+
+        if client_count >= ADMISSION_PER_CLIENT:
+            raise AdmissionRejected(
+                429, f'Too many processing requests from this client ({client_count} in progress)',
+                _retry_after(totals['cost']))
+        if totals['waiting'] >= ADMISSION_MAX_WAITING:
+            raise AdmissionRejected(503, 'Server is busy processing other uploads',
+                                    _retry_after(totals['cost']))
+
+        ticket_id = conn.execute(
+            'INSERT INTO admission_tickets (client, cost, pid, state, created_at) VALUES (?, ?, ?, ?, ?)',
+            (client, cost, os.getpid(), STATE_WAITING, time.time())
+        ).lastrowid
+        started = _try_start(conn, ticket_id, cost)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    try:
+        deadline = time.monotonic() + ADMISSION_WAIT_SECONDS
+        while not started:
+            if time.monotonic() >= deadline:
+                cost_ahead = conn.execute(
+                    'SELECT COALESCE(SUM(cost), 0) FROM admission_tickets WHERE id < ?', (ticket_id,)
+                ).fetchone()[0]
+                raise AdmissionRejected(503, 'Server is busy processing other uploads',
+                                        _retry_after(cost_ahead))
+            time.sleep(POLL_SECONDS)
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                _prune(conn)
+                started = _try_start(conn, ticket_id, cost)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        yield
+    finally:
+        conn.execute('DELETE FROM admission_tickets WHERE id = ?', (ticket_id,))
+        conn.commit()
+
+
+def rejection_response(rejected: AdmissionRejected):
+    response = jsonify({
+        'success': False,
+        'message': f'{rejected.message}, please retry in {rejected.retry_after} s',
+        'retry_after': rejected.retry_after
+    })
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = str(rejected.retry_after)
+    return response
+
+
+def admission_controlled(view):
+    """Route decorator: estimate the upload's cost and run the view once it is admitted"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMISSION_ENABLED or request.method != 'POST':
+            return view(*args, **kwargs)
+
+        try:
+            cached_count = len(json.loads(request.form.get('cached') or '[]'))
+        except (TypeError, ValueError):
+            cached_count = 0  # the view reports the malformed field
+        estimate = estimate_upload_cost(request.files.getlist('files'), cached_count)
+        try:
+            with admitted(client_key(), estimate['cost']):
+                return view(*args, **kwargs)
+        except AdmissionRejected as rejected:
+            logger.info("Admission rejected (%s) for %s: %s files, cost %s s",
+                        rejected.status, client_key(), estimate['files'], estimate['cost'])
+            return rejection_response(rejected)
+
+    return wrapper
+
+
+def admission_stats() -> Dict[str, Any]:
+    """Current tickets and budget, for /api/metrics"""
+    rows = get_connection().execute(
+        'SELECT state, COUNT(*) AS count, COALESCE(SUM(cost), 0) AS cost FROM admission_tickets GROUP BY state'
+    ).fetchall()
+    by_state = {row['state']: {'requests': row['count'], 'cost': round(row['cost'], 2)} for row in rows}
+    return {
+        'enabled': ADMISSION_ENABLED,
+        'max_cost': ADMISSION_MAX_COST,
+        'max_waiting': ADMISSION_MAX_WAITING,
+        'per_client': ADMISSION_PER_CLIENT,
+        STATE_RUNNING: by_state.get(STATE_RUNNING, {'requests': 0, 'cost': 0}),
+        STATE_WAITING: by_state.get(STATE_WAITING, {'requests': 0, 'cost': 0})
+    }
+
+
+if __name__ == "__main__":
+    print(f"Throughput {THROUGHPUT} worker-s/s, budget {ADMISSION_MAX_COST} worker-s")
+    for size_kb in (50, 200, 1000, 5000):
+        print(f"  {size_kb:>5} KB PDF ~ {predict_upload_seconds('', size_kb * 1024):.2f} worker-s")
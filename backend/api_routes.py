@@ -1,32 +1,42 @@
 #!/usr/bin/env python3
 """API routes for invoice processing"""
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify
 import os
 import tempfile
-import fitz
 from datetime import datetime
 import json
 import csv
 import io
+import logging
 import traceback
 import sys
 import time
+import zipfile
 
 # Add backend directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import parsers with error handling
-try:
-    from final_improved_tiktok_parser_v2 import parse_tiktok_invoice_detailed
-    from google_parser_professional import parse_google_invoice
-    from facebook_parser_complete import parse_facebook_invoice
-    print("Parsers imported successfully")
-except ImportError as e:
-    print(f"Error importing parsers: {e}")
-    traceback.print_exc()
+# fitz and the parsers are imported on first use (see parser_registry and
+# startup.warm_up) so that importing the app stays cheap on cold start
 
 api = Blueprint('api', __name__)
+logger = logging.getLogger(__name__)
+
+# Queued log writes with request ids (see app_logging)
+from app_logging import configure_logging, install_request_ids, update_context
+configure_logging()
+install_request_ids(api)
+
+# gzip for report, export and metrics responses (see http_compression)
+from http_compression import compress_response
+api.after_request(compress_response)
+
+# Processing requests wait for a share of the parsing budget (see admission)
+from admission import admission_controlled
+
+# Diagnostic endpoints need the admin token (see admin_auth)
+from admin_auth import admin_required
 
 @api.route('/test-upload', methods=['POST'])
 def test_upload():
@@ -68,15 +78,13 @@ def health_check():
     }
     
     try:
-        # Test if parsers can be called
-        if 'parse_tiktok_invoice_detailed' in globals():
-            parsers_status['tiktok'] = True
-        if 'parse_google_invoice' in globals():
-            parsers_status['google'] = True
-        if 'parse_facebook_invoice' in globals():
-            parsers_status['facebook'] = True
+        # Check the serving parsers are installed without importing them
+        from parser_registry import parser_available
+        parsers_status['tiktok'] = parser_available('TikTok')
+        parsers_status['google'] = parser_available('Google')
+        parsers_status['facebook'] = parser_available('Facebook')
     except Exception as e:
-        print(f"Error checking parsers: {e}")
+        logger.warning("Error checking parsers: %s", e)
     
     return jsonify({
         'status': 'healthy',
@@ -85,7 +93,229 @@ def health_check():
         'python_version': sys.version
     })
 
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Parsing worker pool metrics (documents processed, RSS, restarts) and admission state"""
+    from admission import admission_stats
+    from worker_pool import get_invoice_pool_stats, current_rss_mb
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'rss_mb': round(current_rss_mb(), 1),
+        'worker_pool': get_invoice_pool_stats(),
+        'admission': admission_stats()
+    })
+
+@api.route('/admin/samples', methods=['GET'])
+@admin_required
+def sampled_stacks():
+    """Collapsed stacks sampled in the parsing workers, for flame graphs; ?reset=1 starts over"""
+    try:
+        from sampling_profiler import collapsed_stacks
+        text = collapsed_stacks(reset=request.args.get('reset') == '1')
+        return Response(text, mimetype='text/plain')
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error reading samples: {str(e)}'
+        }), 500
+
+@api.route('/shadow/summary', methods=['GET'])
+@admin_required
+def shadow_summary():
+    """Shadow parser comparison results per platform and candidate"""
+    try:
+        from shadow_mode import summarize_shadow_runs, SHADOW_PARSERS, SHADOW_SAMPLE_RATE
+        return jsonify({
+            'success': True,
+            'sample_rate': SHADOW_SAMPLE_RATE,
+            'candidates': SHADOW_PARSERS,
+            'results': summarize_shadow_runs()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error reading shadow results: {str(e)}'
+        }), 500
+
+@api.route('/known-hashes', methods=['POST'])
+def known_hashes():
+    """Which of the client's SHA-256 hashes this client already had parsed and cached"""
+    try:
+        from admission import client_key
+        from parse_cache import (
+            cache_scope, find_known_hashes, normalize_hashes, CLIENT_ID_HEADER, MAX_HASHES_PER_REQUEST
+        )
+        
+        payload = request.get_json(silent=True) or {}
+        hashes = normalize_hashes(payload.get('hashes') or [])
+        if len(hashes) > MAX_HASHES_PER_REQUEST:
+            return jsonify({
+                'success': False,
+                'message': f'At most {MAX_HASHES_PER_REQUEST} hashes per request'
+            }), 400
+        
+        known = find_known_hashes(hashes, cache_scope(request.headers.get(CLIENT_ID_HEADER), client_key()))
+        known_set = set(known)
+        return jsonify({
+            'success': True,
+            'known': known,
+            'unknown': [value for value in hashes if value not in known_set]
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error checking hashes: {str(e)}'
+        }), 500
+
+@api.route('/net-spend', methods=['GET'])
+@admin_required
+def net_spend():
+    """Charges, credits and net spend per project across all stored invoices"""
+    try:
+        from credit_matching import get_credit_index
+        return jsonify({
+            'success': True,
+            'projects': get_credit_index().project_net_spend(request.args.get('platform'))
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error computing net spend: {str(e)}'
+        }), 500
+
+@api.route('/credits', methods=['GET'])
+@admin_required
+def credits():
+    """Credit lines and the charge each one is linked to (?unmatched=1 for open credits)"""
+    try:
+        from credit_matching import get_credit_index
+        unmatched_only = request.args.get('unmatched') == '1'
+        return jsonify({
+            'success': True,
+            'credits': get_credit_index().credits(unmatched_only)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error reading credits: {str(e)}'
+        }), 500
+
+@api.route('/search', methods=['GET'])
+def search_line_items():
+    """
+    Search stored line items: ?q=&platform=&invoice_type=&period=&batch_id=&page=&limit=
+    
+    Searching every batch needs the admin token. With a batch_id the search
+    stays within that upload, and the batch id grants access as it does for
+    /reports/<batch_id>.
+    """
+    try:
+        from admin_auth import is_admin_request, admin_denied
+        from report_store import get_report_hash
+        from search_index import get_search_index, FILTER_FIELDS, DEFAULT_LIMIT
+        filters = {field: request.args.get(field) for field in FILTER_FIELDS}
+        if not is_admin_request():
+            batch_id = filters.get('batch_id')
+            if not batch_id:
+                return admin_denied()
+            if get_report_hash(batch_id) is None:
+                return jsonify({
+                    'success': False,
+                    'message': f'Report {batch_id} not found'
+                }), 404
+        found = get_search_index().search(
+            request.args.get('q', ''),
+            filters,
+            page=request.args.get('page', 1, type=int),
+            limit=request.args.get('limit', DEFAULT_LIMIT, type=int)
+        )
+        return jsonify({'success': True, **found})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error searching line items: {str(e)}'
+        }), 500
+
+@api.route('/reports', methods=['GET'])
+@admin_required
+def reports():
+    """Most recent stored reports"""
+    try:
+        from report_store import list_reports
+        return jsonify({
+            'success': True,
+            'reports': list_reports(request.args.get('limit', 20, type=int))
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error listing reports: {str(e)}'
+        }), 500
+
+@api.route('/reports/<batch_id>', methods=['GET'])
+def get_report(batch_id):
+    """
+    Stored report by batch id
+    
+    The batch id is a random uuid only returned to the uploader, so holding
+    it is what grants access, as with the upload itself (no admin token).
+    
+    ?summary_only=1 returns the summary without files; otherwise
+    page/limit select files, item_page/item_limit select items within each
+    file and fields=amount,description projects the item fields.
+    """
+    try:
+        from columnar import encode_report, wants_columnar
+        from http_compression import report_etag, not_modified
+        from report_store import (
+            get_report_summary, get_report_page, get_report_hash, parse_fields,
+            DEFAULT_FILE_LIMIT, DEFAULT_ITEM_LIMIT
+        )
+        
+        # Stored reports never change: answer revalidations before reading any rows
+        content_hash = get_report_hash(batch_id)
+        etag = report_etag(content_hash, request.args) if content_hash else None
+        if etag:
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+        
+        if request.args.get('summary_only') == '1':
+            report = get_report_summary(batch_id)
+        else:
+            report = get_report_page(
+                batch_id,
+                page=request.args.get('page', 1, type=int),
+                limit=request.args.get('limit', DEFAULT_FILE_LIMIT, type=int),
+                item_page=request.args.get('item_page', 1, type=int),
+                item_limit=request.args.get('item_limit', DEFAULT_ITEM_LIMIT, type=int),
+                fields=parse_fields(request.args.get('fields')),
+                include_summary=request.args.get('include_summary', '1') == '1'
+            )
+        
+        if report is None:
+            return jsonify({
+                'success': False,
+                'message': f'Report {batch_id} not found'
+            }), 404
+        
+        if 'files' in report and wants_columnar(request.args):
+            report = encode_report(report)
+        
+        response = jsonify({'success': True, 'data': report})
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error reading report: {str(e)}'
+        }), 500
+
 @api.route('/process-invoices-simple', methods=['POST'])
+@admission_controlled
 def process_invoices_simple():
     """Simple test endpoint for invoice processing"""
     try:
@@ -136,147 +366,241 @@ def process_invoices_simple():
         }), 500
 
 @api.route('/process-invoices', methods=['POST', 'OPTIONS'])
+@admission_controlled
 def process_invoices():
-    """Process uploaded invoice PDF files"""
+    """
+    Process uploaded invoice PDF files and ZIP archives of PDFs
+    
+    Files the client did not upload because /api/known-hashes reported them
+    as cached are listed in the 'cached' form field as JSON
+    [{"sha256": ..., "filename": ...}] and come from the parse cache. Cache
+    entries belong to the client (X-Client-Id header, else its address), so
+    send the same header as with /api/known-hashes.
+    
+    ?profile=1 (admin token required) returns a per-stage profile with the
+    report (see request_profiling).
+    """
     if request.method == 'OPTIONS':
         # Handle preflight request
         return '', 200
     
+    profile = request.args.get('profile') == '1'
+    if profile:
+        from admin_auth import is_admin_request, admin_denied
+        if not is_admin_request():
+            return admin_denied()
+    
+    profiler = None
     try:
-        if 'files' not in request.files:
+        files = request.files.getlist('files')
+        cached_files = json.loads(request.form.get('cached') or '[]')
+        if not files and not cached_files:
             return jsonify({
                 'success': False,
                 'message': 'No files uploaded'
             }), 400
         
-        files = request.files.getlist('files')
-        if not files:
-            return jsonify({
-                'success': False,
-                'message': 'No files selected'
-            }), 400
+        if profile:
+            # Starts tracemalloc; the finally below stops it whichever way the request ends
+            from request_profiling import RequestProfiler
+            profiler = RequestProfiler()
         
-        # Initialize report structure
-        report = {
-            'generated_at': datetime.now().isoformat(),
-            'total_files': len(files),
-            'summary': {
-                'by_platform': {},
-                'overall': {
-                    'total_amount': 0,
-                    'total_items': 0,
-                    'files_processed': 0
-                }
-            },
-            'files': {}
-        }
+        from invoice_processing import (
+            create_cached_entry, create_error_entry, create_report, add_file_to_report, finalize_report
+        )
+        from credit_matching import annotate_report_credits
+        from batch_scheduler import probe_pdf, predict_seconds
+        from cost_model import record_timings
+        from duplicate_index import BatchDuplicateChecker, new_batch_id
+        from line_item_store import store_report_items
+        from admission import client_key
+        from parse_cache import (
+            cache_scope, get_cached_entries, normalize_hashes, sha256_bytes, sha256_file, store_entry,
+            CLIENT_ID_HEADER
+        )
+        from pipeline import BatchPipeline
+        from worker_pool import get_invoice_pool
+        from zip_upload import is_zip_upload, iter_pdf_members, member_display_name, unique_display_name
         
-        # Process each file
-        for file in files:
-            if file.filename and file.filename.endswith('.pdf'):
-                print(f"Processing file: {file.filename}")
+        # Initialize report structure (total_files is known once archives are read)
+        report = create_report(len(files))
+        report['batch_id'] = new_batch_id()
+        update_context(job_id=report['batch_id'])
+        duplicates = BatchDuplicateChecker(report['batch_id'])
+        
+        temp_files = []
+        skipped = []
+        taken = set()
+        # Position of each file in the request: files the client listed as cached,
+        # then uploads and archive members as they are read
+        order = {}
+        
+        # Files the client skipped uploading, and uploads that turn out to be cached
+        cache_hits = []
+        hashes_by_filename = {}
+        client_cached = [(item.get('filename') or item.get('sha256'), item.get('sha256'))
+                         for item in cached_files if isinstance(item, dict)]
+        # Cache entries are read and written only for the client that uploaded them
+        scope = cache_scope(request.headers.get(CLIENT_ID_HEADER), client_key())
+        cached_entries = get_cached_entries(normalize_hashes(sha for _, sha in client_cached), scope)
+        for filename, sha256 in client_cached:
+            # Every file needs its own report key (report['files'], order, hashes)
+            filename = unique_display_name(filename, taken)
+            order.setdefault(filename, len(order))
+            sha256 = (sha256 or '').lower()
+            if sha256 in cached_entries:
+                cache_hits.append((filename, cached_entries[sha256]))
+                hashes_by_filename[filename] = sha256
+            else:
+                skipped.append((filename, {'type': 'CacheMiss',
+                                           'message': 'File is no longer cached, please upload it again'}))
+            taken.add(filename)
+        
+        def iter_uploads():
+            """Yield uploads to prepare; ZIP members are yielded as they are decompressed"""
+            for file in files:
+                if file.filename and file.filename.endswith('.pdf'):
+                    logger.debug("Processing file: %s", file.filename)
+                    filename = unique_display_name(file.filename, taken)
+                    taken.add(filename)
+                    order.setdefault(filename, len(order))
+                    yield {'filename': filename, 'upload': file}
+                
+                elif is_zip_upload(file.filename):
+                    logger.debug("Processing archive: %s", file.filename)
+                    try:
+                        for member_name, pdf_bytes, error in iter_pdf_members(file.stream):
+                            filename = member_display_name(member_name, taken, file.filename)
+                            taken.add(filename)
+                            order.setdefault(filename, len(order))
+                            if error:
+                                skipped.append((filename, error))
+                                continue
+                            yield {'filename': filename, 'source': pdf_bytes}
+                    except zipfile.BadZipFile as e:
+                        filename = unique_display_name(file.filename, taken)
+                        taken.add(filename)
+                        order.setdefault(filename, len(order))
+                        skipped.append((filename, {'type': 'BadZipFile', 'message': str(e)}))
+        
+        def prepare(item):
+            """I/O stage: spool, hash, serve from the cache when possible, else probe for the scheduler"""
+            filename = item['filename']
+            if 'upload' in item:
                 # Save temporary file
                 temp_dir = tempfile.gettempdir()
-                temp_filename = os.path.join(temp_dir, f"invoice_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}")
-                file.save(temp_filename)
-                print(f"Saved to temp file: {temp_filename}")
+                temp_filename = os.path.join(temp_dir, f"invoice_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}")
+                item['upload'].save(temp_filename)
+                logger.debug("Saved to temp file: %s", temp_filename)
+                temp_files.append(temp_filename)
                 
                 # Add a small delay to ensure file is fully written and handle is released
                 time.sleep(0.1)
+                pdf_source, sha256 = temp_filename, sha256_file(temp_filename)
+            else:
+                pdf_source, sha256 = item['source'], sha256_bytes(item['source'])
+            
+            context = {'filename': filename, 'sha256': sha256, 'source': pdf_source}
+            # Profiled requests parse every file
+            context['cached'] = get_cached_entries([sha256], scope).get(sha256) if profiler is None else None
+            if context['cached'] is not None:
+                return context, None, None
+            context['probe'] = probe_pdf(pdf_source)
+            args = (pdf_source, filename) if profiler is None else (pdf_source, filename, True)
+            return context, args, predict_seconds(filename, context['probe'])
+        
+        def persist(context, outcome):
+            """I/O stage: cache clean results, record parse times and queue shadow runs as each file returns"""
+            shadow = outcome['result'].pop('shadow', None) if outcome['status'] == 'ok' else None
+            if shadow is not None:
+                from shadow_mode import submit_shadow_run
+                submit_shadow_run(shadow['platform'], shadow['text'], context['filename'], context['source'],
+                                  shadow['records'], shadow['seconds'])
+            if profiler is not None:
+                profile = outcome['result'].pop('profile', None) if outcome['status'] == 'ok' else None
+                profiler.add_file(context['filename'], profile)
+            if outcome['status'] == 'ok':
+                store_entry(context['sha256'], context['filename'], outcome['result'], scope)
+            # Profiling overhead would skew the cost model
+            if profiler is None:
+                record_timings([(context['filename'], context['probe'], outcome)])
+        
+        if profiler is not None:
+            prepare = profiler.wrap('prepare', prepare)
+            persist = profiler.wrap('persist', persist)
+        
+        try:
+            # Uploads are spooled and hashed on I/O threads while earlier files parse,
+            # cheapest first (page count and size) so small files are not stuck behind
+            # large ones; outcomes come back in upload order.
+            # A file that hangs, crashes or exceeds memory comes back as a
+            # total-only fallback or an error entry; the batch always completes
+            staged = BatchPipeline(get_invoice_pool(), prepare, persist).run(iter_uploads())
+            
+            results = [(filename, {'status': 'ok', 'result': create_cached_entry(filename, entry)})
+                       for filename, entry in cache_hits]
+            for context, outcome in staged:
+                hashes_by_filename[context['filename']] = context.get('sha256')
+                if outcome is None:
+                    outcome = {'status': 'ok', 'result': create_cached_entry(context['filename'], context['cached'])}
+                results.append((context['filename'], outcome))
+            results += [(filename, {'status': 'error', 'result': error}) for filename, error in skipped]
+            results.sort(key=lambda pair: order.get(pair[0], len(order)))
+            report['total_files'] = len(results)
+            
+            for filename, outcome in results:
+                if outcome['status'] == 'ok':
+                    entry = outcome['result']
+                else:
+                    logger.warning("Error processing %s: %s", filename, outcome['result'].get('message'))
+                    entry = create_error_entry(filename, outcome['result'])
                 
-                try:
-                    # Extract text from PDF
-                    doc = fitz.open(temp_filename)
-                    text_content = ""
-                    for page in doc:
-                        text_content += page.get_text()
-                    doc.close()  # Important: close the document
-                    print(f"Extracted {len(text_content)} characters from PDF")
-                    
-                    # Determine platform and parse
-                    filename = file.filename
-                    platform = None
-                    records = []
-                    
-                    # Priority: Check filename pattern first
-                    if filename.startswith('5'):
-                        platform = 'Google'
-                        records = parse_google_invoice(text_content, temp_filename)
-                    elif filename.startswith('THTT'):
-                        platform = 'TikTok'
-                        records = parse_tiktok_invoice_detailed(text_content, filename)
-                    elif filename.startswith('24'):
-                        platform = 'Facebook'
-                        records = parse_facebook_invoice(text_content, filename)
-                    # Fallback to content checking
-                    elif "tiktok" in text_content.lower() and "facebook" not in text_content.lower():
-                        platform = 'TikTok'
-                        records = parse_tiktok_invoice_detailed(text_content, filename)
-                    elif "facebook" in text_content.lower() or "meta" in text_content.lower():
-                        platform = 'Facebook'
-                        records = parse_facebook_invoice(text_content, filename)
-                    elif "google" in text_content.lower():
-                        platform = 'Google'
-                        records = parse_google_invoice(text_content, temp_filename)
-                    else:
-                        platform = 'Unknown'
-                        records = []
-                    
-                    # Process records
-                    file_total = sum(record.get('amount', 0) for record in records)
-                    
-                    # Update platform summary
-                    if platform not in report['summary']['by_platform']:
-                        report['summary']['by_platform'][platform] = {
-                            'total_amount': 0,
-                            'total_items': 0,
-                            'files': 0,
-                            'average_items_per_file': 0
-                        }
-                    
-                    report['summary']['by_platform'][platform]['total_amount'] += file_total
-                    report['summary']['by_platform'][platform]['total_items'] += len(records)
-                    report['summary']['by_platform'][platform]['files'] += 1
-                    
-                    # Update overall summary
-                    report['summary']['overall']['total_amount'] += file_total
-                    report['summary']['overall']['total_items'] += len(records)
-                    report['summary']['overall']['files_processed'] += 1
-                    
-                    # Determine invoice type
-                    invoice_type = 'Unknown'
-                    if records:
-                        if any(r.get('agency') == 'pk' for r in records):
-                            invoice_type = 'AP'
-                        else:
-                            invoice_type = 'Non-AP'
-                    
-                    # Store file info
-                    report['files'][filename] = {
-                        'platform': platform,
-                        'invoice_type': invoice_type,
-                        'total_amount': file_total,
-                        'items_count': len(records),
-                        'items': records
-                    }
-                    
-                finally:
-                    # Clean up temporary file
-                    if os.path.exists(temp_filename):
-                        os.unlink(temp_filename)
+                duplicate = duplicates.check(filename, entry, hashes_by_filename.get(filename))
+                if duplicate:
+                    entry = {**entry, 'duplicate': duplicate}
+                add_file_to_report(report, filename, entry)
+                
+                if entry.get('reconciliation', {}).get('status') == 'mismatch':
+                    logger.info("Reconciliation mismatch for %s: items=%s printed=%s", filename,
+                                entry['reconciliation']['items_total'], entry['reconciliation']['printed_total'])
+            
+            duplicates.record()
+            
+            # Store line items and link credit lines to the charges they offset
+            line_ids = store_report_items(report)
+            annotate_report_credits(report, line_ids)
+        
+        finally:
+            # Clean up temporary files
+            for temp_filename in temp_files:
+                if os.path.exists(temp_filename):
+                    os.unlink(temp_filename)
         
         # Calculate averages
-        for platform_data in report['summary']['by_platform'].values():
-            if platform_data['files'] > 0:
-                platform_data['average_items_per_file'] = round(
-                    platform_data['total_items'] / platform_data['files'], 2
-                )
+        finalize_report(report)
         
-        return jsonify({
+        # Saved so the client can page through it with /api/reports/<batch_id>
+        from columnar import encode_report, wants_columnar
+        from report_store import store_report
+        store_report(report)
+        batch_id = report['batch_id']
+        
+        # ?response=summary skips files and items in the response
+        if request.args.get('response') == 'summary':
+            report = {key: value for key, value in report.items() if key != 'files'}
+        elif wants_columnar(request.args):
+            report = encode_report(report)
+        
+        response = {
             'success': True,
             'message': f'Successfully processed {report["summary"]["overall"]["files_processed"]} files',
             'data': report
-        })
+        }
+        if profiler is not None:
+            from request_profiling import save_profile
+            response['profile'] = profiler.finish()
+            save_profile(batch_id, response['profile'])
+        return jsonify(response)
         
     except Exception as e:
         error_details = {
@@ -284,72 +608,92 @@ def process_invoices():
             'type': type(e).__name__,
             'traceback': traceback.format_exc()
         }
-        print(f"Error processing invoices: {error_details}")
+        logger.exception("Error processing invoices")
+        if profiler is not None:
+            # Also stops tracing
+            error_details['profile'] = profiler.finish()
         return jsonify({
             'success': False,
             'message': f'Error processing invoices: {str(e)}',
             'details': error_details
         }), 500
+    finally:
+        if profiler is not None:
+            profiler.finish()
 
 @api.route('/export-csv', methods=['POST'])
 def export_csv():
-    """Export invoice report to CSV"""
+    """Export invoice report to CSV: the report posted as JSON, or {"batch_id": ...} of a stored one"""
     try:
-        report = request.json
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        writer.writerow([
-            'filename',
-            'platform',
-            'invoice_type',
-            'invoice_number',
-            'line_number',
-            'description',
-            'amount',
-            'agency',
-            'project_id',
-            'project_name',
-            'campaign_id',
-            'objective',
-            'period'
-        ])
-        
-        # Write data
-        for filename, file_data in report['files'].items():
-            for item in file_data['items']:
-                writer.writerow([
-                    filename,
-                    item.get('platform', ''),
-                    item.get('invoice_type', ''),
-                    item.get('invoice_number', ''),
-                    item.get('line_number', ''),
-                    item.get('description', ''),
-                    item.get('amount', 0),
-                    item.get('agency', ''),
-                    item.get('project_id', ''),
-                    item.get('project_name', ''),
-                    item.get('campaign_id', ''),
-                    item.get('objective', ''),
-                    item.get('period', '')
-                ])
-        
-        # Convert to bytes with UTF-8 BOM for Excel
-        output.seek(0)
-        csv_bytes = '\ufeff' + output.getvalue()  # Add BOM for Excel
-        
-        return send_file(
-            io.BytesIO(csv_bytes.encode('utf-8')),
+        # Read up front: errors inside the generator would surface after the 200 went out
+        batch_id = request.json.get('batch_id')
+        if batch_id:
+            from report_store import get_report_hash, iter_report_files
+            if get_report_hash(batch_id) is None:
+                return jsonify({
+                    'success': False,
+                    'message': f'Report {batch_id} not found'
+                }), 404
+            files = iter_report_files(batch_id)
+        else:
+            files = request.json['files'].items()
+        
+        def generate():
+            # One reusable buffer: each row is written, taken and cleared
+            output = io.StringIO()
+            writer = csv.writer(output)
+            
+            # BOM for Excel, then headers
+            output.write('\ufeff')
+            writer.writerow([
+                'filename',
+                'platform',
+                'invoice_type',
+                'invoice_number',
+                'line_number',
+                'description',
+                'amount',
+                'agency',
+                'project_id',
+                'project_name',
+                'campaign_id',
+                'objective',
+                'period'
+            ])
+            
+            for filename, file_data in files:
+                for item in file_data['items']:
+                    writer.writerow([
+                        filename,
+                        item.get('platform', ''),
+                        item.get('invoice_type', ''),
+                        item.get('invoice_number', ''),
+                        item.get('line_number', ''),
+                        item.get('description', ''),
+                        item.get('amount', 0),
+                        item.get('agency', ''),
+                        item.get('project_id', ''),
+                        item.get('project_name', ''),
+                        item.get('campaign_id', ''),
+                        item.get('objective', ''),
+                        item.get('period', '')
+                    ])
+                    if output.tell() >= 64 * 1024:
+                        yield output.getvalue().encode('utf-8')
+                        output.seek(0)
+                        output.truncate()
+            yield output.getvalue().encode('utf-8')
+        
+        # Streamed so large reports are never held as one CSV string (gzipped per chunk)
+        download_name = f'invoice_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return Response(
+            generate(),
             mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'invoice_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+            headers={'Content-Disposition': f'attachment; filename={download_name}'}
         )
         
     except Exception as e:
-        print(f"Error exporting CSV: {str(e)}")
+        logger.exception("Error exporting CSV")
         return jsonify({
             'success': False,
             'message': f'Error exporting CSV: {str(e)}'
@@ -2,14 +2,13 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 import re
-import fitz  # PyMuPDF
 from api_routes import api
 
 app = Flask(__name__)
 # More permissive CORS for debugging
 CORS(app, 
      resources={r"/api/*": {"origins": "*"}},
-     allow_headers=["Content-Type"],
+     allow_headers=["Content-Type", "X-Client-Id"],
      methods=["GET", "POST", "OPTIONS"])
 
 # Register API blueprint
@@ -80,6 +79,8 @@ def upload_file():
         file.save(file_path)
         
         try:
+            import fitz  # PyMuPDF - loaded on first upload, not at import
+            
             # Extract text from PDF
             with fitz.open(file_path) as doc:
                 text_content = ""
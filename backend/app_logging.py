@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Logging for the API, the parsing workers and the parsers
+A log call only puts the record on an in-memory queue (QueueHandler); one
+listener thread per process formats and writes it, so a slow stdout under
+gunicorn never stalls a request or a parse. Records below a logger's level
+are dropped before any formatting, which is how the parsers' debug events
+cost nothing in production.
+
+Every record carries the context it was logged in:
+
+    request_id   X-Request-ID of the API request (generated when absent),
+                 echoed in the response and carried to the parsing workers
+    job_id       batch id of the processing request
+    file         file being parsed (worker side)
+
+Debug events of the parsers are sampled per file: with DEBUG enabled for a
+parser, all of a sampled file's debug lines are logged and none of the others.
+
+Configuration (environment):
+    LOG_LEVEL         root level (default INFO)
+    LOG_LEVELS        per-logger levels, e.g. "final_improved_tiktok_parser_v2=DEBUG,pipeline=WARNING"
+    LOG_FORMAT        text or json (default text)
+    LOG_SAMPLE_RATE   fraction of files whose debug events are logged (default 0.01)
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0.01'))
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Client-supplied ids end up in log lines: no separators or newlines
+REQUEST_ID_PATTERN = re.compile(r'^[\w.:-]{1,64}$')
+
+_context: contextvars.ContextVar = contextvars.ContextVar('log_context', default={})
+_debug_sampled: contextvars.ContextVar = contextvars.ContextVar('log_debug_sampled', default=True)
+
+_configured_pid: Optional[int] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def log_context() -> Dict[str, str]:
+    """Fields bound in the current context (to carry them to another process)"""
+    return _context.get()
+
+
+def update_context(**fields) -> None:
+    """Add fields for the rest of the current context (e.g. the rest of the request)"""
+    _context.set({**_context.get(), **fields})
+
+
+@contextmanager
+def bind_context(**fields):
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextmanager
+def file_context(filename: str, **fields):
+    """Bind the file being parsed; decides whether its debug events are logged"""
+    sampled = _debug_sampled.set(random.random() < LOG_SAMPLE_RATE)
+    try:
+        with bind_context(**fields, file=filename):
+            yield
+    finally:
+        _debug_sampled.reset(sampled)
+
+
+class ContextFilter(logging.Filter):
+    """Runs in the thread that logs: attaches the context, drops unsampled debug events"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and not _debug_sampled.get():
+            return False
+        record.context = _context.get()
+        return True
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Message and traceback rendered to text now; formatting is left to the listener"""
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, 'context', None) or {}
+        fields = ' '.join(f"{key}={value}" for key, value in context.items() if value is not None)
+        line = (f"{datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')} "
+                f"{record.levelname} {record.name} [{fields}] {record.getMessage()}")
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'message': record.getMessage(),
+            **(getattr(record, 'context', None) or {})
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_levels(value: str) -> Dict[str, str]:
+    """"name=LEVEL,name=LEVEL" -> {name: LEVEL}; malformed entries are ignored"""
+    levels = {}
+    for entry in value.split(','):
+        name, _, level = entry.partition('=')
+        if name.strip() and level.strip().upper() in logging.getLevelNamesMapping():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> None:
+    """Queue handler on the root logger and its writer thread - once per process"""
+    global _configured_pid, _listener
+    if _configured_pid == os.getpid():
+        return
+    _configured_pid = os.getpid()
+
+    records = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+    # A forked child inherits the parent's listener object but not its thread
+    _listener = logging.handlers.QueueListener(records, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    handler = ContextQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL if LOG_LEVEL in logging.getLevelNamesMapping() else 'INFO')
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def install_request_ids(blueprint) -> None:
+    """Bind a request id for every request of the blueprint and echo it in the response"""
+    from flask import g, request
+
+    @blueprint.before_request
+    def bind_request_id():
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        g.log_context_token = _context.set({'request_id': request_id})
+
+    @blueprint.after_request
+    def add_request_id(response):
+        request_id = _context.get().get('request_id')
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @blueprint.teardown_request
+    def unbind_request_id(exc):
+        token = g.pop('log_context_token', None)
+        if token is not None:
+            _context.reset(token)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Per-file cost estimates for scheduling and admission
+Before a file is queued its raw bytes are scanned, without MuPDF, for the
+page count (leaf /Type /Page dictionaries) and the object count (/Size of
+the last trailer or cross-reference stream). Pages kept in compressed object
+streams are not visible to the scan; such files are estimated from byte size.
+The estimate orders work inside a batch shortest first (see
+pipeline.BatchPipeline and worker_pool.SupervisedPool.submit); admission.py uses the same estimate
+from byte size alone, before the files are opened.
+
+Estimates come from the fitted cost model (cost_model.py) once one has been
+saved, and from the fixed per-file and per-page costs below until then.
+
+Configuration (environment):
+    INVOICE_SCHEDULER_LOOKAHEAD   files of a batch queued ahead and ordered by cost (default 32)
+"""
+
+import math
+import mmap
+import os
+import re
+from typing import Dict, Any, Optional
+
+from cost_model import get_cost_model, guess_platform
+
+SCHEDULER_LOOKAHEAD = int(os.environ.get('INVOICE_SCHEDULER_LOOKAHEAD', '32'))
+
+# Rough per-file costs; invoices average a few pages
+FILE_SECONDS = 0.3
+PAGE_SECONDS = 0.15
+BYTES_PER_PAGE = 60 * 1024
+
+PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+SIZE_PATTERN = re.compile(rb'/Size\s+(\d+)')
+# The last trailer or cross-reference stream dictionary sits near the end of the file
+TRAILER_SCAN_BYTES = 64 * 1024
+
+
+def estimate_seconds(size_bytes: int, pages: Optional[int] = None) -> float:
+    """Estimated worker-seconds to parse one PDF; pages are guessed from size when unknown"""
+    if pages is None:
+        pages = max(1, math.ceil(size_bytes / BYTES_PER_PAGE))
+    return FILE_SECONDS + pages * PAGE_SECONDS
+
+
+def scan_pdf(data) -> Dict[str, Optional[int]]:
+    """Page and object counts from the raw bytes (bytes, view or mmap); None where not found"""
+    pages = sum(1 for _ in PAGE_PATTERN.finditer(data))
+    sizes = SIZE_PATTERN.findall(data, max(0, len(data) - TRAILER_SCAN_BYTES))
+    return {'pages': pages or None, 'objects': int(sizes[-1]) if sizes else None}
+
+
+def probe_pdf(pdf_source) -> Dict[str, Any]:
+    """Byte size, page count and object count of a PDF (path, bytes or a view), without opening it in MuPDF"""
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        size = len(pdf_source)
+    else:
+        size = os.path.getsize(pdf_source)
+
+    probe = {'bytes': size, 'pages': None, 'objects': None}
+    try:
+        if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+            probe.update(scan_pdf(pdf_source))
+        elif size:
+            with open(pdf_source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                probe.update(scan_pdf(data))
+    except (OSError, ValueError):
+        pass  # unreadable files are estimated from size; the worker reports the error
+    return probe
+
+
+def predict_seconds(filename: str, probe: Dict[str, Any]) -> float:
+    """Estimated seconds for an opened (probed) file"""
+    model = get_cost_model()
+    if model is None:
+        return estimate_seconds(probe['bytes'], probe['pages'])
+    return model.predict(guess_platform(filename), probe)
+
+
+def predict_upload_seconds(filename: str, size_bytes: int) -> float:
+    """Estimated seconds for a file known only by name and size (admission)"""
+    model = get_cost_model()
+    if model is None:
+        return estimate_seconds(size_bytes)
+    return model.predict_size(guess_platform(filename), size_bytes)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python batch_scheduler.py <file.pdf> [...]")
+        sys.exit(1)
+
+    probes = [(path, probe_pdf(path)) for path in sys.argv[1:]]
+    probes.sort(key=lambda pair: predict_seconds(os.path.basename(pair[0]), pair[1]))
+    for path, probe in probes:
+        print(f"{predict_seconds(os.path.basename(path), probe):6.2f} s  {probe['pages']} pages  "
+              f"{probe['bytes']:>10,} bytes  {probe['objects']} objects  {os.path.basename(path)}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark
+Each scenario runs in a fresh interpreter (no warm module cache) and is
+repeated; the median wall time is reported.
+
+    lazy_import     import the Flask app - fitz and parsers not loaded
+    eager_import    import the app plus fitz and every serving parser up front
+    warm_up         import the app, then startup.warm_up() (what preload does)
+    first_health    import the app and serve the first /api/health request
+    first_parse     import the app and parse the first PDF (pass a PDF path)
+
+Usage:
+    python bench_startup.py [runs] [sample.pdf]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = {
+    'lazy_import': 'import app',
+    'eager_import': (
+        'import fitz, app\n'
+        'from parser_registry import SERVING_PARSERS, get_parser\n'
+        'for platform in SERVING_PARSERS: get_parser(platform)'
+    ),
+    'warm_up': 'import app\nfrom startup import warm_up\nwarm_up()',
+    'first_health': (
+        'import app\n'
+        'assert app.app.test_client().get("/api/health").status_code == 200'
+    ),
+}
+
+FIRST_PARSE = (
+    'import app, os\n'
+    'from invoice_processing import process_invoice_file\n'
+    'process_invoice_file({path!r}, os.path.basename({path!r}))'
+)
+
+TIMER = (
+    'import time\n'
+    'start = time.perf_counter()\n'
+    '{body}\n'
+    'print(time.perf_counter() - start)'
+)
+
+
+def time_scenario(body: str, runs: int) -> List[float]:
+    """Run one scenario in fresh interpreters and return the timings in seconds"""
+    timings = []
+    env = {**os.environ, 'INVOICE_WORKERS': '0'}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', TIMER.format(body=body)],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def run_benchmark(runs: int = 5, sample_pdf: str = None) -> Dict[str, Dict[str, float]]:
+    """Median/min/max per scenario"""
+    scenarios = dict(SCENARIOS)
+    if sample_pdf:
+        scenarios['first_parse'] = FIRST_PARSE.format(path=os.path.abspath(sample_pdf))
+
+    results = {}
+    for name, body in scenarios.items():
+        try:
+            timings = time_scenario(body, runs)
+        except RuntimeError as e:
+            print(f"{name}: failed - {e}")
+            continue
+        results[name] = {
+            'median': statistics.median(timings),
+            'min': min(timings),
+            'max': max(timings)
+        }
+    return results
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    sample_pdf = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print(f"STARTUP BENCHMARK ({runs} runs per scenario)")
+    print("=" * 60)
+    for name, stats in run_benchmark(runs, sample_pdf).items():
+        print(f"{name:15s} median {stats['median'] * 1000:8.1f} ms   "
+              f"min {stats['min'] * 1000:8.1f} ms   max {stats['max'] * 1000:8.1f} ms")
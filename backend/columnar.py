@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Columnar compact JSON format (opt-in with ?format=columnar)
+Row-oriented items repeat every key name and the base fields (platform,
+filename, invoice number) on each line. In columnar form each file's items
+become one object:
+
+    {
+      "count": 42,
+      "fields": ["line_number", "amount", "description", ...],
+      "constants": {"platform": "Google", "invoice_number": "5297692778", ...},
+      "columns": {"line_number": [1, 2, ...], "amount": [...], ...},
+      "dictionaries": {"project_name": ["centro-onnut", "the-base"]}
+    }
+
+Fields with one value on every item go to constants. String fields with many
+repeats are dictionary-encoded: the column holds indexes into the dictionary.
+Everything else is a plain array. src/utils/columnar.ts rebuilds rows lazily.
+"""
+
+from typing import Dict, List, Any
+
+FORMAT_NAME = 'columnar-v1'
+
+# Dictionary-encode a string column when distinct values are at most this share of rows
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def encode_items(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Row items -> column arrays with constants and dictionary encoding"""
+    key_orders = set(map(tuple, items))
+    if len(key_orders) == 1:
+        # Usual case: every item built by the same parser code, same keys in the same order
+        fields = list(next(iter(key_orders)))
+        value_columns = [list(column) for column in zip(*map(dict.values, items))]
+    else:
+        fields = list(dict.fromkeys(field for item in items for field in item))
+        value_columns = [[item.get(field) for item in items] for field in fields]
+
+    constants = {}
+    columns = {}
+    dictionaries = {}
+
+    for field, values in zip(fields, value_columns):
+        try:
+            distinct = set(values)
+        except TypeError:  # nested values (e.g. matched_charge) stay a plain column
+            columns[field] = values
+            continue
+
+        if len(distinct) == 1:
+            constants[field] = values[0]
+        elif (len(distinct) <= len(values) * DICTIONARY_MAX_RATIO
+              and all(value is None or isinstance(value, str) for value in distinct)):
+            dictionary = sorted(distinct, key=lambda value: (value is not None, value or ''))
+            codes = {value: index for index, value in enumerate(dictionary)}
+            dictionaries[field] = dictionary
+            columns[field] = list(map(codes.__getitem__, values))
+        else:
+            columns[field] = values
+
+    return {
+        'count': len(items),
+        'fields': fields,
+        'constants': constants,
+        'columns': columns,
+        'dictionaries': dictionaries
+    }
+
+
+def decode_items(encoded: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Columnar items -> row items (Python counterpart of src/utils/columnar.ts)"""
+    rows = []
+    for index in range(encoded['count']):
+        row = {}
+        for field in encoded['fields']:
+            if field in encoded['constants']:
+                row[field] = encoded['constants'][field]
+            elif field in encoded['dictionaries']:
+                row[field] = encoded['dictionaries'][field][encoded['columns'][field][index]]
+            else:
+                row[field] = encoded['columns'][field][index]
+        rows.append(row)
+    return rows
+
+
+def encode_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a report with each file's items in columnar form"""
+    files = {}
+    for filename, entry in report.get('files', {}).items():
+        files[filename] = {
+            **{key: value for key, value in entry.items() if key != 'items'},
+            'items': encode_items(entry.get('items', []))
+        }
+    return {**report, 'format': FORMAT_NAME, 'files': files}
+
+
+def wants_columnar(args) -> bool:
+    """Opt-in through the query string"""
+    return args.get('format') == 'columnar'
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python columnar.py <report.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        sample = json.load(f)
+    sample = sample.get('data', sample)
+
+    for entry in sample.get('files', {}).values():
+        assert decode_items(encode_items(entry.get('items', []))) == entry.get('items', [])
+
+    for name, encode in [('rows', lambda r: r), ('columnar', encode_report)]:
+        start = time.perf_counter()
+        payload = json.dumps(encode(sample), ensure_ascii=False, separators=(',', ':'))
+        seconds = time.perf_counter() - start
+        print(f"{name:10s} {len(payload.encode('utf-8')):>12,} bytes  {seconds * 1000:8.1f} ms")
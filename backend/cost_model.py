@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Per-file parse time model
+Predicts how long a file takes to parse from what is known before it is
+handed to a parsing worker: platform guessed from the filename, and the page
+count, byte size and object count from batch_scheduler.probe_pdf. Timings of parsed files are
+collected in the file_timings table; the model is a least-squares fit over
+them, refit offline:
+
+    python cost_model.py fit       fit on collected timings and save the model
+    python cost_model.py report    prediction error of the saved model
+
+Two fits are kept: the full one for the batch scheduler, and one on platform
+and size only for admission control, which estimates uploads before opening
+them. Predictions need no numpy; only fitting does. Without a saved model
+the fixed defaults in batch_scheduler are used.
+
+Configuration (environment):
+    COST_MODEL_PATH     model file (default <INVOICE_DATA_DIR>/cost_model.json)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from invoice_store import DATA_DIR, get_connection
+
+logger = logging.getLogger(__name__)
+
+COST_MODEL_PATH = os.environ.get('COST_MODEL_PATH', os.path.join(DATA_DIR, 'cost_model.json'))
+
+PLATFORMS = ['Google', 'Facebook', 'TikTok', 'Unknown']
+FULL_FEATURES = ['pages', 'megabytes', 'kilo_objects']
+SIZE_FEATURES = ['megabytes']
+
+# Predictions never go below this, whatever the fit says
+MIN_SECONDS = 0.05
+MIN_SAMPLES = 20
+
+
+def guess_platform(filename: str) -> str:
+    """Platform from the filename only, as detect_platform does before reading text"""
+    from invoice_processing import detect_platform
+    return detect_platform(filename or '', '')
+
+
+def feature_values(probe: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        'pages': probe.get('pages') or 0,
+        'megabytes': (probe.get('bytes') or 0) / (1024 * 1024),
+        'kilo_objects': (probe.get('objects') or 0) / 1000
+    }
+
+
+def design_row(platform: str, probe: Dict[str, Any], features: List[str]) -> List[float]:
+    """One-hot platform intercepts followed by the numeric features"""
+    values = feature_values(probe)
+    platform = platform if platform in PLATFORMS else 'Unknown'
+    return [1.0 if platform == name else 0.0 for name in PLATFORMS] + [values[name] for name in features]
+
+
+class CostModel:
+    """Linear model: per-platform intercept plus weighted features"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.full = data['full']['coefficients']
+        self.size_only = data['size_only']['coefficients']
+
+    def predict(self, platform: str, probe: Dict[str, Any]) -> float:
+        """Seconds for an opened file; falls back to the size-only fit when pages are unknown"""
+        if probe.get('pages') is None:
+            return self.predict_size(platform, probe.get('bytes') or 0)
+        row = design_row(platform, probe, FULL_FEATURES)
+        return max(MIN_SECONDS, sum(weight * value for weight, value in zip(self.full, row)))
+
+    def predict_size(self, platform: str, size_bytes: int) -> float:
+        """Seconds from platform and size only"""
+        row = design_row(platform, {'bytes': size_bytes}, SIZE_FEATURES)
+        return max(MIN_SECONDS, sum(weight * value for weight, value in zip(self.size_only, row)))
+
+
+_model: Optional[CostModel] = None
+_model_mtime: Optional[float] = None
+_model_lock = threading.Lock()
+
+
+def get_cost_model() -> Optional[CostModel]:
+    """Saved model, reloaded when the file changes; None until one has been fitted"""
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(COST_MODEL_PATH)
+    except OSError:
+        return None
+    with _model_lock:
+        if mtime != _model_mtime:
+            try:
+                with open(COST_MODEL_PATH, encoding='utf-8') as f:
+                    _model = CostModel(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Could not load cost model %s: %s", COST_MODEL_PATH, e)
+                _model = None
+            _model_mtime = mtime
+        return _model
+
+
+def record_timings(timings: Iterable[Tuple[str, Dict[str, Any], Dict[str, Any]]]) -> int:
+    """Store (filename, probe, outcome) for files parsed cleanly - returns rows stored"""
+    rows = []
+    now = time.time()
+    for filename, probe, outcome in timings:
+        # Total-only fallbacks carry the failed run's error; their time is not a parse time
+        if outcome['status'] != 'ok' or 'error' in outcome['result'] or probe.get('pages') is None:
+            continue
+        rows.append((filename, guess_platform(filename), outcome['result'].get('platform'),
+                     probe['pages'], probe['bytes'], probe['objects'], outcome['seconds'], now))
+    if rows:
+        conn = get_connection()
+        conn.executemany(
+            '''INSERT INTO file_timings (filename, platform_guess, platform, pages, bytes, objects,
+                                         seconds, recorded_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            rows
+        )
+        conn.commit()
+    return len(rows)
+
+
+def load_samples() -> List[Dict[str, Any]]:
+    rows = get_connection().execute(
+        'SELECT platform_guess, pages, bytes, objects, seconds FROM file_timings ORDER BY id'
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _fit(samples: List[Dict[str, Any]], features: List[str]) -> List[float]:
+    import numpy as np
+
+    matrix = np.array([design_row(sample['platform_guess'], sample, features) for sample in samples])
+    target = np.array([sample['seconds'] for sample in samples])
+    coefficients, *_ = np.linalg.lstsq(matrix, target, rcond=None)
+    return [float(value) for value in coefficients]
+
+
+def error_stats(pairs: List[Tuple[float, float]]) -> Dict[str, Any]:
+    """MAE, median / p90 absolute error and MAPE over (predicted, actual) pairs"""
+    if not pairs:
+        return {'samples': 0}
+    errors = sorted(abs(predicted - actual) for predicted, actual in pairs)
+    relative = [abs(predicted - actual) / actual for predicted, actual in pairs if actual > 0]
+    return {
+        'samples': len(pairs),
+        'mae_seconds': round(sum(errors) / len(errors), 4),
+        'p50_abs_error': round(errors[len(errors) // 2], 4),
+        'p90_abs_error': round(errors[min(len(errors) - 1, int(len(errors) * 0.9))], 4),
+        'mape': round(sum(relative) / len(relative), 4) if relative else None
+    }
+
+
+def evaluate(model: CostModel, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Prediction error overall and per platform, for both fits"""
+    full = [(model.predict(s['platform_guess'], s), s['seconds']) for s in samples]
+    size_only = [(model.predict_size(s['platform_guess'], s['bytes']), s['seconds']) for s in samples]
+    by_platform = {}
+    for platform in PLATFORMS:
+        pairs = [pair for pair, s in zip(full, samples) if s['platform_guess'] == platform]
+        if pairs:
+            by_platform[platform] = error_stats(pairs)
+    return {'full': error_stats(full), 'size_only': error_stats(size_only), 'by_platform': by_platform}
+
+
+def fit_model(samples: List[Dict[str, Any]], holdout_every: int = 5) -> Dict[str, Any]:
+    """
+    Fit both models; error is measured on every holdout_every-th sample left
+    out of a first fit, then the saved coefficients are fitted on all samples
+    """
+    if len(samples) < MIN_SAMPLES:
+        raise ValueError(f"Need at least {MIN_SAMPLES} timed files to fit, have {len(samples)}")
+
+    train = [s for index, s in enumerate(samples) if index % holdout_every]
+    test = [s for index, s in enumerate(samples) if not index % holdout_every]
+    holdout_model = CostModel({
+        'full': {'coefficients': _fit(train, FULL_FEATURES)},
+        'size_only': {'coefficients': _fit(train, SIZE_FEATURES)}
+    })
+
+    return {
+        'fitted_at': datetime.now().isoformat(),
+        'samples': len(samples),
+        'platforms': PLATFORMS,
+        'full': {'features': FULL_FEATURES, 'coefficients': _fit(samples, FULL_FEATURES)},
+        'size_only': {'features': SIZE_FEATURES, 'coefficients': _fit(samples, SIZE_FEATURES)},
+        'holdout_error': evaluate(holdout_model, test)
+    }
+
+
+def save_model(data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(COST_MODEL_PATH) or '.', exist_ok=True)
+    temp_path = f"{COST_MODEL_PATH}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_path, COST_MODEL_PATH)
+
+
+def print_error_report(title: str, report: Dict[str, Any]) -> None:
+    print(title)
+    print("=" * 80)
+    for name in ('full', 'size_only'):
+        stats = report[name]
+        if not stats['samples']:
+            print(f"  {name:10s} no samples")
+            continue
+        print(f"  {name:10s} n={stats['samples']:<6d} MAE {stats['mae_seconds']:.3f} s  "
+              f"p50 {stats['p50_abs_error']:.3f} s  p90 {stats['p90_abs_error']:.3f} s  MAPE {stats['mape']}")
+    for platform, stats in report['by_platform'].items():
+        print(f"  {platform:10s} n={stats['samples']:<6d} MAE {stats['mae_seconds']:.3f} s  "
+              f"p90 {stats['p90_abs_error']:.3f} s  MAPE {stats['mape']}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'report'
+    samples = load_samples()
+
+    if command == 'fit':
+        try:
+            fitted = fit_model(samples)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        save_model(fitted)
+        print(f"Fitted on {fitted['samples']} files -> {COST_MODEL_PATH}")
+        names = PLATFORMS + FULL_FEATURES
+        print("  " + "  ".join(f"{name}={value:.4f}"
+                               for name, value in zip(names, fitted['full']['coefficients'])))
+        print_error_report("HOLDOUT PREDICTION ERROR", fitted['holdout_error'])
+
+    elif command == 'report':
+        model = get_cost_model()
+        if model is None:
+            print(f"No model at {COST_MODEL_PATH}; run: python cost_model.py fit")
+            sys.exit(1)
+        print(f"Model fitted {model.data['fitted_at']} on {model.data['samples']} files")
+        print_error_report(f"PREDICTION ERROR ON {len(samples)} COLLECTED FILES", evaluate(model, samples))
+
+    else:
+        print("Usage: python cost_model.py [fit|report]")
+        sys.exit(1)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Credit-note to original-line matching
+Facebook coupons (goodwill/bugs) and Google credit adjustments often come out
+as standalone negative lines with project_id 'Unknown'. This index links each
+credit to the charge it offsets, across invoices, using hash lookups on the
+stored line items:
+
+    1. campaign_id (the credit's own, or campaign ids found in its description)
+    2. (project_id, period)
+    3. project_id
+
+Among the charges under the first key that matches, the one from the same
+invoice wins, else the most recent one. A credit with no charge yet waits
+under its keys and is linked when a matching charge is stored later.
+
+Net spend per project is kept up to date as lines and links are added, so
+the report is a dictionary read rather than a scan.
+"""
+
+import re
+import threading
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from line_item_store import iter_line_items
+
+# Campaign ids as printed at the end of pk| patterns, e.g. 2089P22, 1359G01
+CAMPAIGN_TOKEN_PATTERN = re.compile(r'\b(\d{4}[A-Z]\d{2})\b')
+
+UNASSIGNED = 'Unassigned'
+
+KEY_CAMPAIGN = 'campaign_id'
+KEY_PROJECT_PERIOD = 'project_period'
+KEY_PROJECT = 'project_id'
+
+
+def known(value: Optional[str]) -> bool:
+    return bool(value) and value not in ('Unknown', 'None')
+
+
+def match_keys(line: Dict[str, Any]) -> List[Tuple]:
+    """Lookup keys for a line, most specific first"""
+    platform = line.get('platform')
+    keys = []
+
+    campaign_ids = []
+    if known(line.get('campaign_id')):
+        campaign_ids.append(line['campaign_id'])
+    # Credits without a parsed pk pattern often still carry the campaign id in the text
+    campaign_ids += CAMPAIGN_TOKEN_PATTERN.findall(line.get('description') or '')
+    for campaign_id in dict.fromkeys(campaign_ids):
+        keys.append((KEY_CAMPAIGN, platform, campaign_id))
+
+    if known(line.get('project_id')):
+        if known(line.get('period')):
+            keys.append((KEY_PROJECT_PERIOD, platform, line['project_id'], line['period']))
+        keys.append((KEY_PROJECT, platform, line['project_id']))
+
+    return keys
+
+
+def project_of(line: Dict[str, Any]) -> Optional[str]:
+    return line['project_id'] if known(line.get('project_id')) else None
+
+
+class CreditIndex:
+    """In-memory matching index over the line_items table"""
+
+    def __init__(self):
+        self.lines: Dict[int, Dict[str, Any]] = {}
+        self.charges: Dict[Tuple, List[int]] = {}
+        self.waiting: Dict[Tuple, Set[int]] = {}
+        self.links: Dict[int, Tuple[int, str]] = {}
+        self.credit_ids: List[int] = []
+        self.net_spend: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Index lines stored since the last refresh (by this or another worker)"""
+        with self.lock:
+            for line in iter_line_items(self.last_id):
+                self._add(line)
+                self.last_id = line['id']
+
+    def _add(self, line: Dict[str, Any]) -> None:
+        line_id = line['id']
+        self.lines[line_id] = {
+            'platform': line['platform'],
+            'filename': line['filename'],
+            'invoice_number': line['invoice_number'],
+            'line_number': line['line_number'],
+            'amount_satang': line['amount_satang'],
+            'project_id': line['project_id'],
+            'project_name': line['project_name'],
+            'period': line['period'],
+            'campaign_id': line['campaign_id']
+        }
+        keys = match_keys(line)
+
+        if line['amount_satang'] >= 0:
+            self._spend(line['platform'], project_of(line), 'charges', line['amount_satang'],
+                        line['project_name'])
+            for key in keys:
+                self.charges.setdefault(key, []).append(line_id)
+                # Credits stored before their charge are linked now
+                for credit_id in sorted(self.waiting.pop(key, ())):
+                    if credit_id not in self.links:
+                        self._link(credit_id, line_id, key[0])
+            return
+
+        self.credit_ids.append(line_id)
+        charge_id, matched_by = self._find_charge(line, keys)
+        if charge_id is not None:
+            self._link(line_id, charge_id, matched_by, counted=False)
+        else:
+            self._spend(line['platform'], project_of(line), 'credits', line['amount_satang'])
+            for key in keys:
+                self.waiting.setdefault(key, set()).add(line_id)
+
+    def _find_charge(self, credit: Dict[str, Any], keys: List[Tuple]) -> Tuple[Optional[int], Optional[str]]:
+        for key in keys:
+            candidates = self.charges.get(key)
+            if not candidates:
+                continue
+            for charge_id in reversed(candidates):
+                if self.lines[charge_id]['invoice_number'] == credit['invoice_number']:
+                    return charge_id, key[0]
+            return candidates[-1], key[0]
+        return None, None
+
+    def _link(self, credit_id: int, charge_id: int, matched_by: str, counted: bool = True) -> None:
+        """Link a credit to its charge and move its amount to the charge's project if it had none"""
+        credit = self.lines[credit_id]
+        charge = self.lines[charge_id]
+        self.links[credit_id] = (charge_id, matched_by)
+
+        if project_of(credit) is None:
+            if counted:
+                self._spend(credit['platform'], None, 'credits', -credit['amount_satang'])
+            self._spend(charge['platform'], project_of(charge), 'credits', credit['amount_satang'],
+                        charge['project_name'])
+        elif not counted:
+            self._spend(credit['platform'], project_of(credit), 'credits', credit['amount_satang'])
+
+    def _spend(self, platform: str, project_id: Optional[str], field: str, amount_satang: int,
+               project_name: Optional[str] = None) -> None:
+        key = (platform, project_id or UNASSIGNED)
+        totals = self.net_spend.setdefault(key, {'charges': 0, 'credits': 0, 'project_name': None})
+        totals[field] += amount_satang
+        if project_id and known(project_name) and totals['project_name'] is None:
+            totals['project_name'] = project_name
+
+    def match_for(self, credit_id: int) -> Optional[Dict[str, Any]]:
+        """The charge a credit line is linked to, or None"""
+        link = self.links.get(credit_id)
+        if link is None:
+            return None
+        charge_id, matched_by = link
+        charge = self.lines[charge_id]
+        return {
+            'line_id': charge_id,
+            'matched_by': matched_by,
+            'filename': charge['filename'],
+            'invoice_number': charge['invoice_number'],
+            'line_number': charge['line_number'],
+            'project_id': charge['project_id'],
+            'project_name': charge['project_name'],
+            'period': charge['period'],
+            'campaign_id': charge['campaign_id']
+        }
+
+    def credits(self, unmatched_only: bool = False) -> List[Dict[str, Any]]:
+        """All credit lines with their link"""
+        result = []
+        for line_id in self.credit_ids:
+            line = self.lines[line_id]
+            match = self.match_for(line_id)
+            if unmatched_only and match:
+                continue
+            result.append({'line_id': line_id, **line, 'amount': line['amount_satang'] / 100,
+                           'matched_charge': match})
+        return result
+
+    def project_net_spend(self, platform: str = None) -> List[Dict[str, Any]]:
+        """Charges, credits and net per project, largest net spend first"""
+        rows = []
+        for (line_platform, project_id), totals in self.net_spend.items():
+            if platform and line_platform != platform:
+                continue
+            rows.append({
+                'platform': line_platform,
+                'project_id': project_id,
+                'project_name': totals['project_name'],
+                'charges': totals['charges'] / 100,
+                'credits': totals['credits'] / 100,
+                'net': (totals['charges'] + totals['credits']) / 100
+            })
+        return sorted(rows, key=lambda row: -row['net'])
+
+
+_index: Optional[CreditIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_credit_index() -> CreditIndex:
+    """Process-wide index, caught up with the store on every call"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CreditIndex()
+    _index.refresh()
+    return _index
+
+
+def annotate_report_credits(report: Dict[str, Any], line_ids: Dict[str, List[int]]) -> int:
+    """Add matched_charge to the credit items of a stored report - returns credits matched"""
+    index = get_credit_index()
+    matched = 0
+    for filename, ids in line_ids.items():
+        for item, line_id in zip(report['files'][filename]['items'], ids):
+            if item.get('amount', 0) < 0:
+                item['matched_charge'] = index.match_for(line_id)
+                matched += item['matched_charge'] is not None
+    return matched
+
+
+if __name__ == "__main__":
+    index = get_credit_index()
+    credits = index.credits()
+    linked = sum(1 for credit in credits if credit['matched_charge'])
+    print(f"Credits: {len(credits)} ({linked} linked to a charge)")
+    print("NET SPEND BY PROJECT")
+    print("=" * 80)
+    for row in index.project_net_spend()[:20]:
+        print(f"{row['platform']:10s} {row['project_id']:12s} charges {row['charges']:>14,.2f} "
+              f"credits {row['credits']:>12,.2f} net {row['net']:>14,.2f}")
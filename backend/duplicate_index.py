@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Duplicate-invoice detection within a batch and across history
+An invoice is identified by its content hash and by (platform, invoice number),
+so a re-upload under another filename is still caught. Within a batch the
+second copy is flagged and left out of the totals; a file already seen in an
+earlier batch is flagged but still counted, since that batch is a separate report.
+
+History lives in the invoice_keys table. Each process keeps a Bloom filter over
+it, so the common case (a new invoice) is answered without touching SQLite; only
+Bloom hits are confirmed against the exact store. The filter catches up with
+rows written by other workers by reading rows past the last id it has seen,
+once at the start of each batch.
+
+Configuration (environment):
+    DUPLICATE_BLOOM_CAPACITY    expected number of keys (default 1000000)
+    DUPLICATE_BLOOM_ERROR_RATE  false-positive rate at capacity (default 0.001)
+"""
+
+import hashlib
+import math
+import os
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from invoice_store import get_connection
+
+DUPLICATE_BLOOM_CAPACITY = int(os.environ.get('DUPLICATE_BLOOM_CAPACITY', '1000000'))
+DUPLICATE_BLOOM_ERROR_RATE = float(os.environ.get('DUPLICATE_BLOOM_ERROR_RATE', '0.001'))
+
+KEY_CONTENT = 'content'
+KEY_INVOICE = 'invoice_number'
+
+DUPLICATE_BATCH = 'batch'
+DUPLICATE_HISTORY = 'history'
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one SHA-256)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.sha256(value.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, value: str) -> None:
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class DuplicateIndex:
+    """Bloom filter in front of the invoice_keys table"""
+
+    def __init__(self, capacity: int = None, error_rate: float = None):
+        self.bloom = BloomFilter(capacity or DUPLICATE_BLOOM_CAPACITY,
+                                 error_rate or DUPLICATE_BLOOM_ERROR_RATE)
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Add rows written since the last refresh (by this or another worker)"""
+        with self.lock:
+            rows = get_connection().execute(
+                'SELECT id, key_type, key FROM invoice_keys WHERE id > ? ORDER BY id',
+                (self.last_id,)
+            ).fetchall()
+            for row in rows:
+                self.bloom.add(f"{row['key_type']}:{row['key']}")
+                self.last_id = row['id']
+
+    def lookup(self, key_type: str, key: str) -> Optional[Dict[str, Any]]:
+        """Earlier occurrence of a key, or None - SQLite is only queried on a Bloom hit"""
+        if f"{key_type}:{key}" not in self.bloom:
+            return None
+
+        row = get_connection().execute(
+            'SELECT filename, batch_id, first_seen_at FROM invoice_keys WHERE key_type = ? AND key = ?',
+            (key_type, key)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def record(self, batch_id: str, keys: List[Tuple[str, str, str]]) -> None:
+        """Store (key_type, key, filename) for a finished batch; existing keys keep their first sighting"""
+        if not keys:
+            return
+        now = datetime.now().isoformat()
+        conn = get_connection()
+        conn.executemany(
+            '''INSERT OR IGNORE INTO invoice_keys (key_type, key, filename, batch_id, first_seen_at)
+               VALUES (?, ?, ?, ?, ?)''',
+            [(key_type, key, filename, batch_id, now) for key_type, key, filename in keys]
+        )
+        conn.commit()
+
+
+_index: Optional[DuplicateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """Process-wide index, loaded from the store on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DuplicateIndex()
+        return _index
+
+
+def new_batch_id() -> str:
+    return uuid.uuid4().hex
+
+
+def invoice_number_of(entry: Dict[str, Any]) -> Optional[str]:
+    """First invoice number found on the file's records"""
+    for record in entry.get('items', []):
+        number = record.get('invoice_number') or record.get('invoice_id')
+        if number and str(number).strip().lower() != 'unknown':
+            return str(number).strip().upper()
+    return None
+
+
+def duplicate_keys(entry: Dict[str, Any], sha256: Optional[str]) -> List[Tuple[str, str]]:
+    """(key_type, key) pairs identifying the invoice in a report entry"""
+    keys = []
+    if sha256:
+        keys.append((KEY_CONTENT, sha256))
+    number = invoice_number_of(entry)
+    if number:
+        keys.append((KEY_INVOICE, f"{entry.get('platform')}:{number}"))
+    return keys
+
+
+class BatchDuplicateChecker:
+    """Flags duplicates for one upload batch; call record() once the batch is done"""
+
+    def __init__(self, batch_id: str, index: DuplicateIndex = None):
+        self.batch_id = batch_id
+        self.index = index or get_duplicate_index()
+        self.index.refresh()
+        self.seen: Dict[Tuple[str, str], str] = {}
+
+    def check(self, filename: str, entry: Dict[str, Any], sha256: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Duplicate flag for the file, or None - also remembers its keys for this batch"""
+        if entry.get('error') and not entry.get('items'):
+            return None
+
+        keys = duplicate_keys(entry, sha256)
+        flag = None
+
+        for key_type, key in keys:
+            if (key_type, key) in self.seen:
+                flag = {'scope': DUPLICATE_BATCH, 'matched_by': key_type,
+                        'original_filename': self.seen[(key_type, key)]}
+                break
+
+        if flag is None:
+            for key_type, key in keys:
+                previous = self.index.lookup(key_type, key)
+                if previous:
+                    flag = {'scope': DUPLICATE_HISTORY, 'matched_by': key_type,
+                            'original_filename': previous['filename'],
+                            'original_batch_id': previous['batch_id'],
+                            'first_seen_at': previous['first_seen_at']}
+                    break
+
+        for key in keys:
+            self.seen.setdefault(key, filename)
+
+        return flag
+
+    def record(self) -> None:
+        self.index.record(self.batch_id, [(key_type, key, filename)
+                                          for (key_type, key), filename in self.seen.items()])
+
+
+if __name__ == "__main__":
+    connection = get_connection()
+    for key_type, count in connection.execute(
+            'SELECT key_type, COUNT(*) FROM invoice_keys GROUP BY key_type').fetchall():
+        print(f"{key_type}: {count} keys")
+    bloom = BloomFilter(DUPLICATE_BLOOM_CAPACITY, DUPLICATE_BLOOM_ERROR_RATE)
+    print(f"Bloom filter: {bloom.size / 8 / 1024 / 1024:.1f} MB, {bloom.hash_count} hashes")
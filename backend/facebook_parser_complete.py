@@ -10,6 +10,27 @@ from typing import Dict, List, Any, Optional
 # Invoice to exclude from totals (as per accounting requirements)
 EXCLUDED_INVOICES = []  # Removing exclusion to verify totals
 
+# Line-level patterns - compiled once at import
+AMOUNT_LINE_PATTERN = re.compile(r'^(-?[\d,]+\.\d{2})\s*$')
+PK_PATTERN = re.compile(r'(pk\|[^\[]*\[ST\]\|[A-Z0-9]+)')
+
+# Period patterns for AP campaign names - compiled once at import
+PERIOD_PATTERNS = [
+    # Standard patterns
+    (re.compile(r'Y(\d{2})-([A-Z]{3}\d{2})'), lambda m: f"Y{m.group(1)}-{m.group(2)}"),  # Y25-JUN25
+    (re.compile(r'Y(\d{2})-([A-Z]{3})'), lambda m: f"Y{m.group(1)}-{m.group(2)}"),      # Y25-JUN
+    (re.compile(r'(Q[1-4]Y\d{2})'), lambda m: m.group(1)),                              # Q2Y25
+    (re.compile(r'FB[A-Z]+Y\d{2}-([A-Z]{3}\d{2})'), lambda m: m.group(1)),              # FBAWARENESSY25-JUN25
+    (re.compile(r'-([A-Z]{3}\d{2})-'), lambda m: m.group(1)),                           # -JUN25-
+    (re.compile(r'-([A-Z][a-z]{2}\d{2})-'), lambda m: m.group(1)),                      # -Jun25-
+    (re.compile(r'-([A-Z][a-z]{2})-'), lambda m: m.group(1)),                           # -Jun-
+    (re.compile(r'([A-Z]{3}Y{1,2}\d{2})'), lambda m: m.group(1)),                       # MAYY25, MAY25
+    (re.compile(r'_([A-Z][a-z]{2})_\[ST\]'), lambda m: m.group(1)),                     # _Jun_[ST]
+    (re.compile(r'-([A-Z][a-z]{2})\d*_\[ST\]'), lambda m: m.group(1)),                  # -Jun25_[ST]
+    (re.compile(r'-Post\d+-([A-Z][a-z]{2})_'), lambda m: m.group(1)),                   # -Post3-Jun_
+    (re.compile(r'-(\w+)-([A-Z][a-z]{2})_$'), lambda m: m.group(2)),                    # -anything-Jun_ (at end)
+]
+
 def parse_facebook_invoice(text_content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Facebook invoice with 100% accuracy including negative amounts"""
     
@@ -83,7 +104,7 @@ def extract_facebook_ap_complete(text_content: str, base_fields: dict) -> List[D
                 next_line = lines[j].strip()
                 
                 # Check for amount (positive or negative)
-                amount_match = re.match(r'^(-?[\d,]+\.\d{2})\s*$', next_line)
+                amount_match = AMOUNT_LINE_PATTERN.match(next_line)
                 if amount_match:
                     amount = float(amount_match.group(1).replace(',', ''))
                     amount_line_idx = j
@@ -121,7 +142,7 @@ def extract_facebook_ap_complete(text_content: str, base_fields: dict) -> List[D
                 full_description = re.sub(r'\s+\|', '|', full_description)
                 
                 # Try to extract pk pattern
-                pk_match = re.search(r'(pk\|[^\[]*\[ST\]\|[A-Z0-9]+)', full_description)
+                pk_match = PK_PATTERN.search(full_description)
                 
                 if pk_match:
                     # Standard AP item with pk pattern
@@ -191,14 +212,14 @@ def find_related_pk_pattern(lines: List[str], start_idx: int, end_idx: int) -> O
     for i in range(max(0, start_idx - search_range), start_idx):
         line = lines[i].strip()
         # Look for pk pattern
-        pk_match = re.search(r'(pk\|[^\[]*\[ST\]\|[A-Z0-9]+)', line)
+        pk_match = PK_PATTERN.search(line)
         if pk_match:
             return pk_match.group(1)
     
     # Also check forward a bit (sometimes pattern comes after)
     for i in range(end_idx + 1, min(len(lines), end_idx + 5)):
         line = lines[i].strip()
-        pk_match = re.search(r'(pk\|[^\[]*\[ST\]\|[A-Z0-9]+)', line)
+        pk_match = PK_PATTERN.search(line)
         if pk_match:
             return pk_match.group(1)
     
@@ -346,24 +367,8 @@ def parse_facebook_ap_fields_enhanced(pattern: str) -> Dict[str, str]:
                     break
             
             # Extract period - comprehensive patterns
-            period_patterns = [
-                # Standard patterns
-                (r'Y(\d{2})-([A-Z]{3}\d{2})', lambda m: f"Y{m.group(1)}-{m.group(2)}"),  # Y25-JUN25
-                (r'Y(\d{2})-([A-Z]{3})', lambda m: f"Y{m.group(1)}-{m.group(2)}"),      # Y25-JUN
-                (r'(Q[1-4]Y\d{2})', lambda m: m.group(1)),                              # Q2Y25
-                (r'FB[A-Z]+Y\d{2}-([A-Z]{3}\d{2})', lambda m: m.group(1)),              # FBAWARENESSY25-JUN25
-                (r'-([A-Z]{3}\d{2})-', lambda m: m.group(1)),                           # -JUN25-
-                (r'-([A-Z][a-z]{2}\d{2})-', lambda m: m.group(1)),                      # -Jun25-
-                (r'-([A-Z][a-z]{2})-', lambda m: m.group(1)),                           # -Jun-
-                (r'([A-Z]{3}Y{1,2}\d{2})', lambda m: m.group(1)),                       # MAYY25, MAY25
-                (r'_([A-Z][a-z]{2})_\[ST\]', lambda m: m.group(1)),                     # _Jun_[ST]
-                (r'-([A-Z][a-z]{2})\d*_\[ST\]', lambda m: m.group(1)),                  # -Jun25_[ST]
-                (r'-Post\d+-([A-Z][a-z]{2})_', lambda m: m.group(1)),                   # -Post3-Jun_
-                (r'-(\w+)-([A-Z][a-z]{2})_$', lambda m: m.group(2)),                    # -anything-Jun_ (at end)
-            ]
-            
-            for pattern_re, extractor in period_patterns:
-                period_match = re.search(pattern_re, main_content)
+            for pattern_re, extractor in PERIOD_PATTERNS:
+                period_match = pattern_re.search(main_content)
                 if period_match:
                     result['period'] = extractor(period_match)
                     break
@@ -403,7 +408,7 @@ def extract_facebook_non_ap(text_content: str, base_fields: dict) -> List[Dict[s
                 next_line = lines[j].strip()
                 
                 # Check for amount (with or without spaces) - INCLUDING NEGATIVE
-                amount_match = re.match(r'^(-?[\d,]+\.\d{2})\s*$', next_line)
+                amount_match = AMOUNT_LINE_PATTERN.match(next_line)
                 if amount_match:
                     # Found amount
                     try:
@@ -1,8 +1,43 @@
 #!/usr/bin/env python3
 
+import logging
 import re
 from collections import Counter
 
+logger = logging.getLogger(__name__)
+
+# Regex tables - compiled once at import
+ROW_START_PATTERNS = [
+    re.compile(r'^ST\d+'),              # ST followed by numbers
+    re.compile(r'^\d{2}[A-Z]+\s*-\s*'),  # Number+Letter pattern like "59ZP - Prakit"
+    re.compile(r'^\d+AP\s*-\s*'),        # "AP - " at start
+]
+ROW_PK_PATTERN = re.compile(r'\d+pk\|')   # Number+pk| pattern like "7pk|"
+ROW_END_PATTERN = re.compile(r'\d{1,3}(?:,\d{3})*\.\d{2}\s*0\.00\s*\d{1,3}(?:,\d{3})*\.\d{2}')
+
+PROJECT_NAME_PATTERNS = [re.compile(p) for p in [
+    # Standard patterns
+    r'pk_th-([a-zA-Z\-]+?)_none',
+    r'pk_([a-zA-Z\-]+?)_none',
+    r'th-([a-zA-Z\-]+?)_none',
+    # Full name patterns
+    r'(th-single-detached-house-[a-zA-Z\-]+?)_none',
+    r'(th-condominium-[a-zA-Z\-]+?)_none',
+    r'(single-detached-house-[a-zA-Z\-]+?)_none',
+    r'(condominium-[a-zA-Z\-]+?)_none',
+]]
+
+PERIOD_PATTERNS = [
+    # Standard patterns
+    (re.compile(r'Y\d{2}-([A-Z]{3}\d{2})'), 0),      # Y25-JUN25
+    (re.compile(r'(Q\d{1}Y\d{2})'), 0),               # Q2Y25
+    (re.compile(r'TT(?:TRAFFIC)?Q(\d{1}Y\d{2})'), 1), # TTQ2Y25 or TTTRAFFICQ2Y25
+    (re.compile(r'-([A-Z]{3}\d{2})-'), 1),           # -JUN25-
+    (re.compile(r'_TT-[^-]+-[^-]+-([A-Z][a-z]{2})_'), 1),  # TT-Paw-Post2-Jun
+    (re.compile(r'-([A-Z][a-z]{2})\d*_\[ST\]'), 1),  # -Jun25_[ST] or -Jun_[ST]
+    (re.compile(r'_([A-Z][a-z]{2})_\[ST\]'), 1),     # _Jun_[ST]
+]
+
 def parse_tiktok_invoice_detailed(text_content: str, filename: str):
     """
     Final improved TikTok parser v2 with better AP pattern parsing
@@ -26,7 +61,7 @@ def parse_tiktok_invoice_detailed(text_content: str, filename: str):
     # Determine invoice type
     invoice_type = determine_tiktok_invoice_type_enhanced(text_content)
     
-    print(f"[DEBUG] TikTok {filename}: Type={invoice_type}")
+    logger.debug("TikTok %s: Type=%s", filename, invoice_type)
     
     # Check if this has consumption details
     if 'Consumption Details:' in text_content:
@@ -34,7 +69,7 @@ def parse_tiktok_invoice_detailed(text_content: str, filename: str):
         line_items = extract_tiktok_consumption_details(text_content, base_fields, invoice_type)
         
         if line_items:
-            print(f"[DEBUG] TikTok detailed parser: Found {len(line_items)} line items")
+            logger.debug("TikTok detailed parser: Found %d line items", len(line_items))
             return line_items
     
     # Fallback: single invoice total record
@@ -47,7 +82,7 @@ def parse_tiktok_invoice_detailed(text_content: str, filename: str):
             'description': f"TikTok {invoice_type} Invoice Total",
             'amount': invoice_total
         }
-        print(f"[DEBUG] TikTok fallback: Invoice total {invoice_total:,.2f} THB")
+        logger.debug("TikTok fallback: Invoice total %.2f THB", invoice_total)
         return [record]
     
     return []
@@ -64,7 +99,7 @@ def extract_tiktok_consumption_details(text_content: str, base_fields: dict, inv
     consumption_section = extract_consumption_section(lines)
     
     if not consumption_section:
-        print("[DEBUG] No consumption section found")
+        logger.debug("No consumption section found")
         return []
     
     # Parse table data
@@ -131,10 +166,8 @@ def parse_tiktok_consumption_table_improved(consumption_lines):
         # Pattern 2: Number+Letter pattern like "59ZP - Prakit"
         # Pattern 3: Just "AP - " at start
         # Pattern 4: Number+pk| pattern like "7pk|"
-        if (re.match(r'^ST\d+', line) or 
-            re.match(r'^\d{2}[A-Z]+\s*-\s*', line) or
-            re.match(r'^\d+AP\s*-\s*', line) or
-            re.search(r'\d+pk\|', line)):
+        if (any(pattern.match(line) for pattern in ROW_START_PATTERNS) or
+            ROW_PK_PATTERN.search(line)):
             
             # Process previous row if exists
             if current_row_lines:
@@ -152,7 +185,7 @@ def parse_tiktok_consumption_table_improved(consumption_lines):
             current_row_lines.append(line)
             
             # Check if this line ends the row (contains final amounts)
-            if re.search(r'\d{1,3}(?:,\d{3})*\.\d{2}\s*0\.00\s*\d{1,3}(?:,\d{3})*\.\d{2}', line):
+            if ROW_END_PATTERN.search(line):
                 # End of row
                 row_data = process_tiktok_table_row_improved(current_row_lines)
                 if row_data:
@@ -427,20 +460,8 @@ def parse_ap_campaign_pattern_v2(campaign_name):
                 components['project_name'] = 'Corporate'
             else:
                 # Extract project name from various patterns
-                patterns = [
-                    # Standard patterns
-                    r'pk_th-([a-zA-Z\-]+?)_none',
-                    r'pk_([a-zA-Z\-]+?)_none',
-                    r'th-([a-zA-Z\-]+?)_none',
-                    # Full name patterns
-                    r'(th-single-detached-house-[a-zA-Z\-]+?)_none',
-                    r'(th-condominium-[a-zA-Z\-]+?)_none',
-                    r'(single-detached-house-[a-zA-Z\-]+?)_none',
-                    r'(condominium-[a-zA-Z\-]+?)_none',
-                ]
-                
-                for pattern in patterns:
-                    name_match = re.search(pattern, main_content)
+                for pattern in PROJECT_NAME_PATTERNS:
+                    name_match = pattern.search(main_content)
                     if name_match:
                         components['project_name'] = name_match.group(1)
                         break
@@ -453,19 +474,8 @@ def parse_ap_campaign_pattern_v2(campaign_name):
                     break
             
             # Extract period - improved patterns
-            period_patterns = [
-                # Standard patterns
-                (r'Y\d{2}-([A-Z]{3}\d{2})', 0),      # Y25-JUN25
-                (r'(Q\d{1}Y\d{2})', 0),               # Q2Y25
-                (r'TT(?:TRAFFIC)?Q(\d{1}Y\d{2})', 1), # TTQ2Y25 or TTTRAFFICQ2Y25
-                (r'-([A-Z]{3}\d{2})-', 1),           # -JUN25-
-                (r'_TT-[^-]+-[^-]+-([A-Z][a-z]{2})_', 1),  # TT-Paw-Post2-Jun
-                (r'-([A-Z][a-z]{2})\d*_\[ST\]', 1),  # -Jun25_[ST] or -Jun_[ST]
-                (r'_([A-Z][a-z]{2})_\[ST\]', 1),     # _Jun_[ST]
-            ]
-            
-            for pattern, group in period_patterns:
-                period_match = re.search(pattern, main_content)
+            for pattern, group in PERIOD_PATTERNS:
+                period_match = pattern.search(main_content)
                 if period_match:
                     extracted = period_match.group(group) if group else period_match.group(0)
                     # Clean up period
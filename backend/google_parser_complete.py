@@ -7,11 +7,14 @@ Google Parser Complete - Fixes all issues:
 4. Handles text fragmentation
 """
 
+import logging
 import re
 from typing import Dict, List, Any, Optional
 import fitz
 import os
 
+logger = logging.getLogger(__name__)
+
 def parse_google_invoice(text_content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Google invoice with complete accuracy"""
     
@@ -89,7 +92,7 @@ def extract_from_pdf_complete(pdf_path: str, base_fields: dict) -> List[Dict[str
                 items.extend(fee_items)
             
     except Exception as e:
-        print(f"Error extracting from PDF: {e}")
+        logger.warning("Error extracting from PDF: %s", e)
     
     # Sort by amount (descending) and renumber
     items = sorted(items, key=lambda x: abs(x['amount']), reverse=True)
@@ -7,11 +7,14 @@ Google Parser Final Fixed - แก้ปัญหาทั้งหมดที
 4. Same descriptions for all lines
 """
 
+import logging
 import re
 from typing import Dict, List, Any, Optional, Tuple
 import fitz
 import os
 
+logger = logging.getLogger(__name__)
+
 def parse_google_invoice(text_content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Google invoice with complete accuracy"""
     
@@ -142,7 +145,7 @@ def extract_from_pdf_complete(pdf_path: str, base_fields: dict) -> List[Dict[str
                 items.extend(fee_items)
             
     except Exception as e:
-        print(f"Error extracting from PDF: {e}")
+        logger.warning("Error extracting from PDF: %s", e)
     
     # Remove duplicates based on amount and description
     items = remove_duplicate_items(items)
@@ -8,11 +8,14 @@ Google Parser Fixed Final - แก้ปัญหาทั้งหมด
 5. รวม 57 ไฟล์ (ไม่ใช่ 56)
 """
 
+import logging
 import re
 from typing import Dict, List, Any, Optional, Tuple
 import fitz
 import os
 
+logger = logging.getLogger(__name__)
+
 def parse_google_invoice(text_content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Google invoice with complete accuracy"""
     
@@ -139,7 +142,7 @@ def extract_from_pdf_fixed(pdf_path: str, base_fields: dict) -> List[Dict[str, A
                 items.extend(fee_items)
             
     except Exception as e:
-        print(f"Error extracting from PDF: {e}")
+        logger.warning("Error extracting from PDF: %s", e)
     
     # Sort by absolute amount (descending) and renumber
     items = sorted(items, key=lambda x: abs(x['amount']), reverse=True)
@@ -8,11 +8,50 @@ Google Parser Professional - 100% Accuracy
 4. ไม่มี duplicate items
 """
 
+import logging
 import re
 from typing import Dict, List, Any, Optional, Tuple
 import fitz
 import os
 
+logger = logging.getLogger(__name__)
+
+# Regex tables - compiled once at import
+AP_CAMPAIGN_PATTERNS = [re.compile(p) for p in [
+    r'2089P\d+',
+    r'2159P\d+',
+    r'2218P\d+',
+    r'DMCRM',
+    r'DMHEALTH',
+    r'SDH\s*\|.*Nontaburi'
+]]
+
+PAGE1_TOTAL_PATTERNS = [
+    # Thai pattern
+    (re.compile(r'ยอดเงินครบกำหนด\s*\n\s*(-?฿?[\d,]+\.\d{2})'), 1),
+    # English pattern
+    (re.compile(r'Amount due\s*\n\s*(-?฿?[\d,]+\.\d{2})'), 1),
+    # Total in THB pattern
+    (re.compile(r'ยอดรวมในสกุลเงิน THB\s*\n\s*(-?฿?[\d,]+\.\d{2})'), 1),
+    # Direct amount pattern
+    (re.compile(r'^(-?฿?[\d,]+\.\d{2})$', re.MULTILINE), 1)
+]
+
+LINE_AMOUNT_PATTERN = re.compile(r'(-?\d{1,3}(?:,\d{3})*\.\d{2})$')
+
+CAMPAIGN_ID_PATTERNS = [re.compile(p) for p in [
+    r'(GDNQ[A-Z0-9]+)',  # GDNQ2Y25
+    r'\|(\d{4}P\d{2})',  # |2089P12
+    r'(D-[A-Za-z]+-[A-Z]+-\d{5}-\d{4})',  # D-DMHealth-TV-00275-0625
+    r'(DMCRM-[A-Z]{2}-\d{3}-\d{4})'  # DMCRM-IN-041-0625
+]]
+
+TEXT_TOTAL_PATTERNS = [re.compile(p, re.MULTILINE | re.IGNORECASE) for p in [
+    r'ยอดรวม.*?[:\s]+.*?([-]?\d{1,3}(?:,\d{3})*\.?\d*)',
+    r'Total.*?[:\s]+.*?([-]?\d{1,3}(?:,\d{3})*\.?\d*)',
+    r'Amount due.*?[:\s]+.*?([-]?\d{1,3}(?:,\d{3})*\.?\d*)'
+]]
+
 def parse_google_invoice(text_content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Google invoice with 100% accuracy"""
     
@@ -153,7 +192,7 @@ def extract_from_pdf_professional(pdf_path: str, base_fields: dict) -> List[Dict
                     }]
             
     except Exception as e:
-        print(f"Error extracting from PDF {pdf_path}: {e}")
+        logger.warning("Error extracting from PDF %s: %s", pdf_path, e)
         return []
     
     # Final cleanup
@@ -183,17 +222,8 @@ def determine_invoice_type_professional(clean_text: str, raw_text: str) -> str:
         return 'AP'
     
     # Check for AP campaign IDs
-    ap_patterns = [
-        r'2089P\d+',
-        r'2159P\d+', 
-        r'2218P\d+',
-        r'DMCRM',
-        r'DMHEALTH',
-        r'SDH\s*\|.*Nontaburi'
-    ]
-    
-    for pattern in ap_patterns:
-        if re.search(pattern, clean_text):
+    for pattern in AP_CAMPAIGN_PATTERNS:
+        if pattern.search(clean_text):
             return 'AP'
     
     return 'Non-AP'
@@ -202,23 +232,11 @@ def extract_page1_total_professional(page) -> Optional[float]:
     """Extract total from page 1 accurately"""
     text = page.get_text()
     
-    # Look for Amount due patterns
-    patterns = [
-        # Thai pattern
-        (r'ยอดเงินครบกำหนด\s*\n\s*(-?฿?[\d,]+\.\d{2})', 1),
-        # English pattern  
-        (r'Amount due\s*\n\s*(-?฿?[\d,]+\.\d{2})', 1),
-        # Total in THB pattern
-        (r'ยอดรวมในสกุลเงิน THB\s*\n\s*(-?฿?[\d,]+\.\d{2})', 1),
-        # Direct amount pattern
-        (r'^(-?฿?[\d,]+\.\d{2})$', 1)
-    ]
-    
     lines = text.split('\n')
     
-    # First try patterns
-    for pattern, group in patterns:
-        match = re.search(pattern, text, re.MULTILINE)
+    # First try Amount due patterns
+    for pattern, group in PAGE1_TOTAL_PATTERNS:
+        match = pattern.search(text)
         if match:
             amount_str = match.group(group).replace('฿', '').replace(',', '')
             try:
@@ -271,7 +289,7 @@ def extract_page2_items_professional(page, base_fields: dict, is_negative_invoic
         line = lines[i].strip()
         
         # Check if this line contains an amount
-        amount_match = re.search(r'(-?\d{1,3}(?:,\d{3})*\.\d{2})$', line)
+        amount_match = LINE_AMOUNT_PATTERN.search(line)
         
         if amount_match:
             amount = float(amount_match.group(1).replace(',', ''))
@@ -349,7 +367,7 @@ def extract_negative_items_professional(page, base_fields: dict, period: str) ->
         line = lines[i].strip()
         
         # Look for any amount
-        amount_match = re.search(r'(-?\d{1,3}(?:,\d{3})*\.\d{2})$', line)
+        amount_match = LINE_AMOUNT_PATTERN.search(line)
         if amount_match:
             amount = float(amount_match.group(1).replace(',', ''))
             
@@ -497,15 +515,8 @@ def extract_ap_fields_professional(description: str) -> Dict[str, Any]:
             result['campaign_id'] = st_match.group(1)
         else:
             # Other patterns
-            campaign_patterns = [
-                r'(GDNQ[A-Z0-9]+)',  # GDNQ2Y25
-                r'\|(\d{4}P\d{2})',  # |2089P12
-                r'(D-[A-Za-z]+-[A-Z]+-\d{5}-\d{4})',  # D-DMHealth-TV-00275-0625
-                r'(DMCRM-[A-Z]{2}-\d{3}-\d{4})'  # DMCRM-IN-041-0625
-            ]
-            
-            for pattern in campaign_patterns:
-                match = re.search(pattern, clean_desc)
+            for pattern in CAMPAIGN_ID_PATTERNS:
+                match = pattern.search(clean_desc)
                 if match:
                     result['campaign_id'] = match.group(1)
                     break
@@ -646,14 +657,8 @@ def extract_period(text_content: str) -> Optional[str]:
 
 def extract_total_from_text(text_content: str) -> float:
     """Extract total amount from text"""
-    patterns = [
-        r'ยอดรวม.*?[:\s]+.*?([-]?\d{1,3}(?:,\d{3})*\.?\d*)',
-        r'Total.*?[:\s]+.*?([-]?\d{1,3}(?:,\d{3})*\.?\d*)',
-        r'Amount due.*?[:\s]+.*?([-]?\d{1,3}(?:,\d{3})*\.?\d*)'
-    ]
-    
-    for pattern in patterns:
-        matches = re.finditer(pattern, text_content, re.MULTILINE | re.IGNORECASE)
+    for pattern in TEXT_TOTAL_PATTERNS:
+        matches = pattern.finditer(text_content)
         for match in matches:
             try:
                 amount = float(match.group(1).replace(',', ''))
@@ -3,11 +3,14 @@
 Google Parser V3 - Complete rewrite to handle all issues
 """
 
+import logging
 import re
 from typing import Dict, List, Any, Optional, Tuple
 import fitz
 import os
 
+logger = logging.getLogger(__name__)
+
 def parse_google_invoice(text_content: str, filename: str) -> List[Dict[str, Any]]:
     """Parse Google invoice with complete accuracy"""
     
@@ -147,7 +150,7 @@ def extract_from_pdf_v3(pdf_path: str, base_fields: dict) -> List[Dict[str, Any]
                     }]
             
     except Exception as e:
-        print(f"Error extracting from PDF: {e}")
+        logger.warning("Error extracting from PDF: %s", e)
     
     # Remove duplicates and renumber
     items = remove_duplicates_v3(items)
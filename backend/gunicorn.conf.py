@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Gunicorn configuration for the invoice API
+Web workers are recycled the same way as the parsing workers: after a number
+of requests (with jitter so they do not all restart together) or once their
+RSS passes a threshold. A worker always finishes its in-flight request before
+it exits, and gunicorn starts the replacement.
+
+With GUNICORN_PRELOAD=1 the master imports the app, warms fitz and the
+parsers and freezes the heap before forking, so workers start warm and
+share those pages copy-on-write. Without it every worker imports lazily
+on its first request.
+"""
+
+import os
+
+from worker_pool import current_rss_mb, shutdown_invoice_pool
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Threads let a worker answer health checks and small requests while one of its
+# threads waits on a batch; admission.py bounds how much parsing runs at once
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Batches of large invoices can take minutes (matches the frontend's 5 minute timeout)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '300'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '500'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '50'))
+
+WEB_WORKER_MAX_RSS_MB = int(os.environ.get('WEB_WORKER_MAX_RSS_MB', '768'))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+
+def when_ready(server):
+    """Preload mode: import fitz and the parsers once in the master"""
+    if preload_app:
+        from startup import warm_up
+        timings = warm_up()
+        server.log.info(f"Warmed up in {sum(timings.values()) * 1000:.0f} ms")
+
+
+def pre_fork(server, worker):
+    """Keep preloaded objects out of the workers' garbage collections"""
+    if preload_app:
+        from startup import freeze_heap
+        freeze_heap()
+
+
+def post_request(worker, req, environ, resp):
+    """Retire the web worker gracefully once its memory grows past the threshold"""
+    if WEB_WORKER_MAX_RSS_MB > 0:
+        rss_mb = current_rss_mb()
+        if rss_mb >= WEB_WORKER_MAX_RSS_MB:
+            worker.log.info(f"Worker {worker.pid} at {rss_mb:.0f} MB RSS, retiring")
+            worker.alive = False
+
+
+def worker_exit(server, worker):
+    """Stop the parsing worker processes owned by this web worker"""
+    shutdown_invoice_pool()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Response compression and ETags for the report endpoints
+Report JSON and CSV exports (Thai descriptions, repeated pk| strings)
+compress several-fold. Responses are gzipped when the client accepts it;
+streamed responses are compressed chunk by chunk as they are produced.
+
+Stored reports do not change once written, so they get strong ETags derived
+from their content hash and the query that shaped the response. A matching
+If-None-Match is answered with 304 before any rows are read or serialized.
+
+Configuration (environment):
+    GZIP_MIN_BYTES   smaller bodies are sent as is (default 1024)
+    GZIP_LEVEL       zlib compression level (default 6)
+"""
+
+import hashlib
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from flask import Response, request
+
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+
+# Endpoints whose responses are compressed
+COMPRESSED_ENDPOINTS = {
+    'api.process_invoices',
+    'api.get_report',
+    'api.reports',
+    'api.export_csv',
+    'api.metrics',
+}
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/csv'}
+
+
+def accepts_gzip() -> bool:
+    """Whether the client listed gzip in Accept-Encoding (and did not refuse it with q=0)"""
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0')
+    return False
+
+
+def _gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def compress_response(response: Response) -> Response:
+    """after_request hook: gzip report, export and metrics responses"""
+    if (request.endpoint not in COMPRESSED_ENDPOINTS
+            or response.status_code != 200
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if not accepts_gzip():
+        return response
+
+    if response.is_streamed:
+        response.direct_passthrough = False
+        response.response = _gzip_stream(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < GZIP_MIN_BYTES:
+            return response
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        response.set_data(compressor.compress(body) + compressor.flush())
+
+    response.headers['Content-Encoding'] = 'gzip'
+    # A strong ETag names the identity body; mark the encoded one as a variant
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f"{etag}-gzip")
+    return response
+
+
+def report_etag(content_hash: str, args) -> str:
+    """Strong ETag for one view of a stored report: content hash plus the query shaping it"""
+    query = '&'.join(f"{key}={value}" for key, value in sorted(args.items(multi=True)))
+    return hashlib.sha256(f"{content_hash}?{query}".encode('utf-8')).hexdigest()[:32]
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """304 response when If-None-Match already names this ETag, else None"""
+    if etag in request.if_none_match or f"{etag}-gzip" in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        return response
+    return None
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Shared invoice processing: platform detection, parsing, reconciliation
+and report aggregation used by the API and the batch scripts
+
+Extraction is tiered so the common case stays fast:
+1. text     - serving parser on plain page text
+2. layout   - layout parser (blocks / word positions), only if tier 1 fails reconciliation
+3. total_only - single record with the printed total, only when no parser found any items
+
+Parsed items are never replaced by the total: a file whose items do not add up
+to the printed total keeps them, with the mismatch in its reconciliation block.
+
+A PDF source is either a file path or the PDF bytes (ZIP members are never
+written to disk unless the platform's parsers re-open the file by path).
+In-process runs (INVOICE_WORKERS=0) may also get a memoryview of a mapped
+input file.
+"""
+
+import os
+import posixpath
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Any, Optional, Union
+
+import fitz
+
+from layout_extraction import extract_layout_text
+from parser_registry import run_parser, platform_takes_path, LAYOUT_PARSERS, SERVING_PARSERS
+from reconciliation import (
+    extract_printed_total, reconcile_items, needs_escalation, satang_to_amount
+)
+from request_profiling import profile_stage, run_profiled
+from shadow_mode import should_shadow
+
+TIER_TEXT = 'text'
+TIER_LAYOUT = 'layout'
+TIER_TOTAL_ONLY = 'total_only'
+
+PdfSource = Union[str, bytes, memoryview]
+
+
+def open_pdf(pdf_source: PdfSource):
+    """Open a PDF from a path or from bytes already in memory"""
+    if isinstance(pdf_source, memoryview):
+        # fitz.open(stream=...) takes bytes, not a buffer
+        pdf_source = pdf_source.tobytes()
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype='pdf')
+    return fitz.open(pdf_source)
+
+
+@contextmanager
+def parser_pdf_path(pdf_source: PdfSource, filename: str, platform: str) -> Iterator[Optional[str]]:
+    """
+    Path for parsers that re-open the PDF themselves
+
+    In-memory sources are spooled to a temp file only for platforms whose
+    parsers need a path (Google); other platforms get None and never touch disk.
+    """
+    if isinstance(pdf_source, str):
+        yield pdf_source
+        return
+    if not platform_takes_path(platform):
+        yield None
+        return
+
+    # Parsers read the invoice number from the filename, so keep it in the temp name
+    with tempfile.NamedTemporaryFile(delete=False, prefix='member_',
+                                     suffix=f"_{os.path.basename(filename)}") as tmp:
+        tmp.write(pdf_source)
+        temp_path = tmp.name
+    try:
+        yield temp_path
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def detect_platform(filename: str, text_content: str) -> str:
+    """Detect platform - filename pattern first, then content"""
+    # Archive members may be reported as "archive.zip/path/name.pdf"
+    filename = posixpath.basename(filename)
+    text_lower = text_content.lower()
+
+    if filename.startswith('5'):
+        return 'Google'
+    elif filename.startswith('THTT'):
+        return 'TikTok'
+    elif filename.startswith('24'):
+        return 'Facebook'
+    elif "tiktok" in text_lower and "facebook" not in text_lower:
+        return 'TikTok'
+    elif "facebook" in text_lower or "meta" in text_lower:
+        return 'Facebook'
+    elif "google" in text_lower:
+        return 'Google'
+
+    return 'Unknown'
+
+
+def parse_text_tier(platform: str, text_content: str, filename: str,
+                    pdf_path: str) -> List[Dict[str, Any]]:
+    """Tier 1 - serving parser on plain page text"""
+    return run_parser(platform, text_content, filename, pdf_path)
+
+
+def parse_layout_tier(platform: str, doc, text_content: str, filename: str,
+                      pdf_path: str) -> List[Dict[str, Any]]:
+    """Tier 2 - block-level parser, or serving parser on text rebuilt from words"""
+    if platform in LAYOUT_PARSERS:
+        return run_parser(platform, text_content, filename, pdf_path,
+                          variant=LAYOUT_PARSERS[platform])
+
+    return run_parser(platform, extract_layout_text(doc), filename, pdf_path)
+
+
+def invoice_number_from_filename(filename: str) -> str:
+    """Invoice files are named after their invoice number (e.g. 5297692778.pdf)"""
+    return posixpath.splitext(posixpath.basename(filename))[0]
+
+
+def create_total_only_record(platform: str, filename: str, printed_total: int,
+                             previous_records: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Tier 3 - record carrying only the printed invoice total"""
+    amount = satang_to_amount(printed_total)
+
+    # Keep invoice identity from an earlier tier when there is one; otherwise
+    # the number is the file name, as the parsers' own fallbacks do
+    reference = previous_records[0] if previous_records else {}
+    invoice_number = reference.get('invoice_number') or invoice_number_from_filename(filename)
+
+    return {
+        'platform': platform,
+        'filename': filename,
+        'invoice_number': invoice_number,
+        'invoice_id': reference.get('invoice_id') or invoice_number,
+        'invoice_type': reference.get('invoice_type', 'Unknown'),
+        'line_number': 1,
+        'amount': amount,
+        'total': amount,
+        'description': f"{platform} Invoice Total",
+        'agency': None,
+        'project_id': None,
+        'project_name': None,
+        'objective': None,
+        'period': None,
+        'campaign_id': None
+    }
+
+
+def determine_file_invoice_type(records: List[Dict[str, Any]]) -> str:
+    """AP if any record carries the pk agency; Unknown when every record's type is Unknown"""
+    if any(r.get('agency') == 'pk' for r in records):
+        return 'AP'
+    if all(r.get('invoice_type') == 'Unknown' for r in records):
+        return 'Unknown'
+    return 'Non-AP'
+
+
+def process_invoice_file(pdf_source: PdfSource, filename: str, profile: bool = False) -> Dict[str, Any]:
+    """
+    Extract, parse and reconcile one PDF (path or bytes) - returns the report entry for the file
+
+    With profile, the entry also carries the file's per-stage profile (see request_profiling).
+    """
+    if profile:
+        entry, stages = run_profiled(process_invoice_file, pdf_source, filename)
+        return {**entry, 'profile': stages}
+
+    # Parsers take the invoice number from the file name, not from the report name
+    # of an archive member ("archive.zip/path/name.pdf")
+    report_name, filename = filename, posixpath.basename(filename)
+
+    with open_pdf(pdf_source) as doc:
+        with profile_stage('extract'):
+            text_content = ""
+            for page in doc:
+                text_content += page.get_text()
+
+        with profile_stage('detect'):
+            platform = detect_platform(filename, text_content)
+            printed_total = extract_printed_total(doc, platform)
+
+        with parser_pdf_path(pdf_source, filename, platform) as pdf_path:
+            # Tier 1: plain text
+            tier = TIER_TEXT
+            start = time.perf_counter()
+            with profile_stage(TIER_TEXT, f"{platform}/{SERVING_PARSERS.get(platform)}"):
+                records = parse_text_tier(platform, text_content, filename, pdf_path)
+            text_seconds = time.perf_counter() - start
+            reconciliation = reconcile_items(records, printed_total)
+            initial_status = reconciliation['status']
+
+            # Sampled files are re-parsed by a candidate parser in the web process,
+            # so the tier 1 inputs and output travel back with the entry
+            shadow = ({'platform': platform, 'text': text_content, 'records': records,
+                       'seconds': text_seconds} if should_shadow(platform) else None)
+
+            # Tier 2: layout, only when the cheap pass does not reconcile
+            if needs_escalation(reconciliation) and platform != 'Unknown':
+                layout_parser = LAYOUT_PARSERS.get(platform, SERVING_PARSERS[platform])
+                with profile_stage(TIER_LAYOUT, f"{platform}/{layout_parser}"):
+                    layout_records = parse_layout_tier(platform, doc, text_content, filename, pdf_path)
+                layout_reconciliation = reconcile_items(layout_records, printed_total)
+
+                # Layout items win when they reconcile, or when the text tier found none
+                if not needs_escalation(layout_reconciliation) or (not records and layout_records):
+                    tier = TIER_LAYOUT
+                    records = layout_records
+                    reconciliation = layout_reconciliation
+
+    # Tier 3: total only, when neither parser found items but the total is known
+    if not records and printed_total is not None:
+        records = [create_total_only_record(platform, filename, printed_total)]
+        tier = TIER_TOTAL_ONLY
+        reconciliation = reconcile_items(records, printed_total)
+
+    file_total = sum(record.get('amount', 0) for record in records)
+    for record in records:
+        record['filename'] = report_name
+
+    entry = {
+        'platform': platform,
+        'invoice_type': determine_file_invoice_type(records),
+        'extraction_tier': tier,
+        'total_amount': file_total,
+        'items_count': len(records),
+        'items': records,
+        # initial_status keeps the tier 1 result visible after escalation
+        'reconciliation': {**reconciliation, 'initial_status': initial_status}
+    }
+    if shadow is not None:
+        # Popped by the caller before the entry is cached or reported (see shadow_mode)
+        entry['shadow'] = shadow
+    return entry
+
+
+def process_total_only(pdf_source: PdfSource, filename: str, profile: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Fallback after a timeout or crash: printed total only, no parsers
+
+    Reads only page 1 text for platform detection plus the clipped total region.
+    Takes the same arguments as process_invoice_file; fallbacks are not profiled.
+    """
+    with open_pdf(pdf_source) as doc:
+        first_page_text = doc[0].get_text() if len(doc) > 0 else ""
+        platform = detect_platform(filename, first_page_text)
+        printed_total = extract_printed_total(doc, platform)
+
+    if printed_total is None:
+        return None
+
+    records = [create_total_only_record(platform, posixpath.basename(filename), printed_total)]
+    records[0]['filename'] = filename
+    reconciliation = reconcile_items(records, printed_total)
+
+    return {
+        'platform': platform,
+        'invoice_type': determine_file_invoice_type(records),
+        'extraction_tier': TIER_TOTAL_ONLY,
+        'total_amount': records[0]['amount'],
+        'items_count': 1,
+        'items': records,
+        'reconciliation': {**reconciliation, 'initial_status': None}
+    }
+
+
+def create_error_entry(filename: str, error: Dict[str, Any]) -> Dict[str, Any]:
+    """Report entry for a file that could not be processed"""
+    return {
+        'platform': detect_platform(filename, ''),
+        'invoice_type': 'Unknown',
+        'extraction_tier': None,
+        'total_amount': 0,
+        'items_count': 0,
+        'items': [],
+        'error': error
+    }
+
+
+def create_cached_entry(filename: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Report entry served from the parse cache, its items named after this upload"""
+    return {
+        **entry,
+        'items': [{**item, 'filename': filename} for item in entry.get('items', [])],
+        'cached': True
+    }
+
+
+def create_report(total_files: int) -> Dict[str, Any]:
+    """Initialize report structure"""
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'total_files': total_files,
+        'summary': {
+            'by_platform': {},
+            'overall': {
+                'total_amount': 0,
+                'total_items': 0,
+                'files_processed': 0
+            },
+            'reconciliation': {
+                'matched': 0,
+                'mismatch': 0,
+                'no_items': 0,
+                'unverified': 0,
+                'mismatched_files': []
+            },
+            'by_tier': {},
+            'errors': [],
+            'duplicates': {
+                'batch': 0,
+                'history': 0,
+                'files': []
+            }
+        },
+        'files': {}
+    }
+
+
+def add_file_to_report(report: Dict[str, Any], filename: str, entry: Dict[str, Any]) -> None:
+    """Add one processed file to the report and update summaries"""
+    platform = entry['platform']
+    file_total = entry['total_amount']
+    items_count = entry['items_count']
+
+    # Duplicates are listed; a second copy within the batch is not counted again
+    duplicate = entry.get('duplicate')
+    counted_files = 1
+    if duplicate:
+        duplicates = report['summary']['duplicates']
+        duplicates[duplicate['scope']] += 1
+        duplicates['files'].append({'filename': filename, **duplicate})
+        if duplicate['scope'] == 'batch':
+            file_total = 0
+            items_count = 0
+            # Nor in the platform's file count, which averages items per file
+            counted_files = 0
+
+    # Update platform summary
+    if platform not in report['summary']['by_platform']:
+        report['summary']['by_platform'][platform] = {
+            'total_amount': 0,
+            'total_items': 0,
+            'files': 0,
+            'average_items_per_file': 0
+        }
+
+    report['summary']['by_platform'][platform]['total_amount'] += file_total
+    report['summary']['by_platform'][platform]['total_items'] += items_count
+    report['summary']['by_platform'][platform]['files'] += counted_files
+
+    # Update overall summary
+    report['summary']['overall']['total_amount'] += file_total
+    report['summary']['overall']['total_items'] += items_count
+    report['summary']['overall']['files_processed'] += 1
+
+    # Update reconciliation summary
+    reconciliation = entry.get('reconciliation')
+    if reconciliation:
+        recon_summary = report['summary']['reconciliation']
+        status = reconciliation['status']
+        recon_summary[status] = recon_summary.get(status, 0) + 1
+        if status == 'mismatch':
+            recon_summary['mismatched_files'].append(filename)
+
+    # Files that timed out, crashed or raised (fallback entries keep their error too)
+    if entry.get('error'):
+        report['summary']['errors'].append({
+            'filename': filename,
+            'type': entry['error'].get('type'),
+            'message': entry['error'].get('message')
+        })
+
+    # Count which extraction tier produced the file
+    tier = entry.get('extraction_tier')
+    if tier:
+        by_tier = report['summary']['by_tier']
+        by_tier[tier] = by_tier.get(tier, 0) + 1
+
+    report['files'][filename] = entry
+
+
+def finalize_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Calculate averages once all files are added"""
+    for platform_data in report['summary']['by_platform'].values():
+        if platform_data['files'] > 0:
+            platform_data['average_items_per_file'] = round(
+                platform_data['total_items'] / platform_data['files'], 2
+            )
+    return report
+
+
+if __name__ == "__main__":
+    print("Invoice processing - shared pipeline for API and batch scripts")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Local SQLite store shared by the backend features that keep state
+between requests (shadow comparisons, caches, history)
+"""
+
+import os
+import sqlite3
+import threading
+from typing import List
+
+DATA_DIR = os.environ.get(
+    'INVOICE_DATA_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+)
+DB_PATH = os.path.join(DATA_DIR, 'invoice_store.db')
+
+# Tables are created on first connection; features append their own DDL
+SCHEMA: List[str] = [
+    '''CREATE TABLE IF NOT EXISTS shadow_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        platform TEXT NOT NULL,
+        filename TEXT,
+        serving_variant TEXT NOT NULL,
+        candidate_variant TEXT NOT NULL,
+        serving_seconds REAL,
+        candidate_seconds REAL,
+        serving_items INTEGER,
+        candidate_items INTEGER,
+        serving_total REAL,
+        candidate_total REAL,
+        field_diffs INTEGER,
+        diff_json TEXT,
+        error TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_shadow_runs_variant ON shadow_runs (platform, candidate_variant)',
+    # Parse cache entries used to be shared by every client; they are per scope now
+    'DROP TABLE IF EXISTS parsed_files',
+    '''CREATE TABLE IF NOT EXISTS cached_files (
+        scope TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        parser_key TEXT NOT NULL,
+        filename TEXT,
+        entry_json TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        last_used_at TEXT NOT NULL,
+        PRIMARY KEY (scope, sha256, parser_key)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS invoice_keys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key_type TEXT NOT NULL,
+        key TEXT NOT NULL,
+        filename TEXT,
+        batch_id TEXT NOT NULL,
+        first_seen_at TEXT NOT NULL,
+        UNIQUE (key_type, key)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS line_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        batch_id TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        platform TEXT,
+        invoice_number TEXT,
+        invoice_type TEXT,
+        line_number INTEGER,
+        amount_satang INTEGER NOT NULL,
+        description TEXT,
+        agency TEXT,
+        project_id TEXT,
+        project_name TEXT,
+        objective TEXT,
+        period TEXT,
+        campaign_id TEXT,
+        created_at TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_line_items_batch ON line_items (batch_id)',
+    '''CREATE TABLE IF NOT EXISTS reports (
+        batch_id TEXT PRIMARY KEY,
+        generated_at TEXT NOT NULL,
+        total_files INTEGER NOT NULL,
+        summary_json TEXT NOT NULL,
+        content_hash TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS report_files (
+        batch_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        items_count INTEGER NOT NULL,
+        entry_json TEXT NOT NULL,
+        items_json TEXT NOT NULL,
+        PRIMARY KEY (batch_id, position)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS admission_tickets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client TEXT NOT NULL,
+        cost REAL NOT NULL,
+        pid INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS file_timings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        platform_guess TEXT NOT NULL,
+        platform TEXT,
+        pages INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        objects INTEGER,
+        seconds REAL NOT NULL,
+        recorded_at REAL NOT NULL
+    )''',
+]
+
+# Columns added after their table first shipped: (table, column, type)
+ADDED_COLUMNS = [
+    ('reports', 'content_hash', 'TEXT'),
+]
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Per-thread connection; reopened after fork so workers never share a handle"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'pid', None) == os.getpid():
+        return conn
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL lets gunicorn workers read while another one writes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    for statement in SCHEMA:
+        conn.execute(statement)
+    for table, column, column_type in ADDED_COLUMNS:
+        existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+    conn.commit()
+
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+if __name__ == "__main__":
+    connection = get_connection()
+    tables = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    print(f"Store: {DB_PATH}")
+    for table in tables:
+        count = connection.execute(f"SELECT COUNT(*) FROM {table['name']}").fetchone()[0]
+        print(f"  {table['name']}: {count} rows")
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Layout-based text extraction for the second extraction tier
+Rebuilds lines from word positions (page.get_text("words")) so that
+fragmented text (zero-width spaces, one glyph per line, split pk| patterns)
+comes back as the visual row the reader sees.
+"""
+
+from typing import List
+
+# Words whose vertical centers are this close (points) belong to the same row
+ROW_TOLERANCE = 3.0
+
+# Horizontal gap (points) that separates two table cells on the same row
+CELL_GAP = 12.0
+
+# Gap below which two words are glyph fragments of the same token
+GLYPH_GAP = 1.0
+
+
+def group_words_into_rows(words: List[tuple]) -> List[List[tuple]]:
+    """Group fitz words (x0, y0, x1, y1, text, ...) into visual rows"""
+    rows = []
+    current_row = []
+    current_center = None
+
+    for word in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        center = (word[1] + word[3]) / 2
+        if current_row and abs(center - current_center) > ROW_TOLERANCE:
+            rows.append(current_row)
+            current_row = []
+
+        # Row position is anchored on its first word
+        if not current_row:
+            current_center = center
+        current_row.append(word)
+
+    if current_row:
+        rows.append(current_row)
+
+    return rows
+
+
+def split_row_into_cells(row: List[tuple]) -> List[str]:
+    """Split a row at wide gaps so table columns stay on separate lines"""
+    cells = []
+    cell_text = ''
+    previous_x1 = None
+
+    for x0, _, x1, _, text, *_ in sorted(row, key=lambda w: w[0]):
+        text = text.replace('\u200b', '')
+        if not text:
+            continue
+
+        if previous_x1 is None:
+            cell_text = text
+        elif x0 - previous_x1 > CELL_GAP:
+            cells.append(cell_text)
+            cell_text = text
+        elif x0 - previous_x1 < GLYPH_GAP:
+            cell_text += text
+        else:
+            cell_text += ' ' + text
+        previous_x1 = x1
+
+    if cell_text:
+        cells.append(cell_text)
+
+    return cells
+
+
+def extract_page_layout_text(page) -> str:
+    """Rebuild one page's text in reading order from word positions"""
+    lines = []
+    for row in group_words_into_rows(page.get_text('words')):
+        lines.extend(split_row_into_cells(row))
+    return '\n'.join(lines) + '\n'
+
+
+def extract_layout_text(doc) -> str:
+    """Rebuild the whole document's text from word positions"""
+    return ''.join(extract_page_layout_text(page) for page in doc)
+
+
+if __name__ == "__main__":
+    print("Layout extraction - rebuild text from word positions")
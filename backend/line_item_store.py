@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Stored line items
+Every processed batch writes its line items to the line_items table so that
+features working across invoices (credit matching, search) can read them.
+Amounts are stored in satang. Duplicate files are not stored again.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterator, List, Any
+
+from invoice_store import get_connection
+from reconciliation import amount_to_satang
+
+LINE_FIELDS = ['platform', 'invoice_number', 'invoice_type', 'line_number', 'description',
+               'agency', 'project_id', 'project_name', 'objective', 'period', 'campaign_id']
+
+
+def store_report_items(report: Dict[str, Any]) -> Dict[str, List[int]]:
+    """Store the items of every non-duplicate file - returns {filename: [line ids in item order]}"""
+    now = datetime.now().isoformat()
+    conn = get_connection()
+    line_ids = {}
+
+    for filename, entry in report['files'].items():
+        if entry.get('duplicate') or not entry.get('items'):
+            continue
+
+        ids = []
+        for item in entry['items']:
+            values = [item.get(field) for field in LINE_FIELDS]
+            # Items fall back to the file's platform/type when the parser left them out
+            values[0] = values[0] or entry.get('platform')
+            values[2] = values[2] or entry.get('invoice_type')
+            cursor = conn.execute(
+                f'''INSERT INTO line_items (batch_id, filename, amount_satang, created_at, {', '.join(LINE_FIELDS)})
+                    VALUES (?, ?, ?, ?, {', '.join('?' * len(LINE_FIELDS))})''',
+                [report['batch_id'], filename, amount_to_satang(item.get('amount', 0)), now]
+                + [str(value) if value is not None else None for value in values]
+            )
+            ids.append(cursor.lastrowid)
+        line_ids[filename] = ids
+
+    conn.commit()
+    return line_ids
+
+
+def iter_line_items(after_id: int = 0) -> Iterator[Dict[str, Any]]:
+    """Stored line items with id > after_id, in id order"""
+    cursor = get_connection().execute(
+        'SELECT * FROM line_items WHERE id > ? ORDER BY id', (after_id,)
+    )
+    for row in cursor:
+        yield dict(row)
+
+
+def get_line_items(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """{id: line item} for the given ids"""
+    ids = list(ids)
+    items = {}
+    # SQLite limits host parameters per statement
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        rows = get_connection().execute(
+            f'SELECT * FROM line_items WHERE id IN ({placeholders})', chunk
+        ).fetchall()
+        items.update((row['id'], dict(row)) for row in rows)
+    return items
+
+
+if __name__ == "__main__":
+    connection = get_connection()
+    for row in connection.execute(
+            '''SELECT platform, COUNT(*) AS lines, SUM(amount_satang) AS total
+               FROM line_items GROUP BY platform''').fetchall():
+        print(f"{row['platform']}: {row['lines']} lines, {(row['total'] or 0) / 100:,.2f} THB")
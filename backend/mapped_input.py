@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped input for batch runs over invoice folders
+Each input file is mapped once. It is hashed, probed and handed to the
+parse step from the mapping (buffer()); the input path is not opened again
+and the file is never copied into a Python bytes object. A background
+thread maps the next files ahead of the one being processed and asks the
+kernel to read them in (madvise WILLNEED). On a network-mounted archive the
+next files are then already in the page cache when their turn comes.
+
+Configuration (environment):
+    BATCH_PREFETCH_FILES   files mapped and prefetched ahead (default 8)
+"""
+
+import hashlib
+import mmap
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, Optional
+
+BATCH_PREFETCH_FILES = int(os.environ.get('BATCH_PREFETCH_FILES', '8'))
+
+# Hash in slices so a multi-GB mapping is never turned into one bytes object
+HASH_CHUNK = 8 * 1024 * 1024
+
+
+class MappedFile:
+    """Read-only mapping of one input file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.filename = os.path.basename(path)
+        self.map: Optional[mmap.mmap] = None
+        self._views = []
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size:  # empty files cannot be mapped
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def prefetch(self) -> None:
+        """Start reading the whole file in; returns without waiting for it"""
+        if self.map is not None and hasattr(self.map, 'madvise'):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+            self.map.madvise(mmap.MADV_WILLNEED)
+
+    def sha256(self) -> str:
+        digest = hashlib.sha256()
+        if self.map is not None:
+            view = memoryview(self.map)
+            try:
+                for start in range(0, self.size, HASH_CHUNK):
+                    digest.update(view[start:start + HASH_CHUNK])
+            finally:
+                view.release()
+        return digest.hexdigest()
+
+    def buffer(self) -> memoryview:
+        """The file's bytes as a view of the mapping, without copying; valid until close()"""
+        view = memoryview(self.map) if self.map is not None else memoryview(b'')
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        # A mapping cannot be closed while views of it are alive
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_mapped(paths: Iterable[str], ahead: int = BATCH_PREFETCH_FILES) -> Iterator[MappedFile]:
+    """
+    Yield a MappedFile per path, in order, while the next ones are mapped and
+    prefetched on a background thread; the caller closes each file
+
+    A file that cannot be opened is yielded as the OSError instead.
+    """
+    ready = queue.Queue(maxsize=max(1, ahead))
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def prefetcher():
+        for path in paths:
+            try:
+                mapped = MappedFile(path)
+                mapped.prefetch()
+            except OSError as e:
+                mapped = e
+            if not put(mapped):
+                if isinstance(mapped, MappedFile):
+                    mapped.close()
+                return
+        put(done)
+
+    thread = threading.Thread(target=prefetcher, daemon=True, name='prefetch')
+    thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        # Stopped early: release whatever was mapped ahead
+        stop.set()
+        thread.join()
+        while not ready.empty():
+            item = ready.get_nowait()
+            if isinstance(item, MappedFile):
+                item.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Usage: python mapped_input.py <invoice_dir>")
+        sys.exit(1)
+
+    folder = sys.argv[1]
+    files = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith('.pdf'))
+    start = time.perf_counter()
+    total = 0
+    for mapped in iter_mapped(files):
+        if isinstance(mapped, OSError):
+            print(f"Error reading: {mapped}")
+            continue
+        with mapped:
+            mapped.sha256()
+            total += mapped.size
+    seconds = time.perf_counter() - start
+    print(f"Hashed {len(files)} files, {total / 1024 / 1024:.1f} MB in {seconds:.2f} s "
+          f"({total / 1024 / 1024 / max(seconds, 1e-9):.0f} MB/s)")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Parsed-file cache keyed by content hash
+The client hashes its PDFs (SHA-256), asks which hashes are already known
+and uploads only the rest. The report is assembled from cached entries and
+freshly parsed files. Entries are keyed by hash and by the serving parser
+set, so switching a parser variant or bumping CACHE_VERSION invalidates them.
+
+Entries are also kept per scope: the client that uploaded the file (the
+random id the web client sends as X-Client-Id, else its address) or, for
+the batch scripts, the local scope. Knowing a file's hash is not enough to
+read another client's parsed invoice.
+
+Configuration (environment):
+    PARSE_CACHE_ENABLED   0 disables lookups and writes (default 1)
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, List, Any, Optional
+
+from invoice_store import get_connection
+from parser_registry import SERVING_PARSERS, LAYOUT_PARSERS
+
+PARSE_CACHE_ENABLED = os.environ.get('PARSE_CACHE_ENABLED', '1') == '1'
+
+# Bump when processing changes in a way that alters report entries
+CACHE_VERSION = 1
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+CLIENT_ID_HEADER = 'X-Client-Id'
+CLIENT_ID_PATTERN = re.compile(r'^[0-9A-Za-z-]{16,128}$')
+
+# Files parsed from the server's own folders (pipeline.process_folder)
+LOCAL_SCOPE = 'local'
+
+# Hashes accepted per known-hashes request
+MAX_HASHES_PER_REQUEST = 5000
+
+# SQLite limits host parameters per statement
+QUERY_CHUNK = 500
+
+
+def parser_key() -> str:
+    """Identifies the parser set that produced a cached entry"""
+    serving = ','.join(f"{platform}:{variant}" for platform, variant in sorted(SERVING_PARSERS.items()))
+    layout = ','.join(f"{platform}:{variant}" for platform, variant in sorted(LAYOUT_PARSERS.items()))
+    return f"v{CACHE_VERSION}|{serving}|{layout}"
+
+
+def cache_scope(client_id: Optional[str], address: str) -> str:
+    """Scope for a client's cache entries: its client id when it sends one, else its address"""
+    if client_id and CLIENT_ID_PATTERN.match(client_id):
+        # Only a digest is stored; the id itself is what grants access
+        return f"client:{hashlib.sha256(client_id.encode()).hexdigest()}"
+    return f"address:{address}"
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_hashes(hashes: Iterable[Any]) -> List[str]:
+    """Lower-case, drop anything that is not a hex SHA-256, keep order, de-duplicate"""
+    seen = set()
+    result = []
+    for value in hashes:
+        if not isinstance(value, str):
+            continue
+        value = value.strip().lower()
+        if SHA256_PATTERN.match(value) and value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+
+def _chunks(values: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(values), QUERY_CHUNK):
+        yield values[start:start + QUERY_CHUNK]
+
+
+def find_known_hashes(hashes: List[str], scope: str) -> List[str]:
+    """Subset of hashes with a cached entry in scope for the current parser set"""
+    if not PARSE_CACHE_ENABLED or not hashes:
+        return []
+
+    conn = get_connection()
+    key = parser_key()
+    known = set()
+    for chunk in _chunks(hashes):
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(
+            f'''SELECT sha256 FROM cached_files
+                WHERE scope = ? AND parser_key = ? AND sha256 IN ({placeholders})''',
+            [scope, key] + chunk
+        ).fetchall()
+        known.update(row['sha256'] for row in rows)
+
+    return [value for value in hashes if value in known]
+
+
+def get_cached_entries(hashes: List[str], scope: str) -> Dict[str, Dict[str, Any]]:
+    """{sha256: report entry} for the hashes that are cached in scope"""
+    if not PARSE_CACHE_ENABLED or not hashes:
+        return {}
+
+    conn = get_connection()
+    key = parser_key()
+    entries = {}
+    for chunk in _chunks(hashes):
+        placeholders = ','.join('?' * len(chunk))
+        rows = conn.execute(
+            f'''SELECT sha256, entry_json FROM cached_files
+                WHERE scope = ? AND parser_key = ? AND sha256 IN ({placeholders})''',
+            [scope, key] + chunk
+        ).fetchall()
+        for row in rows:
+            entries[row['sha256']] = json.loads(row['entry_json'])
+
+    if entries:
+        placeholders = ','.join('?' * len(entries))
+        conn.execute(
+            f'''UPDATE cached_files SET last_used_at = ?
+                WHERE scope = ? AND parser_key = ? AND sha256 IN ({placeholders})''',
+            [datetime.now().isoformat(), scope, key] + list(entries)
+        )
+        conn.commit()
+
+    return entries
+
+
+def is_cacheable(entry: Dict[str, Any]) -> bool:
+    """Only clean results are cached - timeouts, crashes and fallbacks are retried next time"""
+    return bool(entry) and not entry.get('error') and entry.get('extraction_tier') is not None
+
+
+def store_entry(sha256: str, filename: str, entry: Dict[str, Any], scope: str) -> bool:
+    """Cache one parsed file in scope; returns False if the entry is not cacheable"""
+    if not PARSE_CACHE_ENABLED or not is_cacheable(entry):
+        return False
+
+    now = datetime.now().isoformat()
+    conn = get_connection()
+    conn.execute(
+        '''INSERT OR REPLACE INTO cached_files
+               (scope, sha256, parser_key, filename, entry_json, created_at, last_used_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (scope, sha256, parser_key(), filename, json.dumps(entry, ensure_ascii=False), now, now)
+    )
+    conn.commit()
+    return True
+
+
+if __name__ == "__main__":
+    connection = get_connection()
+    current = connection.execute('SELECT COUNT(*) FROM cached_files WHERE parser_key = ?',
+                                 (parser_key(),)).fetchone()[0]
+    stale = connection.execute('SELECT COUNT(*) FROM cached_files WHERE parser_key != ?',
+                               (parser_key(),)).fetchone()[0]
+    scopes = connection.execute('SELECT COUNT(DISTINCT scope) FROM cached_files').fetchone()[0]
+    print(f"Parser key: {parser_key()}")
+    print(f"Cached files: {current} current, {stale} from older parser sets, {scopes} scopes")
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Golden-output regression and performance harness for parser variants
+Runs every registered parser variant over the extracted-text corpus
+(text_corpus.py) and compares each file's records with its golden output:
+item count, total and field values, aligned as in shadow mode. Each run is
+also measured for wall time (best of a few untraced runs), peak traced
+memory and its live blocks: memory blocks allocated during the run that are
+still held when the parser returns, its records included (a tracemalloc
+snapshot diff). This is what a parse leaves behind, not how many
+allocations it made: tracemalloc, like sys.getallocatedblocks(), only sees
+blocks that are alive, and CPython has no allocation counter to read.
+
+    python parser_harness.py bless [platform] [variant] [--force]   golden outputs from a variant (serving by default)
+    python parser_harness.py run [platform] [--layout] [--output results.json]
+
+A variant is reported as promotable when it matches the golden output on
+every file and is not slower than the serving variant.
+
+Configuration (environment):
+    PARSER_GOLDEN_DIR   golden outputs (default <INVOICE_DATA_DIR>/golden)
+    HARNESS_REPEATS     untraced runs per file for wall time (default 3)
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from invoice_store import DATA_DIR
+from parser_registry import PARSER_VARIANTS, SERVING_PARSERS, list_variants, parser_takes_path, run_parser
+from shadow_mode import compare_records
+from text_corpus import corpus_paths, load_document, load_index
+
+PARSER_GOLDEN_DIR = os.environ.get('PARSER_GOLDEN_DIR', os.path.join(DATA_DIR, 'golden'))
+HARNESS_REPEATS = int(os.environ.get('HARNESS_REPEATS', '3'))
+
+# Not slower than serving by more than this to be promotable
+PROMOTION_SLOWDOWN = 1.1
+
+
+def golden_path(sha256: str) -> str:
+    return os.path.join(PARSER_GOLDEN_DIR, f"{sha256}.json")
+
+
+def load_golden(sha256: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(golden_path(sha256), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def corpus_files(platform: str = None) -> List[Dict[str, Any]]:
+    """Corpus index entries (with their filename) for platforms that have parsers"""
+    return [{'filename': filename, **info} for filename, info in sorted(load_index().items())
+            if info['platform'] in PARSER_VARIANTS and (platform is None or info['platform'] == platform)]
+
+
+def document_text(document, layout: bool) -> str:
+    if layout:
+        from layout_extraction import extract_layout_text
+        return extract_layout_text(document)
+    return ''.join(page.get_text() for page in document)
+
+
+def path_modules(variants: List[tuple]) -> List[str]:
+    """Modules of path-taking variants, whose fitz the replay points at the corpus"""
+    return sorted({PARSER_VARIANTS[platform][variant][0] for platform, variant in variants
+                   if parser_takes_path(platform, variant)})
+
+
+def measure(platform: str, variant: str, text: str, filename: str, pdf_path: str) -> Dict[str, Any]:
+    """Records, best wall time of the untraced runs, then peak memory and live blocks of a traced run"""
+    best = None
+    records = []
+    for _ in range(max(1, HARNESS_REPEATS)):
+        start = time.perf_counter()
+        records = run_parser(platform, text, filename, pdf_path, variant=variant)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        # The snapshot itself is traced; peak counts only what the run adds
+        baseline, _ = tracemalloc.get_traced_memory()
+        traced_records = run_parser(platform, text, filename, pdf_path, variant=variant)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        # Blocks the run added and still holds (records, caches): tracemalloc
+        # only sees blocks alive at snapshot time, not allocations already freed
+        after = tracemalloc.take_snapshot()
+        untraced = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        live_blocks = sum(stat.count_diff for stat in after.filter_traces(untraced).compare_to(
+            before.filter_traces(untraced), 'lineno') if stat.count_diff > 0)
+        del traced_records
+    finally:
+        tracemalloc.stop()
+
+    return {'records': records, 'seconds': best, 'peak_kb': peak / 1024, 'live_blocks': live_blocks}
+
+
+def bless(platform: str = None, variant: str = None, force: bool = False) -> int:
+    """Write golden outputs from a variant's current output - returns files written"""
+    os.makedirs(PARSER_GOLDEN_DIR, exist_ok=True)
+    files = [info for info in corpus_files(platform) if force or load_golden(info['sha256']) is None]
+    documents = {info['sha256']: load_document(info['sha256']) for info in files}
+    variants = {(info['platform'], variant or SERVING_PARSERS[info['platform']]) for info in files}
+
+    written = 0
+    with corpus_paths(list(documents.values()), path_modules(sorted(variants))) as paths:
+        for info in files:
+            blessed_variant = variant or SERVING_PARSERS[info['platform']]
+            records = run_parser(info['platform'], document_text(documents[info['sha256']], False),
+                                 info['filename'], paths[info['sha256']], variant=blessed_variant)
+            with open(golden_path(info['sha256']), 'w', encoding='utf-8') as f:
+                json.dump({
+                    'filename': info['filename'],
+                    'platform': info['platform'],
+                    'variant': blessed_variant,
+                    'blessed_at': datetime.now().isoformat(),
+                    'records': records
+                }, f, ensure_ascii=False, indent=1)
+            written += 1
+    return written
+
+
+def run(platform: str = None, layout: bool = False) -> Dict[str, Any]:
+    """Every variant over every golden file of its platform: per-file results and per-variant summary"""
+    files = [info for info in corpus_files(platform) if load_golden(info['sha256']) is not None]
+    documents = {info['sha256']: load_document(info['sha256']) for info in files}
+    variants = [(p, v) for p, v in list_variants(platform) if p in {info['platform'] for info in files}]
+
+    per_file = []
+    with corpus_paths(list(documents.values()), path_modules(variants)) as paths:
+        for info in files:
+            golden = load_golden(info['sha256'])
+            text = document_text(documents[info['sha256']], layout)
+            for file_platform, variant in variants:
+                if file_platform != info['platform']:
+                    continue
+                result = {'filename': info['filename'], 'platform': file_platform, 'variant': variant}
+                try:
+                    measured = measure(file_platform, variant, text, info['filename'], paths[info['sha256']])
+                except Exception as e:
+                    per_file.append({**result, 'error': f"{type(e).__name__}: {e}"})
+                    continue
+                comparison = compare_records(golden['records'], measured.pop('records'))
+                exact = (comparison['serving_items'] == comparison['candidate_items']
+                         and comparison['serving_total'] == comparison['candidate_total']
+                         and comparison['field_diffs'] == 0)
+                per_file.append({**result, **measured, 'exact': exact, 'comparison': comparison, 'error': None})
+
+    return {'generated_at': datetime.now().isoformat(), 'layout': layout,
+            'summary': summarize(per_file), 'files': per_file}
+
+
+def summarize(per_file: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Correctness and cost per variant, with the promotion verdict"""
+    rows = {}
+    for result in per_file:
+        row = rows.setdefault((result['platform'], result['variant']), {
+            'platform': result['platform'], 'variant': result['variant'],
+            'serving': SERVING_PARSERS.get(result['platform']) == result['variant'],
+            'files': 0, 'exact': 0, 'total_mismatches': 0, 'field_diffs': 0, 'errors': 0,
+            'seconds': 0.0, 'max_peak_kb': 0.0, 'live_blocks': 0
+        })
+        row['files'] += 1
+        if result['error']:
+            row['errors'] += 1
+            continue
+        comparison = result['comparison']
+        row['exact'] += result['exact']
+        row['total_mismatches'] += comparison['serving_total'] != comparison['candidate_total']
+        row['field_diffs'] += comparison['field_diffs']
+        row['seconds'] += result['seconds']
+        row['max_peak_kb'] = max(row['max_peak_kb'], result['peak_kb'])
+        row['live_blocks'] += result['live_blocks']
+
+    serving_seconds = {row['platform']: row['seconds'] for row in rows.values() if row['serving']}
+    for row in rows.values():
+        baseline = serving_seconds.get(row['platform'])
+        row['promotable'] = (not row['serving'] and row['errors'] == 0 and row['exact'] == row['files']
+                             and baseline is not None and row['seconds'] <= baseline * PROMOTION_SLOWDOWN)
+    return sorted(rows.values(), key=lambda row: (row['platform'], not row['serving'], row['variant']))
+
+
+def print_table(summary: List[Dict[str, Any]]) -> None:
+    print(f"{'PLATFORM':10s} {'VARIANT':14s} {'FILES':>5s} {'EXACT':>5s} {'TOTAL!=':>7s} {'FIELDS':>7s} "
+          f"{'ERR':>4s} {'TIME ms':>9s} {'PEAK KB':>9s} {'LIVE BLK':>8s}")
+    print("=" * 90)
+    for row in summary:
+        marker = ' (serving)' if row['serving'] else (' promotable' if row['promotable'] else '')
+        print(f"{row['platform']:10s} {row['variant']:14s} {row['files']:>5d} {row['exact']:>5d} "
+              f"{row['total_mismatches']:>7d} {row['field_diffs']:>7d} {row['errors']:>4d} "
+              f"{row['seconds'] * 1000:>9.1f} {row['max_peak_kb']:>9.0f} {row['live_blocks']:>8d}{marker}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    command = args.pop(0) if args else ''
+
+    def option(name: str) -> Optional[str]:
+        if name in args:
+            position = args.index(name)
+            value = args[position + 1] if position + 1 < len(args) else None
+            del args[position:position + 2]
+            return value
+        return None
+
+    if command == 'bless':
+        force = '--force' in args
+        args = [arg for arg in args if arg != '--force']
+        count = bless(args[0] if args else None, args[1] if len(args) > 1 else None, force)
+        print(f"Wrote {count} golden outputs to {PARSER_GOLDEN_DIR}")
+
+    elif command == 'run':
+        layout = '--layout' in args
+        args = [arg for arg in args if arg != '--layout']
+        output_path = option('--output')
+        results = run(args[0] if args else None, layout)
+        print_table(results['summary'])
+        for result in results['files']:
+            if result['error'] or not result['exact']:
+                detail = result['error'] or (f"items {result['comparison']['serving_items']}->"
+                                             f"{result['comparison']['candidate_items']}, "
+                                             f"{result['comparison']['field_diffs']} field diffs")
+                print(f"  {result['variant']:14s} {result['filename']:35s} {detail}")
+        if output_path:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=1)
+            print(f"Results written to {output_path}")
+
+    else:
+        print("Usage: python parser_harness.py bless [platform] [variant] [--force] | "
+              "run [platform] [--layout] [--output results.json]")
+        sys.exit(1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Parser registry - every parser variant in backend/ by platform and name
+Parsers are imported on first use, so importing the registry is cheap.
+"""
+
+import importlib
+import importlib.util
+import sys
+from typing import Callable, Dict, List, Any
+
+# variant name -> (module, function, takes_path)
+# takes_path: Google parsers re-open the PDF themselves, so they get the file path
+PARSER_VARIANTS = {
+    'Google': {
+        'professional': ('google_parser_professional', 'parse_google_invoice', True),
+        'complete': ('google_parser_complete', 'parse_google_invoice', True),
+        'fixed_final': ('google_parser_fixed_final', 'parse_google_invoice', True),
+        'final_fixed': ('google_parser_final_fixed', 'parse_google_invoice', True),
+        'v3': ('google_parser_v3', 'parse_google_invoice', True),
+    },
+    'Facebook': {
+        'complete': ('facebook_parser_complete', 'parse_facebook_invoice', False),
+        'fixed': ('facebook_parser_fixed', 'parse_facebook_invoice', False),
+        'enhanced_ap': ('facebook_parser_enhanced_ap', 'parse_facebook_invoice', False),
+    },
+    'TikTok': {
+        'v2': ('final_improved_tiktok_parser_v2', 'parse_tiktok_invoice_detailed', False),
+    }
+}
+
+# Parser used to serve requests (fast plain-text tier)
+SERVING_PARSERS = {
+    'Google': 'professional',
+    'Facebook': 'complete',
+    'TikTok': 'v2'
+}
+
+# Parser used for the layout tier; platforms not listed re-run the serving
+# parser on text rebuilt from word positions
+LAYOUT_PARSERS = {
+    'Google': 'final_fixed'
+}
+
+_loaded_parsers: Dict[tuple, Callable] = {}
+
+
+def get_parser(platform: str, variant: str = None) -> Callable:
+    """Return the parse function for a platform variant (serving parser by default)"""
+    if variant is None:
+        variant = SERVING_PARSERS[platform]
+
+    key = (platform, variant)
+    if key not in _loaded_parsers:
+        module_name, function_name, _ = PARSER_VARIANTS[platform][variant]
+        module = importlib.import_module(module_name)
+        _loaded_parsers[key] = getattr(module, function_name)
+
+    return _loaded_parsers[key]
+
+
+def parser_available(platform: str, variant: str = None) -> bool:
+    """Whether the variant's module can be found - does not import it"""
+    if variant is None:
+        variant = SERVING_PARSERS[platform]
+    module_name = PARSER_VARIANTS[platform][variant][0]
+    return module_name in sys.modules or importlib.util.find_spec(module_name) is not None
+
+
+def serving_modules() -> List[str]:
+    """Modules of the serving and layout parsers (what a warm worker needs)"""
+    variants = list(SERVING_PARSERS.items()) + list(LAYOUT_PARSERS.items())
+    return sorted({PARSER_VARIANTS[platform][variant][0] for platform, variant in variants})
+
+
+def platform_takes_path(platform: str) -> bool:
+    """Whether the platform's serving or layout parser needs the PDF path"""
+    if platform not in SERVING_PARSERS:
+        return False
+    variants = [SERVING_PARSERS[platform], LAYOUT_PARSERS.get(platform, SERVING_PARSERS[platform])]
+    return any(parser_takes_path(platform, variant) for variant in variants)
+
+
+def parser_takes_path(platform: str, variant: str = None) -> bool:
+    """Whether the variant expects the PDF path instead of the display filename"""
+    if variant is None:
+        variant = SERVING_PARSERS[platform]
+    return PARSER_VARIANTS[platform][variant][2]
+
+
+def run_parser(platform: str, text_content: str, filename: str, pdf_path: str,
+               variant: str = None) -> List[Dict[str, Any]]:
+    """Run a parser variant with the right filename/path argument"""
+    if platform not in PARSER_VARIANTS:
+        return []
+
+    parser = get_parser(platform, variant)
+    target = pdf_path if parser_takes_path(platform, variant) else filename
+    return parser(text_content, target)
+
+
+def list_variants(platform: str = None) -> List[tuple]:
+    """List (platform, variant) pairs, optionally for a single platform"""
+    platforms = [platform] if platform else list(PARSER_VARIANTS)
+    return [(p, v) for p in platforms for v in PARSER_VARIANTS.get(p, {})]
+
+
+if __name__ == "__main__":
+    for platform, variant in list_variants():
+        marker = ' (serving)' if SERVING_PARSERS.get(platform) == variant else ''
+        print(f"{platform:10s} {variant}{marker}")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Hand-off of in-memory PDFs (ZIP members) to worker processes
+Sending PDF bytes through the worker pipe pickles them: a second copy in the
+web worker while the message is built and a third in the parsing worker.
+Large payloads are instead written once to a spool file in shared memory
+(/dev/shm when available), and the worker gets its path. MuPDF opens the
+file itself, so the bytes are never pickled or copied into Python objects in
+the worker. Google parsers, which re-open the PDF by path, use the spool file
+directly instead of writing their own temp file.
+
+Folder batches hand over views of memory-mapped input files (mapped_input)
+the same way: large ones are written to the spool straight from the
+mapping and small ones are copied to bytes once, for the pipe.
+
+Shared memory segments (multiprocessing.shared_memory) would still need a
+copy on the worker side: fitz.open(stream=...) accepts bytes but not a
+memoryview.
+
+A spool file is deleted as soon as its result is back from the worker.
+Files left behind by a web worker that died are removed the next time
+another process starts spooling.
+
+Configuration (environment):
+    PDF_SPOOL_DIR         spool directory (default /dev/shm, else the temp dir)
+    PDF_SPOOL_MIN_BYTES   smaller PDFs are sent through the pipe (default 262144)
+"""
+
+import glob
+import os
+import tempfile
+import threading
+from typing import Callable, Tuple, Union
+
+PdfBuffer = Union[bytes, bytearray, memoryview]
+
+PDF_SPOOL_MIN_BYTES = int(os.environ.get('PDF_SPOOL_MIN_BYTES', str(256 * 1024)))
+
+
+def _default_spool_dir() -> str:
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+PDF_SPOOL_DIR = os.environ.get('PDF_SPOOL_DIR') or _default_spool_dir()
+SPOOL_PREFIX = 'invoice_spool_'
+
+_swept_pid = None
+_sweep_lock = threading.Lock()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def sweep_orphans() -> int:
+    """Remove spool files of processes that no longer exist - returns files removed"""
+    removed = 0
+    for path in glob.glob(os.path.join(PDF_SPOOL_DIR, f"{SPOOL_PREFIX}*")):
+        try:
+            pid = int(os.path.basename(path)[len(SPOOL_PREFIX):].split('_', 1)[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _pid_alive(pid):
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def spool_pdf(pdf_bytes: PdfBuffer, filename: str) -> str:
+    """Write PDF bytes (or a view of them) to a spool file named after the invoice - returns its path"""
+    global _swept_pid
+    with _sweep_lock:
+        if _swept_pid != os.getpid():
+            sweep_orphans()
+            _swept_pid = os.getpid()
+
+    # Parsers read the invoice number from the filename, so keep it in the spool name
+    with tempfile.NamedTemporaryFile(dir=PDF_SPOOL_DIR, delete=False,
+                                     prefix=f"{SPOOL_PREFIX}{os.getpid()}_",
+                                     suffix=f"_{os.path.basename(filename)}") as spool:
+        spool.write(pdf_bytes)
+        return spool.name
+
+
+def release(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def hand_off(args: tuple) -> Tuple[tuple, Callable[[], None]]:
+    """
+    (pdf_source, filename) pool task -> task to send to a worker process, and
+    the function that frees what was spooled for it once its result is back
+    """
+    pdf_source, filename = args[0], args[1]
+    if not isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return args, lambda: None
+    if len(pdf_source) < PDF_SPOOL_MIN_BYTES:
+        if isinstance(pdf_source, memoryview):
+            # Views cannot be pickled; small files are copied once for the pipe
+            return (pdf_source.tobytes(), filename) + tuple(args[2:]), lambda: None
+        return args, lambda: None
+
+    path = spool_pdf(pdf_source, filename)
+    return (path, filename) + tuple(args[2:]), lambda: release(path)
+
+
+if __name__ == "__main__":
+    leftover = glob.glob(os.path.join(PDF_SPOOL_DIR, f"{SPOOL_PREFIX}*"))
+    print(f"Spool directory: {PDF_SPOOL_DIR} ({len(leftover)} files)")
+    print(f"Removed {sweep_orphans()} orphaned spool files")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Staged batch pipeline shared by the API and the batch CLI
+Each file goes through three stages that overlap across files:
+
+    prepare   I/O threads       receive / spool, hash, cache lookup, probe
+    parse     worker processes  extract and parse (worker_pool.SupervisedPool);
+                                large in-memory and mapped PDFs are handed over by pdf_spool
+    persist   one I/O thread    cache and timing writes as each result returns
+
+The API, pipeline.py on the command line and the batch scripts
+(process_invoice_07.py, generate_updated_report.py) all run files through
+it; process_folder is the folder entry point for the scripts.
+
+Stages are connected by bounded queues. At most lookahead files are between
+being read and being persisted, and parsing workers block handing results to
+a persist stage that has fallen behind. A slow disk therefore overlaps with
+parsing instead of adding to it, and memory stays bounded.
+
+Results come back in input order whatever order files finish in.
+
+Configuration (environment):
+    PIPELINE_IO_THREADS     threads for the prepare stage (default 4)
+    PIPELINE_PERSIST_QUEUE  results waiting to be persisted (default 16)
+"""
+
+import contextvars
+import logging
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Any, Optional, Tuple
+
+from batch_scheduler import SCHEDULER_LOOKAHEAD
+from pdf_spool import hand_off
+from worker_pool import SupervisedPool, STATUS_ERROR
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_IO_THREADS = int(os.environ.get('PIPELINE_IO_THREADS', '4'))
+PIPELINE_PERSIST_QUEUE = int(os.environ.get('PIPELINE_PERSIST_QUEUE', '16'))
+
+# prepare(item) -> (context, pool task args or None when nothing needs parsing, estimated seconds)
+Prepare = Callable[[Any], Tuple[Any, Optional[tuple], Optional[float]]]
+# persist(context, outcome) for every file that went through the parse stage
+Persist = Callable[[Any, Dict[str, Any]], None]
+
+
+class BatchPipeline:
+    """prepare -> parse -> persist over a stream of items, results in input order"""
+
+    def __init__(self, pool: SupervisedPool, prepare: Prepare, persist: Persist = None,
+                 io_threads: int = PIPELINE_IO_THREADS, lookahead: int = SCHEDULER_LOOKAHEAD,
+                 persist_queue: int = PIPELINE_PERSIST_QUEUE):
+        self.pool = pool
+        self.prepare = prepare
+        self.persist = persist
+        self.io_threads = max(1, io_threads)
+        self.lookahead = max(1, lookahead)
+        self.persist_queue = max(1, persist_queue)
+
+    def run(self, items: Iterable[Any]) -> List[Tuple[Any, Optional[Dict[str, Any]]]]:
+        """
+        (context, outcome) per item, in input order; outcome is None for items
+        prepare settled without parsing (e.g. cache hits)
+
+        items may be a generator; it is consumed on the calling thread, so
+        reading the next upload or ZIP member overlaps with the stages.
+        When prepare raises, the context is the item itself and the outcome an error.
+        """
+        results: List[Optional[Tuple[Any, Optional[Dict[str, Any]]]]] = []
+        window = threading.BoundedSemaphore(self.lookahead)
+        finished = threading.Semaphore(0)
+        to_persist = queue.Queue(maxsize=self.persist_queue)
+
+        def persist_loop():
+            while True:
+                entry = to_persist.get()
+                if entry is None:
+                    break
+                index, context, outcome, parsed = entry
+                if self.persist is not None and parsed:
+                    try:
+                        self.persist(context, outcome)
+                    except Exception:
+                        logger.exception("Error persisting result")
+                results[index] = (context, outcome)
+                window.release()
+                finished.release()
+
+        def prepare_and_submit(index, item):
+            try:
+                context, args, cost = self.prepare(item)
+                if args is not None:
+                    release = lambda: None
+                    if self.pool.size > 0:
+                        # Large in-memory or mapped PDFs go to the worker as a shared-memory spool file
+                        args, release = hand_off(args)
+
+                    def done(outcome):
+                        release()
+                        to_persist.put((index, context, outcome, True))
+                    self.pool.submit(args, done, cost)
+                    return
+                outcome = None
+            except Exception as e:
+                logger.warning("Error preparing file: %s", e)
+                context, outcome = item, {
+                    'status': STATUS_ERROR,
+                    'result': {'type': type(e).__name__, 'message': str(e),
+                               'traceback': traceback.format_exc()},
+                    'seconds': 0
+                }
+            to_persist.put((index, context, outcome, False))
+
+        # Stage threads log with the caller's request id (see app_logging)
+        persister = threading.Thread(target=contextvars.copy_context().run, args=(persist_loop,), daemon=True)
+        persister.start()
+        submitted = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.io_threads) as executor:
+                try:
+                    for index, item in enumerate(items):
+                        window.acquire()
+                        results.append(None)
+                        executor.submit(contextvars.copy_context().run, prepare_and_submit, index, item)
+                        submitted += 1
+                finally:
+                    # Even when reading the input fails, let submitted files finish
+                    for _ in range(submitted):
+                        finished.acquire()
+        finally:
+            to_persist.put(None)
+            persister.join()
+
+        return results
+
+
+def process_folder(invoice_dir: str, invoice_set: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Report for every PDF in a folder, through the same pipeline, pool, parse
+    cache and cost model as the API - for the batch scripts
+
+    Stops the process-wide worker pool when done; callers must run under
+    if __name__ == "__main__", as the workers re-import the main module.
+    """
+    from cost_model import record_timings
+    from invoice_processing import (
+        create_report, create_cached_entry, create_error_entry, add_file_to_report, finalize_report
+    )
+    from batch_scheduler import probe_pdf, predict_seconds
+    from mapped_input import iter_mapped
+    from parse_cache import get_cached_entries, store_entry, LOCAL_SCOPE
+    from worker_pool import get_invoice_pool, shutdown_invoice_pool
+
+    filenames = sorted(name for name in os.listdir(invoice_dir) if name.lower().endswith('.pdf'))
+
+    def prepare_file(mapped):
+        """
+        Hash, probe and hand over from the mapping; files parsed before (e.g. a
+        re-run backfill) come from the parse cache
+
+        The mapping stays open until the file's result is persisted, as the
+        parse step reads from it (see pdf_spool.hand_off).
+        """
+        if isinstance(mapped, OSError):
+            raise mapped
+        try:
+            context = {'filename': mapped.filename, 'sha256': mapped.sha256()}
+            context['cached'] = get_cached_entries([context['sha256']], LOCAL_SCOPE).get(context['sha256'])
+            if context['cached'] is not None:
+                mapped.close()
+                return context, None, None
+            source = mapped.buffer()
+            context['probe'] = probe_pdf(source)
+        except Exception:
+            mapped.close()
+            raise
+        context['mapped'] = mapped
+        return context, (source, mapped.filename), predict_seconds(mapped.filename, context['probe'])
+
+    def persist_result(context, outcome):
+        context.pop('mapped').close()
+        if outcome['status'] == 'ok':
+            store_entry(context['sha256'], context['filename'], outcome['result'], LOCAL_SCOPE)
+        record_timings([(context['filename'], context['probe'], outcome)])
+
+    try:
+        paths = (os.path.join(invoice_dir, filename) for filename in filenames)
+        results = BatchPipeline(get_invoice_pool(), prepare_file, persist_result).run(iter_mapped(paths))
+    finally:
+        shutdown_invoice_pool()
+
+    report = create_report(len(filenames))
+    if invoice_set:
+        report['invoice_set'] = invoice_set
+    for filename, (context, outcome) in zip(filenames, results):
+        if outcome is None:
+            entry = create_cached_entry(filename, context['cached'])
+        elif outcome['status'] == 'ok':
+            entry = outcome['result']
+        else:
+            logger.warning("Error processing %s: %s", filename, outcome['result'].get('message'))
+            entry = create_error_entry(filename, outcome['result'])
+        add_file_to_report(report, filename, entry)
+    return finalize_report(report)
+
+
+if __name__ == "__main__":
+    # Batch CLI: run a folder of invoices through the same pipeline as the API
+    import json
+    import sys
+    import time
+    from datetime import datetime
+
+    if len(sys.argv) < 2:
+        print("Usage: python pipeline.py <invoice_dir> [report.json]")
+        sys.exit(1)
+
+    from app_logging import configure_logging
+
+    configure_logging()
+    output_path = sys.argv[2] if len(sys.argv) > 2 else f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+    start = time.perf_counter()
+    report = process_folder(sys.argv[1])
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    overall = report['summary']['overall']
+    print(f"Processed {overall['files_processed']} files in {time.perf_counter() - start:.1f} s "
+          f"-> {output_path}")
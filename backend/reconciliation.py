@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Reconciliation of parsed line items against the printed invoice total
+Runs for every file regardless of platform:
+1. Pull the printed total once from a clipped region around the total label
+2. Sum the parsed line items in satang (integer math, no float drift)
+3. Report matched / mismatch / no_items / unverified
+"""
+
+import os
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, List, Any, Optional
+
+# Allowed difference between items and printed total, in satang (1/100 THB):
+# per-line rounding on the invoice can leave the sum a few satang off
+TOLERANCE_SATANG = int(os.environ.get('RECONCILE_TOLERANCE_SATANG', '100'))
+
+# Where each platform prints its invoice total
+# pages: which pages to search, in order; labels: text next to the amount
+TOTAL_REGIONS = {
+    'Google': {
+        'pages': [0],
+        'labels': ['ยอดเงินครบกำหนด', 'Amount due', 'ยอดรวมในสกุลเงิน THB']
+    },
+    'Facebook': {
+        'pages': [0, -1],
+        'labels': ['Total Amount Due', 'Amount Due', 'ยอดที่ต้องชำระ']
+    },
+    'TikTok': {
+        'pages': [0, -1],
+        'labels': ['Total Amount Due', 'Total in THB']
+    }
+}
+
+# Height of the clip below the label (amounts are printed on the same line or the next one)
+CLIP_HEIGHT = 40
+
+AMOUNT_PATTERN = re.compile(r'(-?)\s*฿?\s*(\d{1,3}(?:,\d{3})*|\d+)\.(\d{2})(?!\d)')
+
+STATUS_MATCHED = 'matched'
+STATUS_MISMATCH = 'mismatch'
+STATUS_NO_ITEMS = 'no_items'
+STATUS_UNVERIFIED = 'unverified'
+
+
+def parse_amount_satang(text: str) -> Optional[int]:
+    """Parse the first printed amount in text (e.g. '-฿1,234.56') into satang"""
+    match = AMOUNT_PATTERN.search(text)
+    if not match:
+        return None
+
+    sign, baht, satang = match.groups()
+    value = int(baht.replace(',', '')) * 100 + int(satang)
+    return -value if sign else value
+
+
+def amount_to_satang(amount: Any) -> int:
+    """Convert a parsed amount (float, int or string) to satang without float drift"""
+    if amount is None:
+        return 0
+
+    if isinstance(amount, str):
+        parsed = parse_amount_satang(amount)
+        return parsed if parsed is not None else 0
+
+    try:
+        value = Decimal(str(amount)) * 100
+    except InvalidOperation:
+        return 0
+    return int(value.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def satang_to_amount(satang: Optional[int]) -> Optional[float]:
+    """Convert satang back to a THB amount for the JSON report"""
+    if satang is None:
+        return None
+    return round(satang / 100, 2)
+
+
+def extract_printed_total(doc, platform: str) -> Optional[int]:
+    """
+    Extract the printed invoice total (in satang) from a clipped region
+
+    Only the band to the right of / below the total label is read,
+    so the rest of the page is never re-extracted.
+    """
+    region = TOTAL_REGIONS.get(platform)
+    if not region or len(doc) == 0:
+        return None
+
+    searched = set()
+    for page_index in region['pages']:
+        page_number = page_index if page_index >= 0 else len(doc) + page_index
+        if page_number in searched or not 0 <= page_number < len(doc):
+            continue
+        searched.add(page_number)
+
+        page = doc[page_number]
+        for label in region['labels']:
+            for label_rect in page.search_for(label):
+                clip = (label_rect.x0, label_rect.y0 - 2,
+                        page.rect.x1, min(page.rect.y1, label_rect.y1 + CLIP_HEIGHT))
+                total = parse_amount_satang(page.get_text('text', clip=clip).replace('\u200b', ''))
+                if total is not None:
+                    return total
+
+    return None
+
+
+def reconcile_items(records: List[Dict[str, Any]], printed_total: Optional[int],
+                    tolerance: int = None) -> Dict[str, Any]:
+    """Compare the summed line items with the printed total (both in satang)"""
+    if tolerance is None:
+        tolerance = TOLERANCE_SATANG
+
+    items_total = sum(amount_to_satang(record.get('amount', 0)) for record in records)
+
+    if not records:
+        status = STATUS_NO_ITEMS
+    elif printed_total is None:
+        status = STATUS_UNVERIFIED
+    elif abs(items_total - printed_total) <= tolerance:
+        status = STATUS_MATCHED
+    else:
+        status = STATUS_MISMATCH
+
+    difference = items_total - printed_total if printed_total is not None else None
+
+    return {
+        'status': status,
+        'items_total': satang_to_amount(items_total),
+        'printed_total': satang_to_amount(printed_total),
+        'difference': satang_to_amount(difference)
+    }
+
+
+def needs_escalation(reconciliation: Dict[str, Any]) -> bool:
+    """Whether the file should be escalated to the next (slower) extraction tier"""
+    return reconciliation['status'] in (STATUS_MISMATCH, STATUS_NO_ITEMS)
+
+
+if __name__ == "__main__":
+    print("Invoice reconciliation - line items vs printed total")
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Stored batch reports
+Each processed batch is saved by its batch_id so the client can fetch what
+it shows instead of the whole report at once:
+
+    summary only     no file or item rows are read
+    files page       page/limit over files in upload order
+    items page       item_page/item_limit within each file of the page
+    fields           projection of item fields, e.g. fields=amount,description
+
+A file's items are kept apart from its entry, so they are only decoded for
+the files on the requested page. The content hash stored with the report
+backs the strong ETags of GET /api/reports/<batch_id>.
+"""
+
+import hashlib
+import json
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+
+from invoice_store import get_connection
+
+DEFAULT_FILE_LIMIT = 50
+MAX_FILE_LIMIT = 500
+DEFAULT_ITEM_LIMIT = 100
+MAX_ITEM_LIMIT = 5000
+
+
+def store_report(report: Dict[str, Any]) -> None:
+    """Save a finalized report under its batch_id"""
+    summary_json = json.dumps(report['summary'], ensure_ascii=False)
+    content_hash = hashlib.sha256(summary_json.encode('utf-8'))
+
+    file_rows = []
+    for position, (filename, entry) in enumerate(report['files'].items()):
+        entry_json = json.dumps({key: value for key, value in entry.items() if key != 'items'},
+                                ensure_ascii=False)
+        items_json = json.dumps(entry.get('items', []), ensure_ascii=False)
+        for part in (filename, entry_json, items_json):
+            content_hash.update(part.encode('utf-8'))
+        file_rows.append((report['batch_id'], position, filename, len(entry.get('items', [])),
+                          entry_json, items_json))
+
+    conn = get_connection()
+    conn.execute(
+        '''INSERT OR REPLACE INTO reports (batch_id, generated_at, total_files, summary_json, content_hash)
+           VALUES (?, ?, ?, ?, ?)''',
+        (report['batch_id'], report['generated_at'], report['total_files'], summary_json,
+         content_hash.hexdigest())
+    )
+    conn.execute('DELETE FROM report_files WHERE batch_id = ?', (report['batch_id'],))
+    conn.executemany(
+        '''INSERT INTO report_files (batch_id, position, filename, items_count, entry_json, items_json)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        file_rows
+    )
+    conn.commit()
+
+
+def get_report_hash(batch_id: str) -> Optional[str]:
+    """Content hash of a stored report, None if there is no such report"""
+    row = get_connection().execute(
+        'SELECT content_hash FROM reports WHERE batch_id = ?', (batch_id,)
+    ).fetchone()
+    return row['content_hash'] if row else None
+
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """'amount, description' -> ['amount', 'description']; empty means all fields"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    return fields or None
+
+
+def get_report_summary(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Report header and summary without reading any file rows"""
+    row = get_connection().execute(
+        'SELECT batch_id, generated_at, total_files, summary_json FROM reports WHERE batch_id = ?',
+        (batch_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        'batch_id': row['batch_id'],
+        'generated_at': row['generated_at'],
+        'total_files': row['total_files'],
+        'summary': json.loads(row['summary_json'])
+    }
+
+
+def get_report_page(batch_id: str, page: int = 1, limit: int = DEFAULT_FILE_LIMIT,
+                    item_page: int = 1, item_limit: int = DEFAULT_ITEM_LIMIT,
+                    fields: Optional[List[str]] = None,
+                    include_summary: bool = True) -> Optional[Dict[str, Any]]:
+    """One page of files, each with one page of (projected) items"""
+    report = get_report_summary(batch_id)
+    if report is None:
+        return None
+    if not include_summary:
+        del report['summary']
+
+    page = max(1, page)
+    limit = max(1, min(limit, MAX_FILE_LIMIT))
+    item_page = max(1, item_page)
+    item_limit = max(0, min(item_limit, MAX_ITEM_LIMIT))
+
+    rows = get_connection().execute(
+        '''SELECT filename, items_count, entry_json, items_json FROM report_files
+           WHERE batch_id = ? ORDER BY position LIMIT ? OFFSET ?''',
+        (batch_id, limit, (page - 1) * limit)
+    ).fetchall()
+
+    files = {}
+    for row in rows:
+        entry = json.loads(row['entry_json'])
+        items = []
+        # item_limit=0 returns file entries only, without decoding any items
+        if item_limit > 0 and row['items_count'] > 0:
+            start = (item_page - 1) * item_limit
+            items = json.loads(row['items_json'])[start:start + item_limit]
+            if fields:
+                items = [{field: item.get(field) for field in fields} for item in items]
+        entry['items'] = items
+        entry['items_page'] = {'page': item_page, 'limit': item_limit, 'total': row['items_count']}
+        files[row['filename']] = entry
+
+    report['files'] = files
+    report['pagination'] = {
+        'page': page,
+        'limit': limit,
+        'total_files': report['total_files'],
+        'pages': (report['total_files'] + limit - 1) // limit
+    }
+    return report
+
+
+def iter_report_files(batch_id: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(filename, entry with items) for every file in upload order, one row decoded at a time"""
+    rows = get_connection().execute(
+        'SELECT filename, entry_json, items_json FROM report_files WHERE batch_id = ? ORDER BY position',
+        (batch_id,)
+    )
+    for row in rows:
+        yield row['filename'], {**json.loads(row['entry_json']), 'items': json.loads(row['items_json'])}
+
+
+def list_reports(limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent reports with their overall totals"""
+    rows = get_connection().execute(
+        'SELECT batch_id, generated_at, total_files, summary_json FROM reports ORDER BY generated_at DESC LIMIT ?',
+        (max(1, min(limit, 200)),)
+    ).fetchall()
+    return [{
+        'batch_id': row['batch_id'],
+        'generated_at': row['generated_at'],
+        'total_files': row['total_files'],
+        'overall': json.loads(row['summary_json']).get('overall')
+    } for row in rows]
+
+
+if __name__ == "__main__":
+    for stored in list_reports():
+        overall = stored['overall'] or {}
+        print(f"{stored['generated_at']}  {stored['batch_id']}  {stored['total_files']} files  "
+              f"{overall.get('total_amount', 0):,.2f}")
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Per-request profiling of invoice processing (admin only)
+POST /api/process-invoices?profile=1 with the admin token (see admin_auth)
+runs the request under cProfile and tracemalloc. The response then carries,
+next to the report, the functions with the most cumulative time and the
+lines that allocated the most, split by stage:
+
+    web process   prepare (save, hash, probe) and persist, over all files
+    worker        per file: extract, detect (platform and printed total),
+                  text_tier and layout_tier, tagged with the parser variant
+
+Profiled requests parse every uploaded file, even those in the parse cache,
+and do not record timings for the cost model. The profile is also saved as
+<PROFILE_DIR>/<batch_id>.json.
+
+Allocations are the per-line difference between tracemalloc snapshots
+taken around a stage, with the stage's peak traced memory. Worker stages run
+one after another; web stages overlap on the I/O threads, so web
+allocations are reported for the request as a whole.
+
+Configuration (environment):
+    PROFILE_TOP   functions and lines listed per stage (default 20)
+    PROFILE_DIR   saved profiles (default <INVOICE_DATA_DIR>/profiles)
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Any, Optional
+
+from invoice_store import DATA_DIR
+
+PROFILE_TOP = int(os.environ.get('PROFILE_TOP', '20'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+
+# The profiler's own snapshots are left out of allocation statistics
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+# Profiler of the file being processed on this thread (worker side)
+_local = threading.local()
+
+
+def top_functions(stats: pstats.Stats, limit: int = PROFILE_TOP) -> List[Dict[str, Any]]:
+    """Functions by cumulative time"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{
+        'function': f"{os.path.basename(filename)}:{line}({name})",
+        'calls': calls,
+        'primitive_calls': primitive_calls,
+        'total_seconds': round(total, 6),
+        'cumulative_seconds': round(cumulative, 6)
+    } for (filename, line, name), (primitive_calls, calls, total, cumulative, _) in rows]
+
+
+def top_lines(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot,
+              limit: int = PROFILE_TOP) -> List[Dict[str, Any]]:
+    """Lines by bytes allocated between the two snapshots"""
+    differences = after.filter_traces(_TRACE_FILTERS).compare_to(before.filter_traces(_TRACE_FILTERS), 'lineno')
+    rows = sorted((diff for diff in differences if diff.size_diff > 0),
+                  key=lambda diff: diff.size_diff, reverse=True)[:limit]
+    return [{
+        'line': f"{os.path.basename(diff.traceback[0].filename)}:{diff.traceback[0].lineno}",
+        'kb': round(diff.size_diff / 1024, 1),
+        'blocks': diff.count_diff
+    } for diff in rows]
+
+
+def _enable(profile: cProfile.Profile) -> bool:
+    """False when another profiler is active (Python 3.12+ allows one per process)"""
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+
+class StageProfiler:
+    """Stages of one file, run one after another on one thread"""
+
+    def __init__(self):
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str, parser: str = None):
+        profile = cProfile.Profile()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        profiled = _enable(profile)
+        try:
+            yield
+        finally:
+            if profiled:
+                profile.disable()
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            self.stages.append({
+                'stage': name,
+                'parser': parser,
+                'seconds': round(seconds, 6),
+                'peak_kb': round(peak / 1024, 1),
+                'functions': top_functions(pstats.Stats(profile)) if profiled else None,
+                'lines': top_lines(before, tracemalloc.take_snapshot())
+            })
+
+
+@contextmanager
+def profile_stage(name: str, parser: str = None):
+    """Profile the block when this thread is processing a profiled file, else do nothing"""
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name, parser):
+        yield
+
+
+def run_profiled(function: Callable, *args) -> tuple:
+    """function(*args) with its profile_stage blocks profiled - returns (result, stages)"""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    _local.profiler = StageProfiler()
+    try:
+        return function(*args), _local.profiler.stages
+    finally:
+        _local.profiler = None
+        if not tracing:
+            tracemalloc.stop()
+
+
+class RequestProfiler:
+    """Web-side stages of one request, called from several threads at once"""
+
+    def __init__(self):
+        self._profiles: Dict[str, List[cProfile.Profile]] = {}
+        self._calls: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self.files: List[Dict[str, Any]] = []
+        self._summary: Optional[Dict[str, Any]] = None
+
+        self._tracing = tracemalloc.is_tracing()
+        if not self._tracing:
+            tracemalloc.start()
+        self._before = tracemalloc.take_snapshot()
+        self._start = time.perf_counter()
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        """function, profiled as stage name on whichever thread calls it"""
+        def profiled(*args):
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            enabled = _enable(profile)
+            try:
+                return function(*args)
+            finally:
+                if enabled:
+                    profile.disable()
+                with self._lock:
+                    calls = self._calls.setdefault(name, {'calls': 0, 'unprofiled': 0, 'seconds': 0.0})
+                    calls['calls'] += 1
+                    calls['seconds'] += time.perf_counter() - start
+                    if enabled:
+                        self._profiles.setdefault(name, []).append(profile)
+                    else:
+                        calls['unprofiled'] += 1
+        return profiled
+
+    def add_file(self, filename: str, stages: Optional[List[Dict[str, Any]]]) -> None:
+        with self._lock:
+            self.files.append({'filename': filename, 'stages': stages})
+
+    def finish(self) -> Dict[str, Any]:
+        """Stop tracing and summarize: web stages, request allocations, per-file worker stages"""
+        if self._summary is not None:
+            return self._summary
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not self._tracing:
+            tracemalloc.stop()
+
+        stages = []
+        for name, calls in self._calls.items():
+            profiles = self._profiles.get(name)
+            stages.append({
+                'stage': name,
+                'calls': calls['calls'],
+                'unprofiled_calls': calls['unprofiled'],
+                'seconds': round(calls['seconds'], 6),
+                'functions': top_functions(pstats.Stats(*profiles)) if profiles else None
+            })
+
+        self._summary = {
+            'seconds': round(time.perf_counter() - self._start, 6),
+            'stages': stages,
+            'allocations': {'peak_kb': round(peak / 1024, 1), 'lines': top_lines(self._before, after)},
+            'files': sorted(self.files, key=lambda file: file['filename'])
+        }
+        return self._summary
+
+
+def save_profile(batch_id: str, profile: Dict[str, Any]) -> str:
+    """Write a request profile to PROFILE_DIR - returns its path"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{batch_id}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=1)
+    return path
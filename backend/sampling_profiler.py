@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Always-on sampling profiler for the parsing workers
+When enabled, every worker process samples its own Python stack on a CPU-time
+timer (signal.setitimer ITIMER_PROF). Idle workers blocked on their pipe use
+no CPU and take no samples. Each sample costs one walk up the frame chain,
+so the profiler can stay on in production at the default rate.
+
+Samples are counted per stack and written as collapsed stacks, one
+"file.py:function;file.py:function count" line per stack, which
+flamegraph.pl, speedscope and inferno read directly. A count is CPU time in
+sampling intervals, so stacks compare by time spent:
+
+    <SAMPLING_DIR>/samples_<pid>.folded   one per worker, rewritten every flush
+    <SAMPLING_DIR>/retired.folded         workers that have exited, merged on read
+
+Python runs the signal handler only between bytecodes: timer signals that
+arrive during a long MuPDF (C) call are handled once, when the call returns.
+Each sample is therefore weighted by the CPU time (time.process_time) since
+the previous one, which counts the C time against the Python function that
+called MuPDF instead of dropping it.
+
+    GET /api/admin/samples[?reset=1]           merged stacks (admin token required)
+    python sampling_profiler.py [out.folded] [--reset]
+
+Configuration (environment):
+    SAMPLING_PROFILER         1 enables sampling in the parsing workers (default 0)
+    SAMPLING_INTERVAL_MS      CPU milliseconds between samples (default 20)
+    SAMPLING_FLUSH_SECONDS    seconds between writes of a worker's counts (default 30)
+    SAMPLING_DIR              collapsed stack files (default <INVOICE_DATA_DIR>/samples)
+"""
+
+import glob
+import logging
+import os
+import signal
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - no sampling in workers either
+    fcntl = None
+
+from invoice_store import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_PROFILER = os.environ.get('SAMPLING_PROFILER', '0') == '1'
+SAMPLING_INTERVAL_MS = float(os.environ.get('SAMPLING_INTERVAL_MS', '20'))
+SAMPLING_FLUSH_SECONDS = float(os.environ.get('SAMPLING_FLUSH_SECONDS', '30'))
+SAMPLING_DIR = os.environ.get('SAMPLING_DIR', os.path.join(DATA_DIR, 'samples'))
+
+SAMPLE_PREFIX = 'samples_'
+RETIRED_NAME = 'retired.folded'
+RESET_MARKER = 'reset'
+LOCK_NAME = '.lock'
+
+# Deeper frames (recursion) are cut off at the root end
+MAX_DEPTH = 128
+
+
+class StackSampler:
+    """Counts this process's main-thread stacks on SIGPROF"""
+
+    def __init__(self, interval_ms: float = SAMPLING_INTERVAL_MS, directory: str = SAMPLING_DIR):
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self.path = os.path.join(directory, f"{SAMPLE_PREFIX}{os.getpid()}.folded")
+        self.counts: Counter = Counter()
+        self.since = time.time()
+        self._last_cpu = time.process_time()
+        self._labels: Dict[object, str] = {}
+        self._last_flush = time.monotonic()
+
+    def _sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        now = time.process_time()
+        self.counts[';'.join(stack)] += (now - self._last_cpu) / self.interval
+        self._last_cpu = now
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        signal.signal(signal.SIGPROF, self._sample)
+        # Restart system calls the timer interrupts; MuPDF does not retry on EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        self._last_cpu = time.process_time()
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> None:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+    def flush(self) -> None:
+        """Rewrite this process's file; counts from before a reset are dropped first"""
+        try:
+            if os.path.getmtime(os.path.join(self.directory, RESET_MARKER)) > self.since:
+                self.counts.clear()
+                self.since = time.time()
+        except FileNotFoundError:
+            pass
+        write_folded(self.path, dict(self.counts))
+        self._last_flush = time.monotonic()
+
+    def flush_if_due(self) -> None:
+        if time.monotonic() - self._last_flush >= SAMPLING_FLUSH_SECONDS:
+            self.flush()
+
+
+def start_worker_sampling() -> Optional[StackSampler]:
+    """Start sampling in this worker process when enabled - None otherwise"""
+    if not SAMPLING_PROFILER or not hasattr(signal, 'setitimer'):
+        return None
+    sampler = StackSampler()
+    try:
+        sampler.start()
+    except (OSError, ValueError) as e:
+        logger.warning("Could not start sampling profiler: %s", e)
+        return None
+    return sampler
+
+
+def read_folded(path: str) -> Counter:
+    counts = Counter()
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    counts[stack] += int(count)
+    except FileNotFoundError:
+        pass
+    return counts
+
+
+def write_folded(path: str, counts: Dict[str, float]) -> None:
+    """Counts are rounded to whole intervals (the format takes integers); no stack is dropped"""
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        for stack, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+            f.write(f"{stack} {max(1, round(count))}\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collapsed_stacks(reset: bool = False) -> str:
+    """
+    Merged stacks of every worker, live and retired, as collapsed-stack text
+
+    Files of workers that have exited are folded into the retired file.
+    With reset, counting starts over once the stacks are read.
+    """
+    os.makedirs(SAMPLING_DIR, exist_ok=True)
+    retired_path = os.path.join(SAMPLING_DIR, RETIRED_NAME)
+
+    # Several web workers may read at once; only one folds retired files
+    with open(os.path.join(SAMPLING_DIR, LOCK_NAME), 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        retired = read_folded(retired_path)
+        live = Counter()
+        folded = []
+        for path in glob.glob(os.path.join(SAMPLING_DIR, f"{SAMPLE_PREFIX}*.folded")):
+            try:
+                pid = int(os.path.basename(path)[len(SAMPLE_PREFIX):-len('.folded')])
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                live.update(read_folded(path))
+            else:
+                retired.update(read_folded(path))
+                folded.append(path)
+
+        if reset:
+            # Live workers drop their counts at their next flush
+            with open(os.path.join(SAMPLING_DIR, RESET_MARKER), 'w'):
+                pass
+            for path in glob.glob(os.path.join(SAMPLING_DIR, f"{SAMPLE_PREFIX}*.folded")) + [retired_path]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+        elif folded:
+            write_folded(retired_path, dict(retired))
+            for path in folded:
+                os.unlink(path)
+
+    merged = retired + live
+    return ''.join(f"{stack} {count}\n"
+                   for stack, count in sorted(merged.items(), key=lambda item: item[1], reverse=True))
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:]
+    reset = '--reset' in args
+    args = [arg for arg in args if arg != '--reset']
+
+    text = collapsed_stacks(reset)
+    if args:
+        with open(args[0], 'w', encoding='utf-8') as f:
+            f.write(text)
+        samples = sum(int(line.rpartition(' ')[2]) for line in text.splitlines())
+        print(f"Wrote {len(text.splitlines())} stacks ({samples} samples) to {args[0]}")
+    else:
+        sys.stdout.write(text)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Server-side search over stored line items
+An inverted index maps tokens of description, project_name and campaign_id
+to line ids. pk| patterns are indexed both as whole segments
+(e.g. "th-single-detached-house-centro-onnut") and as their words, so either
+form finds the line. Query terms are AND-ed and each matches as a prefix.
+Platform, invoice type, period and batch filters are posting sets too, so a
+query is set intersections starting from the smallest set.
+
+Like the other indexes over the store, each process catches up with rows
+written by other workers by reading rows past the last id it has seen.
+"""
+
+import bisect
+import re
+import threading
+import time
+from typing import Dict, List, Any, Optional, Set
+
+from line_item_store import iter_line_items, get_line_items
+
+SEARCH_FIELDS = ['description', 'project_name', 'campaign_id']
+FILTER_FIELDS = ['platform', 'invoice_type', 'period', 'batch_id']
+
+WORD_PATTERN = re.compile(r'\w+')
+SEGMENT_PATTERN = re.compile(r'[|_\s\[\]]+')
+
+# Query terms shorter than this only match whole tokens (no prefix expansion)
+MIN_PREFIX_LENGTH = 2
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def tokenize(text: Optional[str]) -> Set[str]:
+    """Words plus whole pk|/underscore segments, lower-cased"""
+    if not text:
+        return set()
+    text = text.lower()
+    tokens = set(WORD_PATTERN.findall(text))
+    tokens.update(segment for segment in SEGMENT_PATTERN.split(text) if len(segment) > 1)
+    return tokens
+
+
+class SearchIndex:
+    """Inverted index over the line_items table"""
+
+    def __init__(self):
+        self.postings: Dict[str, Set[int]] = {}
+        self.filters: Dict[str, Dict[str, Set[int]]] = {field: {} for field in FILTER_FIELDS}
+        self.all_ids: Set[int] = set()
+        self.vocabulary: List[str] = []
+        self.vocabulary_dirty = False
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Index lines stored since the last refresh (by this or another worker)"""
+        with self.lock:
+            for line in iter_line_items(self.last_id):
+                self._add(line)
+                self.last_id = line['id']
+            if self.vocabulary_dirty:
+                self.vocabulary = sorted(self.postings)
+                self.vocabulary_dirty = False
+
+    def _add(self, line: Dict[str, Any]) -> None:
+        line_id = line['id']
+        self.all_ids.add(line_id)
+
+        tokens = set()
+        for field in SEARCH_FIELDS:
+            tokens |= tokenize(line.get(field))
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                self.vocabulary_dirty = True
+            self.postings[token].add(line_id)
+
+        for field in FILTER_FIELDS:
+            value = line.get(field)
+            if value:
+                self.filters[field].setdefault(value.lower(), set()).add(line_id)
+
+    def _term_ids(self, term: str) -> Set[int]:
+        """Lines containing a token that starts with term (caller holds the lock)"""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return self.postings.get(term, set())
+
+        ids = set()
+        start = bisect.bisect_left(self.vocabulary, term)
+        for token in self.vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, query: str = '', filters: Dict[str, str] = None,
+               page: int = 1, limit: int = DEFAULT_LIMIT) -> Dict[str, Any]:
+        """Matching line items, most recent first, one page at a time"""
+        start = time.perf_counter()
+
+        # refresh() mutates the sets and the vocabulary in place; the store
+        # read for the page happens after the lock is released
+        with self.lock:
+            sets = []
+            for field, value in (filters or {}).items():
+                if value:
+                    sets.append(self.filters[field].get(value.lower(), set()))
+            for term in WORD_PATTERN.findall(query.lower()):
+                sets.append(self._term_ids(term))
+
+            if sets:
+                sets.sort(key=len)
+                matches = set(sets[0])
+                for other in sets[1:]:
+                    if not matches:
+                        break
+                    matches &= other
+            else:
+                matches = self.all_ids
+
+            ordered = sorted(matches, reverse=True)
+
+        limit = max(1, min(limit, MAX_LIMIT))
+        page = max(1, page)
+        page_ids = ordered[(page - 1) * limit:page * limit]
+        rows = get_line_items(page_ids)
+
+        results = []
+        for line_id in page_ids:
+            row = rows[line_id]
+            row['amount'] = row.pop('amount_satang') / 100
+            results.append(row)
+
+        return {
+            'total': len(ordered),
+            'page': page,
+            'limit': limit,
+            'results': results,
+            'took_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    """Process-wide index, caught up with the store on every call"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+    _index.refresh()
+    return _index
+
+
+if __name__ == "__main__":
+    import sys
+
+    index = get_search_index()
+    print(f"Indexed {len(index.all_ids)} lines, {len(index.postings)} tokens")
+    if len(sys.argv) > 1:
+        found = index.search(' '.join(sys.argv[1:]))
+        print(f"{found['total']} matches in {found['took_ms']} ms")
+        for row in found['results'][:20]:
+            print(f"  {row['filename']:25s} {row['amount']:>14,.2f}  {row['description'][:60]}")
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Shadow-mode parser comparison
+A sample of real uploads is re-parsed by a candidate parser in a background
+thread. Item counts, totals, field values and wall time are compared with
+the serving parser and stored in the local store. The request never waits
+for the shadow run; when the backlog is full the sample is dropped.
+
+The sampling decision is made in the parsing worker, which returns the page
+text, the serving records and their parse time under the entry's 'shadow'
+key. The web process pops it and submits the run, so candidate parsers never
+take time on a serving worker.
+
+Configuration (environment):
+    SHADOW_SAMPLE_RATE   fraction of files to shadow, 0 disables (default 0)
+    SHADOW_PARSERS       candidates per platform, e.g. "Google:v3,Facebook:fixed"
+    SHADOW_MAX_PENDING   queued shadow runs before new samples are dropped
+"""
+
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from invoice_store import get_connection
+from parser_registry import run_parser, parser_takes_path, SERVING_PARSERS, PARSER_VARIANTS
+from reconciliation import amount_to_satang, satang_to_amount
+
+logger = logging.getLogger(__name__)
+
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', '0'))
+SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', '8'))
+
+# Fields compared line by line between serving and candidate output
+COMPARED_FIELDS = ['amount', 'invoice_type', 'description', 'agency', 'project_id',
+                   'project_name', 'objective', 'period', 'campaign_id']
+
+# Field differences kept per run (the count is always complete)
+MAX_STORED_DIFFS = 50
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+_lock = threading.Lock()
+
+
+def parse_shadow_parsers(value: str) -> Dict[str, str]:
+    """Parse "Google:v3,Facebook:fixed" into {platform: variant}"""
+    candidates = {}
+    for entry in value.split(','):
+        if ':' not in entry:
+            continue
+        platform, variant = (part.strip() for part in entry.split(':', 1))
+        if variant in PARSER_VARIANTS.get(platform, {}) and variant != SERVING_PARSERS.get(platform):
+            candidates[platform] = variant
+        else:
+            logger.warning("Ignoring shadow parser %r: unknown or serving variant", entry)
+    return candidates
+
+
+SHADOW_PARSERS = parse_shadow_parsers(os.environ.get('SHADOW_PARSERS', ''))
+
+
+def should_shadow(platform: str) -> bool:
+    """Sampling decision for one file"""
+    return (platform in SHADOW_PARSERS
+            and SHADOW_SAMPLE_RATE > 0
+            and random.random() < SHADOW_SAMPLE_RATE)
+
+
+def submit_shadow_run(platform: str, text_content: str, filename: str, pdf_source,
+                      serving_records: List[Dict[str, Any]], serving_seconds: float) -> bool:
+    """Queue a shadow run for a sampled file - returns immediately"""
+    global _executor, _pending
+
+    if platform not in SHADOW_PARSERS:
+        return False
+
+    candidate = SHADOW_PARSERS[platform]
+
+    with _lock:
+        if _pending >= SHADOW_MAX_PENDING:
+            return False
+        _pending += 1
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+
+    try:
+        # The upload's temp file is deleted after the request, so keep a copy of the bytes
+        pdf_bytes = None
+        if parser_takes_path(platform, candidate):
+            if isinstance(pdf_source, (bytes, bytearray)):
+                pdf_bytes = bytes(pdf_source)
+            else:
+                with open(pdf_source, 'rb') as f:
+                    pdf_bytes = f.read()
+
+        _executor.submit(_run_shadow, platform, candidate, text_content, filename,
+                         pdf_bytes, serving_records, serving_seconds)
+    except Exception as e:
+        logger.warning("Error scheduling shadow run for %s: %s", filename, e)
+        with _lock:
+            _pending -= 1
+        return False
+
+    return True
+
+
+def _run_shadow(platform: str, candidate: str, text_content: str, filename: str,
+                pdf_bytes: Optional[bytes], serving_records: List[Dict[str, Any]],
+                serving_seconds: float) -> None:
+    """Background worker: run the candidate, compare and store"""
+    global _pending
+
+    temp_path = None
+    candidate_records = []
+    candidate_seconds = None
+    error = None
+
+    try:
+        if pdf_bytes is not None:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', prefix='shadow_') as tmp:
+                tmp.write(pdf_bytes)
+                temp_path = tmp.name
+
+        start = time.perf_counter()
+        candidate_records = run_parser(platform, text_content, filename, temp_path, variant=candidate)
+        candidate_seconds = time.perf_counter() - start
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    try:
+        comparison = compare_records(serving_records, candidate_records)
+        store_shadow_run(platform, filename, candidate, serving_seconds, candidate_seconds,
+                         comparison, error)
+    except Exception as e:
+        logger.warning("Error storing shadow run for %s: %s", filename, e)
+    finally:
+        with _lock:
+            _pending -= 1
+
+
+def compare_records(serving: List[Dict[str, Any]], candidate: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compare two parser outputs: counts, totals (satang) and per-line field values"""
+    serving_total = sum(amount_to_satang(r.get('amount', 0)) for r in serving)
+    candidate_total = sum(amount_to_satang(r.get('amount', 0)) for r in candidate)
+
+    # Both parsers number lines differently, so align on sorted position
+    def sort_key(record):
+        return (-abs(amount_to_satang(record.get('amount', 0))), str(record.get('description', '')))
+
+    field_diffs = []
+    diff_count = 0
+    for index, (left, right) in enumerate(zip(sorted(serving, key=sort_key),
+                                              sorted(candidate, key=sort_key))):
+        for field in COMPARED_FIELDS:
+            left_value, right_value = left.get(field), right.get(field)
+            if field == 'amount':
+                if amount_to_satang(left_value) == amount_to_satang(right_value):
+                    continue
+            elif (left_value or None) == (right_value or None):
+                continue
+
+            diff_count += 1
+            if len(field_diffs) < MAX_STORED_DIFFS:
+                field_diffs.append({'line': index + 1, 'field': field,
+                                    'serving': left_value, 'candidate': right_value})
+
+    return {
+        'serving_items': len(serving),
+        'candidate_items': len(candidate),
+        'serving_total': satang_to_amount(serving_total),
+        'candidate_total': satang_to_amount(candidate_total),
+        'field_diffs': diff_count,
+        'diffs': field_diffs
+    }
+
+
+def store_shadow_run(platform: str, filename: str, candidate: str, serving_seconds: float,
+                     candidate_seconds: Optional[float], comparison: Dict[str, Any],
+                     error: Optional[str]) -> None:
+    """Write one comparison to the local store"""
+    conn = get_connection()
+    conn.execute(
+        '''INSERT INTO shadow_runs (created_at, platform, filename, serving_variant, candidate_variant,
+               serving_seconds, candidate_seconds, serving_items, candidate_items,
+               serving_total, candidate_total, field_diffs, diff_json, error)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (datetime.now().isoformat(), platform, filename, SERVING_PARSERS[platform], candidate,
+         serving_seconds, candidate_seconds, comparison['serving_items'], comparison['candidate_items'],
+         comparison['serving_total'], comparison['candidate_total'], comparison['field_diffs'],
+         json.dumps(comparison['diffs'], ensure_ascii=False), error)
+    )
+    conn.commit()
+
+
+def summarize_shadow_runs() -> List[Dict[str, Any]]:
+    """Aggregate stored comparisons per platform and candidate"""
+    rows = get_connection().execute(
+        '''SELECT platform, serving_variant, candidate_variant,
+                  COUNT(*) AS runs,
+                  SUM(CASE WHEN error IS NULL AND serving_items = candidate_items
+                            AND serving_total = candidate_total AND field_diffs = 0
+                       THEN 1 ELSE 0 END) AS identical,
+                  SUM(CASE WHEN serving_total != candidate_total THEN 1 ELSE 0 END) AS total_mismatches,
+                  SUM(CASE WHEN error IS NOT NULL THEN 1 ELSE 0 END) AS errors,
+                  AVG(serving_seconds) AS avg_serving_seconds,
+                  AVG(candidate_seconds) AS avg_candidate_seconds
+           FROM shadow_runs
+           GROUP BY platform, serving_variant, candidate_variant
+           ORDER BY platform, candidate_variant'''
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    print("SHADOW PARSER COMPARISON")
+    print("=" * 80)
+    for summary in summarize_shadow_runs():
+        print(f"{summary['platform']}: {summary['serving_variant']} vs {summary['candidate_variant']}")
+        print(f"  Runs: {summary['runs']}, identical: {summary['identical']}, "
+              f"total mismatches: {summary['total_mismatches']}, errors: {summary['errors']}")
+        print(f"  Avg time: serving {summary['avg_serving_seconds'] or 0:.3f}s, "
+              f"candidate {summary['avg_candidate_seconds'] or 0:.3f}s")
@@ -0,0 +1,57 @@
+"""
+Shared fixtures: the API blueprint on a bare Flask app, run against a
+throwaway data directory with in-process parsing (no worker processes)
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+
+os.environ['INVOICE_DATA_DIR'] = tempfile.mkdtemp(prefix='invoice_test_')
+os.environ['INVOICE_WORKERS'] = '0'
+os.environ['ADMIN_TOKEN'] = 'test-admin-token'
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import pytest
+from flask import Flask
+
+ADMIN_HEADERS = {'X-Admin-Token': os.environ['ADMIN_TOKEN']}
+
+
+@pytest.fixture(scope='session')
+def app():
+    from api_routes import api
+    app = Flask(__name__)
+    app.register_blueprint(api, url_prefix='/api')
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_pdf(lines) -> bytes:
+    """One-page PDF with the given text lines"""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), '\n'.join(lines), fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def google_pdf():
+    """A Google Ads invoice with a unique invoice number and its file name"""
+    number = str(5300000000 + uuid.uuid4().int % 100000000)
+    data = make_pdf([
+        'Google Ads',
+        f'Invoice number: {number}',
+        'Total amount due THB 1,234.50',
+    ])
+    return f'{number}.pdf', data
@@ -0,0 +1,55 @@
+import gzip
+import io
+import json
+
+
+def stored_report(client, google_pdf):
+    filename, data = google_pdf
+    response = client.post('/api/process-invoices?response=summary', data={
+        'files': [(io.BytesIO(data), filename)]
+    }, content_type='multipart/form-data')
+    return response.get_json()['data']['batch_id']
+
+
+def test_report_is_gzipped_for_clients_that_accept_it(client, google_pdf, monkeypatch):
+    import http_compression
+    monkeypatch.setattr(http_compression, 'GZIP_MIN_BYTES', 0)
+    batch_id = stored_report(client, google_pdf)
+
+    plain = client.get(f'/api/reports/{batch_id}')
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    zipped = client.get(f'/api/reports/{batch_id}', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(zipped.get_data())) == plain.get_json()
+    assert zipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+
+    refused = client.get(f'/api/reports/{batch_id}', headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'Content-Encoding' not in refused.headers
+
+
+def test_streamed_csv_export_is_gzipped(client, google_pdf):
+    filename, _ = google_pdf
+    batch_id = stored_report(client, google_pdf)
+
+    response = client.post('/api/export-csv', json={'batch_id': batch_id}, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.get_data()).decode('utf-8').lstrip('﻿').splitlines()
+    assert lines[0].startswith('filename,platform') and lines[1].startswith(filename)
+
+
+def test_stored_report_revalidates_with_its_etag(client, google_pdf):
+    batch_id = stored_report(client, google_pdf)
+
+    first = client.get(f'/api/reports/{batch_id}?page=1')
+    etag = first.headers['ETag']
+    assert not etag.startswith('W/')
+
+    again = client.get(f'/api/reports/{batch_id}?page=1', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+    # The ETag names one view of the report; another query is a different body
+    other = client.get(f'/api/reports/{batch_id}?page=1&limit=5', headers={'If-None-Match': etag})
+    assert other.status_code == 200
@@ -0,0 +1,50 @@
+import io
+
+from conftest import make_pdf
+from invoice_processing import create_total_only_record, determine_file_invoice_type
+
+
+def test_total_only_record_takes_the_number_from_the_filename():
+    record = create_total_only_record('TikTok', 'THTT202501234.pdf', 123450)
+    assert record['invoice_number'] == 'THTT202501234'
+    assert record['invoice_id'] == 'THTT202501234'
+    assert record['amount'] == 1234.5
+
+    earlier = [{'invoice_number': 'THTT1', 'invoice_id': 'ID1', 'invoice_type': 'AP'}]
+    record = create_total_only_record('TikTok', 'other.pdf', 100, earlier)
+    assert (record['invoice_number'], record['invoice_id'], record['invoice_type']) == ('THTT1', 'ID1', 'AP')
+
+
+def test_file_type_is_unknown_when_no_record_has_one():
+    assert determine_file_invoice_type([]) == 'Unknown'
+    assert determine_file_invoice_type([create_total_only_record('TikTok', 'a.pdf', 100)]) == 'Unknown'
+    assert determine_file_invoice_type([{'invoice_type': 'Non-AP'}]) == 'Non-AP'
+    assert determine_file_invoice_type([{'invoice_type': 'Unknown', 'agency': 'pk'}]) == 'AP'
+
+
+def test_total_only_upload_reports_number_and_unknown_type(client):
+    # Facebook invoice with a printed total but no line items the parsers read
+    data = make_pdf(['Meta', 'Facebook', 'Total amount due THB 2,000.00'])
+    response = client.post('/api/process-invoices', data={
+        'files': [(io.BytesIO(data), '246546622.pdf')]
+    }, content_type='multipart/form-data')
+
+    entry = response.get_json()['data']['files']['246546622.pdf']
+    assert entry['extraction_tier'] == 'total_only'
+    assert entry['invoice_type'] == 'Unknown'
+    assert entry['items'][0]['invoice_number'] == '246546622'
+
+
+def test_batch_duplicate_is_not_counted_as_a_platform_file(client, google_pdf):
+    filename, data = google_pdf
+    response = client.post('/api/process-invoices', data={
+        'files': [(io.BytesIO(data), filename), (io.BytesIO(data), f'copy of {filename}')]
+    }, content_type='multipart/form-data')
+
+    summary = response.get_json()['data']['summary']
+    assert summary['duplicates']['batch'] == 1
+    assert summary['overall']['files_processed'] == 2
+    google = summary['by_platform']['Google']
+    assert google['files'] == 1
+    assert google['total_amount'] == 1234.5
+    assert google['average_items_per_file'] == google['total_items']
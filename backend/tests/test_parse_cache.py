@@ -0,0 +1,50 @@
+import io
+
+from parse_cache import sha256_bytes
+
+
+def upload(client, files, client_id, cached=None):
+    data = {'files': [(io.BytesIO(content), filename) for filename, content in files]}
+    if cached:
+        data['cached'] = cached
+    response = client.post('/api/process-invoices', data=data, content_type='multipart/form-data',
+                           headers={'X-Client-Id': client_id})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def known(client, hashes, client_id):
+    response = client.post('/api/known-hashes', json={'hashes': hashes}, headers={'X-Client-Id': client_id})
+    return response.get_json()['known']
+
+
+def test_cache_is_scoped_to_the_uploading_client(client, google_pdf):
+    filename, data = google_pdf
+    sha256 = sha256_bytes(data)
+    owner, other = 'a' * 32, 'b' * 32
+
+    upload(client, [google_pdf], owner)
+    assert known(client, [sha256], owner) == [sha256]
+    assert known(client, [sha256], other) == []
+
+    # Claiming the hash as cached does not reveal another client's invoice
+    report = upload(client, [], other, cached=f'[{{"sha256": "{sha256}", "filename": "{filename}"}}]')
+    entry = report['files'][filename]
+    assert entry['error']['type'] == 'CacheMiss'
+    assert entry['items'] == []
+
+
+def test_cached_items_carry_the_current_file_name(client, google_pdf):
+    filename, data = google_pdf
+    client_id = 'c' * 32
+    upload(client, [google_pdf], client_id)
+
+    report = upload(client, [('renamed.pdf', data)], client_id)
+    entry = report['files']['renamed.pdf']
+    assert entry['cached'] is True
+    assert entry['items'] and all(item['filename'] == 'renamed.pdf' for item in entry['items'])
+
+    cached = f'[{{"sha256": "{sha256_bytes(data)}", "filename": "listed.pdf"}}]'
+    entry = upload(client, [], client_id, cached=cached)['files']['listed.pdf']
+    assert entry['cached'] is True
+    assert [item['filename'] for item in entry['items']] == ['listed.pdf'] * len(entry['items'])
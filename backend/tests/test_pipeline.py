@@ -0,0 +1,91 @@
+import io
+import time
+import zipfile
+
+from conftest import make_pdf
+from pipeline import BatchPipeline, process_folder
+from report_store import iter_report_files
+from worker_pool import SupervisedPool, STATUS_ERROR
+
+
+def echo(source, filename):
+    return {'filename': filename}
+
+
+def test_results_come_back_in_input_order():
+    def prepare(index):
+        # Later items finish preparing first
+        time.sleep((5 - index) * 0.01)
+        if index == 3:
+            raise ValueError('unreadable')
+        return {'index': index}, (b'', f'{index}.pdf'), float(index)
+
+    persisted = []
+    pipeline = BatchPipeline(SupervisedPool(echo, size=0), prepare,
+                             lambda context, outcome: persisted.append(context['index']), io_threads=4)
+    results = pipeline.run(iter(range(6)))
+
+    assert [context for context, _ in results][:3] == [{'index': 0}, {'index': 1}, {'index': 2}]
+    assert results[3][0] == 3 and results[3][1]['status'] == STATUS_ERROR
+    assert [outcome['result']['filename'] for _, outcome in results if outcome['status'] == 'ok'] == \
+        ['0.pdf', '1.pdf', '2.pdf', '4.pdf', '5.pdf']
+    assert sorted(persisted) == [0, 1, 2, 4, 5]
+
+
+def test_process_folder_reports_every_pdf(tmp_path):
+    for number in ('5300000101', '5300000102'):
+        (tmp_path / f'{number}.pdf').write_bytes(make_pdf(['Google Ads', f'Invoice number: {number}']))
+    (tmp_path / 'notes.txt').write_text('not an invoice')
+
+    report = process_folder(str(tmp_path), invoice_set='test')
+
+    assert report['invoice_set'] == 'test'
+    assert list(report['files']) == ['5300000101.pdf', '5300000102.pdf']
+    assert report['summary']['overall']['files_processed'] == 2
+
+
+def test_report_keeps_upload_order(client):
+    def pdf(number):
+        return make_pdf(['Google Ads', f'Invoice number: {number}', f'Reference {time.time_ns()}'])
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zipped:
+        zipped.writestr('5300000202.pdf', pdf('5300000202'))
+        zipped.writestr('5300000203.pdf', pdf('5300000203'))
+
+    response = client.post('/api/process-invoices', data={'files': [
+        (io.BytesIO(pdf('5300000201')), '5300000201.pdf'),
+        (io.BytesIO(b'not a zip'), 'broken.zip'),
+        (io.BytesIO(archive.getvalue()), 'members.zip'),
+        (io.BytesIO(pdf('5300000204')), '5300000204.pdf'),
+    ]}, content_type='multipart/form-data')
+
+    assert response.status_code == 200, response.get_json()
+    # JSON responses sort their keys, so read the stored positions
+    batch_id = response.get_json()['data']['batch_id']
+    assert [filename for filename, _ in iter_report_files(batch_id)] == [
+        '5300000201.pdf', 'broken.zip', '5300000202.pdf', '5300000203.pdf', '5300000204.pdf'
+    ]
+
+
+def test_mapped_files_are_handed_over_without_the_path(tmp_path, monkeypatch):
+    import pdf_spool
+    from mapped_input import MappedFile
+
+    small, large = tmp_path / 'small.pdf', tmp_path / 'large.pdf'
+    small.write_bytes(make_pdf(['small']))
+    large.write_bytes(make_pdf(['large']) + b'\n' * 4096)
+    monkeypatch.setattr(pdf_spool, 'PDF_SPOOL_MIN_BYTES', len(large.read_bytes()))
+
+    with MappedFile(str(small)) as mapped:
+        (source, filename), release = pdf_spool.hand_off((mapped.buffer(), mapped.filename))
+        assert isinstance(source, bytes) and source == small.read_bytes()
+
+    with MappedFile(str(large)) as mapped:
+        (source, filename), release = pdf_spool.hand_off((mapped.buffer(), mapped.filename))
+    try:
+        assert source != str(large) and source.endswith('_large.pdf')
+        with open(source, 'rb') as spooled:
+            assert spooled.read() == large.read_bytes()
+    finally:
+        release()
@@ -0,0 +1,69 @@
+import io
+
+from conftest import ADMIN_HEADERS
+
+
+def upload(client, *files):
+    response = client.post('/api/process-invoices?response=summary', data={
+        'files': [(io.BytesIO(data), filename) for filename, data in files]
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def test_summary_response_leaves_files_to_the_stored_report(client, google_pdf):
+    summary = upload(client, google_pdf)
+    assert 'files' not in summary
+    assert summary['batch_id']
+
+
+def test_report_is_readable_by_batch_id_without_admin_token(client, google_pdf):
+    filename, _ = google_pdf
+    batch_id = upload(client, google_pdf)['batch_id']
+
+    response = client.get(f'/api/reports/{batch_id}?page=1&limit=10&include_summary=0')
+    assert response.status_code == 200
+    page = response.get_json()['data']
+    assert list(page['files']) == [filename]
+    assert page['pagination'] == {'page': 1, 'limit': 10, 'total_files': 1, 'pages': 1}
+    assert 'summary' not in page
+
+    summary = client.get(f'/api/reports/{batch_id}?summary_only=1').get_json()['data']
+    assert summary['summary']['overall']['files_processed'] == 1
+
+
+def test_unknown_batch_id_is_not_found(client):
+    assert client.get('/api/reports/0123456789abcdef0123456789abcdef').status_code == 404
+
+
+def test_report_listing_requires_admin_token(client):
+    assert client.get('/api/reports').status_code == 403
+    assert client.get('/api/reports', headers=ADMIN_HEADERS).status_code == 200
+
+
+def test_stored_report_exports_as_csv(client, google_pdf):
+    filename, _ = google_pdf
+    batch_id = upload(client, google_pdf)['batch_id']
+
+    response = client.post('/api/export-csv', json={'batch_id': batch_id})
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).lstrip('﻿').splitlines()
+    assert lines[0].startswith('filename,platform')
+    assert len(lines) > 1 and all(line.startswith(filename) for line in lines[1:])
+
+    assert client.post('/api/export-csv', json={'batch_id': 'missing'}).status_code == 404
+
+
+def test_search_within_a_batch_needs_only_its_batch_id(client, google_pdf):
+    filename, _ = google_pdf
+    batch_id = upload(client, google_pdf)['batch_id']
+
+    response = client.get(f'/api/search?q=google&batch_id={batch_id}')
+    assert response.status_code == 200
+    found = response.get_json()
+    assert found['total'] == 1
+    assert [row['filename'] for row in found['results']] == [filename]
+
+    assert client.get('/api/search?q=google').status_code == 403
+    assert client.get('/api/search?q=google&batch_id=missing').status_code == 404
+    assert client.get('/api/search?q=google', headers=ADMIN_HEADERS).status_code == 200
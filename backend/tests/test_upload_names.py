@@ -0,0 +1,24 @@
+import io
+import zipfile
+
+def zip_of(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_zip_member_named_like_an_upload_keeps_both_files(client, google_pdf):
+    filename, data = google_pdf
+    response = client.post('/api/process-invoices', data={
+        'files': [(io.BytesIO(data), filename),
+                  (io.BytesIO(zip_of({filename: data})), 'invoices.zip')]
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    report = response.get_json()['data']
+    assert set(report['files']) == {filename, f'invoices.zip/{filename}'}
+    assert report['summary']['overall']['files_processed'] == 2
+    member = report['files'][f'invoices.zip/{filename}']
+    assert member['platform'] == 'Google'
+    assert {item['filename'] for item in member['items']} == {f'invoices.zip/{filename}'}
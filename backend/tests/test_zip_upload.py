@@ -0,0 +1,60 @@
+import io
+import zipfile
+
+import zip_upload
+from zip_upload import iter_pdf_members, member_display_name, unique_display_name
+
+
+def zip_of(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_member_keeps_its_basename_when_free():
+    assert member_display_name('june/5300000001.pdf', set(), 'june.zip') == '5300000001.pdf'
+
+
+def test_member_named_like_a_loose_upload_gets_the_archive_path():
+    taken = {'5300000001.pdf'}
+    assert member_display_name('5300000001.pdf', taken, 'june.zip') == 'june.zip/5300000001.pdf'
+
+
+def test_display_names_stay_unique():
+    taken = {'5300000001.pdf', 'june.zip/5300000001.pdf'}
+    assert member_display_name('5300000001.pdf', taken, 'june.zip') == 'june.zip/5300000001 (2).pdf'
+    taken.add('june.zip/5300000001 (2).pdf')
+    assert member_display_name('5300000001.pdf', taken, 'june.zip') == 'june.zip/5300000001 (3).pdf'
+    assert unique_display_name('a.pdf', {'a.pdf'}) == 'a (2).pdf'
+
+
+def test_non_pdf_members_are_skipped():
+    archive = zip_of({'a.pdf': b'%PDF-a', 'notes.txt': b'x', '__MACOSX/._a.pdf': b'x'})
+    assert [name for name, _, _ in iter_pdf_members(archive)] == ['a.pdf']
+
+
+def test_member_size_limit(monkeypatch):
+    monkeypatch.setattr(zip_upload, 'ZIP_MAX_MEMBER_MB', 1)
+    archive = zip_of({'big.pdf': b'x' * (1024 * 1024 + 1), 'small.pdf': b'x'})
+    results = {name: (data, error) for name, data, error in iter_pdf_members(archive)}
+    assert results['big.pdf'][1]['type'] == 'MemberTooLarge'
+    assert results['small.pdf'] == (b'x', None)
+
+
+def test_member_count_limit(monkeypatch):
+    monkeypatch.setattr(zip_upload, 'ZIP_MAX_MEMBERS', 2)
+    archive = zip_of({f'{index}.pdf': b'x' for index in range(3)})
+    errors = [error for _, _, error in iter_pdf_members(archive)]
+    assert errors[:2] == [None, None]
+    assert errors[2]['type'] == 'ArchiveTooLarge'
+
+
+def test_total_size_limit(monkeypatch):
+    monkeypatch.setattr(zip_upload, 'ZIP_MAX_TOTAL_MB', 1)
+    archive = zip_of({f'{index}.pdf': b'x' * 400 * 1024 for index in range(4)})
+    errors = [error for _, _, error in iter_pdf_members(archive)]
+    assert errors[:2] == [None, None]
+    assert [error['type'] for error in errors[2:]] == ['ArchiveTooLarge', 'ArchiveTooLarge']
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Extracted-text corpus for parser development
+Every page's text, words and blocks are extracted once per PDF and stored
+gzip-compressed under the file's SHA-256:
+
+    <corpus>/index.json            filename -> sha256, platform, pages
+    <corpus>/<sha256>.json.gz      {"filename", "pages": [{"text", "words", "blocks"}, ...]}
+
+CorpusDocument answers the page calls the parsers make (len, iteration,
+doc[i], get_text() / 'text' / 'words' / 'blocks') from the stored pages,
+so any parser variant can be replayed over the whole corpus without fitz
+opening a single PDF. Parsers that re-open the PDF by path (Google) are
+given a placeholder path and their module's fitz.open is pointed at the
+corpus for the duration of the replay.
+
+    python text_corpus.py build [pdf_dir ...]              extract new files (default: ../Invoice for testing)
+    python text_corpus.py replay [platform] [variant]      run parsers over the corpus
+    python text_corpus.py replay --layout [platform]       same, on text rebuilt from word positions
+
+Configuration (environment):
+    TEXT_CORPUS_DIR     corpus directory (default <INVOICE_DATA_DIR>/corpus)
+"""
+
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Optional
+
+from invoice_store import DATA_DIR
+
+TEXT_CORPUS_DIR = os.environ.get('TEXT_CORPUS_DIR', os.path.join(DATA_DIR, 'corpus'))
+DEFAULT_PDF_DIR = os.path.join('..', 'Invoice for testing')
+
+INDEX_NAME = 'index.json'
+CORPUS_VERSION = 1
+
+
+class CorpusPage:
+    """Stored page with the get_text options the parsers use"""
+
+    def __init__(self, number: int, data: Dict[str, Any]):
+        self.number = number
+        self._data = data
+
+    def get_text(self, option: str = 'text', **kwargs):
+        if kwargs:
+            raise ValueError(f"Corpus pages do not support get_text options {sorted(kwargs)}")
+        if option not in self._data:
+            raise ValueError(f"Corpus pages have no {option!r} output")
+        return self._data[option]
+
+
+class CorpusDocument:
+    """Read-only stand-in for a fitz Document built from a corpus entry"""
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.name = entry['filename']
+        self.sha256 = entry['sha256']
+        self.pages = [CorpusPage(number, page) for number, page in enumerate(entry['pages'])]
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __iter__(self):
+        return iter(self.pages)
+
+    def __getitem__(self, index: int) -> CorpusPage:
+        return self.pages[index]
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def entry_path(sha256: str) -> str:
+    return os.path.join(TEXT_CORPUS_DIR, f"{sha256}.json.gz")
+
+
+def load_index() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(os.path.join(TEXT_CORPUS_DIR, INDEX_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_index(index: Dict[str, Dict[str, Any]]) -> None:
+    path = os.path.join(TEXT_CORPUS_DIR, INDEX_NAME)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_document(sha256: str) -> CorpusDocument:
+    with gzip.open(entry_path(sha256), 'rt', encoding='utf-8') as f:
+        return CorpusDocument(json.load(f))
+
+
+def open_document(filename: str) -> Optional[CorpusDocument]:
+    """Corpus copy of a PDF by filename, or None when it has not been extracted"""
+    info = load_index().get(os.path.basename(filename))
+    return load_document(info['sha256']) if info else None
+
+
+def extract_entry(pdf_bytes: bytes, filename: str, sha256: str) -> Dict[str, Any]:
+    """Text, words and blocks of every page (the only place fitz is used)"""
+    import fitz
+
+    pages = []
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as doc:
+        for page in doc:
+            pages.append({
+                'text': page.get_text(),
+                'words': [list(word) for word in page.get_text('words')],
+                'blocks': [list(block) for block in page.get_text('blocks')]
+            })
+    return {'version': CORPUS_VERSION, 'sha256': sha256, 'filename': filename, 'pages': pages}
+
+
+def build(pdf_dirs: List[str]) -> Dict[str, int]:
+    """Add PDFs not in the corpus yet - files already stored under their hash are skipped"""
+    from invoice_processing import detect_platform
+
+    os.makedirs(TEXT_CORPUS_DIR, exist_ok=True)
+    index = load_index()
+    counts = {'added': 0, 'unchanged': 0, 'failed': 0}
+
+    for pdf_dir in pdf_dirs:
+        for filename in sorted(os.listdir(pdf_dir)):
+            if not filename.lower().endswith('.pdf'):
+                continue
+            with open(os.path.join(pdf_dir, filename), 'rb') as f:
+                pdf_bytes = f.read()
+            sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+
+            if os.path.exists(entry_path(sha256)):
+                document = load_document(sha256)
+                counts['unchanged'] += 1
+            else:
+                try:
+                    entry = extract_entry(pdf_bytes, filename, sha256)
+                except Exception as e:
+                    print(f"Error extracting {filename}: {e}")
+                    counts['failed'] += 1
+                    continue
+                with gzip.open(f"{entry_path(sha256)}.tmp", 'wt', encoding='utf-8', compresslevel=6) as f:
+                    json.dump(entry, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(f"{entry_path(sha256)}.tmp", entry_path(sha256))
+                document = CorpusDocument(entry)
+                counts['added'] += 1
+
+            text = ''.join(page.get_text() for page in document)
+            index[filename] = {
+                'sha256': sha256,
+                'platform': detect_platform(filename, text),
+                'pages': document.page_count,
+                'bytes': len(pdf_bytes)
+            }
+
+    save_index(index)
+    return counts
+
+
+class _CorpusFitz:
+    """Replaces a parser module's fitz while replaying: open(path) serves the corpus"""
+
+    def __init__(self, documents: Dict[str, CorpusDocument]):
+        self.documents = documents
+
+    def open(self, path=None, *args, **kwargs):
+        document = self.documents.get(os.path.abspath(path)) if isinstance(path, str) else None
+        if document is None:
+            raise RuntimeError(f"{path} is not a corpus placeholder (replays do not open PDFs)")
+        return document
+
+
+@contextmanager
+def corpus_paths(documents: List[CorpusDocument], module_names: List[str]) -> Iterator[Dict[str, str]]:
+    """
+    Empty placeholder files named like the invoices (parsers check the path
+    exists and read the invoice number from it), with the given parser
+    modules' fitz pointed at the corpus; yields sha256 -> placeholder path
+    """
+    with tempfile.TemporaryDirectory(prefix='corpus_') as placeholder_dir:
+        paths = {}
+        by_path = {}
+        for document in documents:
+            folder = os.path.join(placeholder_dir, document.sha256[:12])
+            os.makedirs(folder)
+            path = os.path.join(folder, document.name)
+            open(path, 'wb').close()
+            paths[document.sha256] = path
+            by_path[os.path.abspath(path)] = document
+
+        modules = [importlib.import_module(name) for name in module_names]
+        originals = [getattr(module, 'fitz', None) for module in modules]
+        corpus_fitz = _CorpusFitz(by_path)
+        for module in modules:
+            module.fitz = corpus_fitz
+        try:
+            yield paths
+        finally:
+            for module, original in zip(modules, originals):
+                module.fitz = original
+
+
+def replay(platform: str = None, variant: str = None, layout: bool = False) -> List[Dict[str, Any]]:
+    """Run a parser variant (serving by default) over every corpus file of the platform(s)"""
+    from layout_extraction import extract_layout_text
+    from parser_registry import PARSER_VARIANTS, SERVING_PARSERS, parser_takes_path, run_parser
+
+    index = load_index()
+    selected = [(filename, info) for filename, info in sorted(index.items())
+                if info['platform'] in PARSER_VARIANTS and (platform is None or info['platform'] == platform)]
+    documents = {info['sha256']: load_document(info['sha256']) for _, info in selected}
+
+    path_modules = sorted({PARSER_VARIANTS[info['platform']][variant or SERVING_PARSERS[info['platform']]][0]
+                           for _, info in selected
+                           if parser_takes_path(info['platform'], variant or SERVING_PARSERS[info['platform']])})
+
+    results = []
+    with corpus_paths(list(documents.values()), path_modules) as paths:
+        for filename, info in selected:
+            document = documents[info['sha256']]
+            text = extract_layout_text(document) if layout else ''.join(page.get_text() for page in document)
+            start = time.perf_counter()
+            error = None
+            try:
+                records = run_parser(info['platform'], text, filename, paths[info['sha256']], variant=variant)
+            except Exception as e:
+                records, error = [], f"{type(e).__name__}: {e}"
+            results.append({
+                'filename': filename,
+                'platform': info['platform'],
+                'items': len(records),
+                'total': round(sum(record.get('amount', 0) for record in records), 2),
+                'seconds': time.perf_counter() - start,
+                'error': error,
+                'records': records
+            })
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+
+    if command == 'build':
+        start = time.perf_counter()
+        counts = build(sys.argv[2:] or [DEFAULT_PDF_DIR])
+        print(f"Corpus {TEXT_CORPUS_DIR}: {counts['added']} added, {counts['unchanged']} unchanged, "
+              f"{counts['failed']} failed in {time.perf_counter() - start:.1f} s")
+
+    elif command == 'replay':
+        args = sys.argv[2:]
+        layout = '--layout' in args
+        args = [arg for arg in args if arg != '--layout']
+        start = time.perf_counter()
+        results = replay(args[0] if args else None, args[1] if len(args) > 1 else None, layout)
+        for result in results:
+            status = result['error'] or ''
+            print(f"{result['platform']:10s} {result['filename']:35s} {result['items']:>4d} items "
+                  f"{result['total']:>14,.2f}  {result['seconds'] * 1000:7.1f} ms  {status}")
+        errors = sum(1 for result in results if result['error'])
+        print(f"Replayed {len(results)} files ({errors} errors) in {time.perf_counter() - start:.2f} s")
+
+    else:
+        print("Usage: python text_corpus.py build [pdf_dir ...] | replay [--layout] [platform] [variant]")
+        sys.exit(1)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Supervised worker pool for per-file extraction and parsing
+Each file runs in a separate worker process with a wall-clock budget and a
+memory cap, so a malformed PDF or a backtracking regex cannot hang or crash
+the gunicorn worker. A file that times out or crashes its worker comes back
+as a total-only fallback (short second budget) or an error entry, and the
+rest of the batch completes.
+
+Workers shrink MuPDF's global store after every document and retire
+themselves once they have processed too many documents or their RSS grows
+past the threshold. A retiring worker always finishes its current file
+first; queued files are picked up by the replacement process.
+
+Queued files are taken shortest first when the caller gives each task an
+estimated cost. The queue key is submission time plus the weighted cost, so
+a long file can be passed by shorter ones for a bounded time only.
+
+Configuration (environment):
+    INVOICE_WORKERS            worker processes, 0 runs in-process without isolation
+    INVOICE_FILE_TIMEOUT       seconds allowed per file (default 60)
+    INVOICE_FALLBACK_TIMEOUT   seconds allowed for the total-only fallback (default 10)
+    INVOICE_WORKER_MEMORY_MB   address-space cap per worker, 0 disables (default 1024)
+    INVOICE_WORKER_START_METHOD  multiprocessing start method (default forkserver, else spawn)
+    INVOICE_WORKER_MAX_DOCS    documents before a worker retires, 0 disables (default 200)
+    INVOICE_WORKER_MAX_RSS_MB  resident memory before a worker retires, 0 disables (default 512)
+    INVOICE_SJF_WEIGHT         queue seconds one second of estimated cost is worth (default 10)
+"""
+
+import gc
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, List, Any, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows - no rlimits
+    resource = None
+
+from app_logging import configure_logging, file_context, log_context
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('INVOICE_WORKERS', str(min(4, os.cpu_count() or 1))))
+FILE_TIMEOUT = float(os.environ.get('INVOICE_FILE_TIMEOUT', '60'))
+FALLBACK_TIMEOUT = float(os.environ.get('INVOICE_FALLBACK_TIMEOUT', '10'))
+WORKER_MEMORY_MB = int(os.environ.get('INVOICE_WORKER_MEMORY_MB', '1024'))
+WORKER_MAX_DOCS = int(os.environ.get('INVOICE_WORKER_MAX_DOCS', '200'))
+WORKER_MAX_RSS_MB = int(os.environ.get('INVOICE_WORKER_MAX_RSS_MB', '512'))
+SJF_WEIGHT = float(os.environ.get('INVOICE_SJF_WEIGHT', '10'))
+
+# Workers are started from the pool's slot threads; forkserver/spawn avoid
+# forking a multi-threaded gunicorn worker with locks held
+START_METHOD = os.environ.get(
+    'INVOICE_WORKER_START_METHOD',
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+MP_CONTEXT = multiprocessing.get_context(START_METHOD)
+
+# The fork server imports these once; every worker forked from it starts warm
+if START_METHOD == 'forkserver':
+    from parser_registry import serving_modules
+    MP_CONTEXT.set_forkserver_preload(['fitz', 'invoice_processing'] + serving_modules())
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+STATUS_TIMEOUT = 'timeout'
+STATUS_CRASHED = 'crashed'
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+    return 0.0
+
+
+def release_document_memory() -> None:
+    """Empty MuPDF's global store and collect Python garbage after a document"""
+    fitz = sys.modules.get('fitz')
+    if fitz is not None:
+        try:
+            fitz.TOOLS.store_shrink(100)
+        except Exception:
+            pass
+    gc.collect()
+
+
+def _worker_main(conn, memory_limit_mb: int, max_docs: int, max_rss_mb: int) -> None:
+    """Worker process loop: receive (handler, args, log context), run, send (status, result, stats)"""
+    configure_logging()
+    if resource is not None and memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            logger.warning("Could not set worker memory limit: %s", e)
+
+    from sampling_profiler import start_worker_sampling
+    sampler = start_worker_sampling()
+
+    documents = 0
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+
+        handler, args, context = task
+        try:
+            with file_context(args[1], **context):
+                outcome = (STATUS_OK, handler(*args))
+        except MemoryError:
+            outcome = (STATUS_ERROR, {'type': 'MemoryError',
+                                      'message': f'Worker memory cap of {memory_limit_mb} MB exceeded'})
+        except Exception as e:
+            outcome = (STATUS_ERROR, {'type': type(e).__name__, 'message': str(e),
+                                      'traceback': traceback.format_exc()})
+
+        documents += 1
+        release_document_memory()
+        rss_mb = current_rss_mb()
+
+        # Retire after finishing this file; the supervisor starts a replacement
+        retiring = ((max_docs > 0 and documents >= max_docs)
+                    or (max_rss_mb > 0 and rss_mb >= max_rss_mb))
+        stats = {'pid': os.getpid(), 'documents': documents,
+                 'rss_mb': round(rss_mb, 1), 'retiring': retiring}
+
+        conn.send(outcome + (stats,))
+        if sampler is not None:
+            sampler.flush_if_due()
+        if retiring:
+            break
+
+    if sampler is not None:
+        sampler.stop()
+        sampler.flush()
+
+
+class WorkerProcess:
+    """One supervised worker process and its pipe"""
+
+    def __init__(self, memory_limit_mb: int, max_docs: int, max_rss_mb: int):
+        self.memory_limit_mb = memory_limit_mb
+        self.max_docs = max_docs
+        self.max_rss_mb = max_rss_mb
+        self.process = None
+        self.conn = None
+        self.last_stats: Dict[str, Any] = {}
+        self.started = 0
+        self.retired = 0
+        self.killed = 0
+
+    def ensure_started(self) -> None:
+        if self.process is not None and self.process.is_alive():
+            return
+        self.stop()
+        parent_conn, child_conn = MP_CONTEXT.Pipe()
+        self.process = MP_CONTEXT.Process(
+            target=_worker_main,
+            args=(child_conn, self.memory_limit_mb, self.max_docs, self.max_rss_mb),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.last_stats = {'pid': self.process.pid, 'documents': 0, 'rss_mb': None}
+        self.started += 1
+
+    def run(self, handler: Callable, args: tuple, timeout: float,
+            context: Dict[str, str] = None) -> Tuple[str, Any]:
+        """Run one task with a wall-clock budget - kills the worker on timeout"""
+        self.ensure_started()
+        try:
+            self.conn.send((handler, args, context or {}))
+            if self.conn.poll(timeout):
+                status, result, stats = self.conn.recv()
+                self.last_stats = stats
+                if stats['retiring']:
+                    self.retire()
+                return status, result
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError):
+            self.process.join(1)
+            exitcode = self.process.exitcode
+            self.kill()
+            self.killed += 1
+            return STATUS_CRASHED, {'type': 'WorkerCrashed',
+                                    'message': f'Worker process died (exit code {exitcode})'}
+
+        self.kill()
+        self.killed += 1
+        return STATUS_TIMEOUT, {'type': 'Timeout',
+                                'message': f'Processing exceeded {timeout:.0f}s budget'}
+
+    def retire(self) -> None:
+        """Reap a worker that exited on its own after reaching a threshold"""
+        logger.info("Retiring worker %s: %s documents, %s MB RSS", self.last_stats.get('pid'),
+                    self.last_stats.get('documents'), self.last_stats.get('rss_mb'))
+        self.process.join(5)
+        self.kill()
+        self.retired += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.last_stats,
+            'alive': self.process is not None and self.process.is_alive(),
+            'started': self.started,
+            'retired': self.retired,
+            'killed': self.killed
+        }
+
+    def kill(self) -> None:
+        """Terminate a hung or crashed worker; the next task starts a fresh one"""
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self._close()
+
+    def stop(self) -> None:
+        """Ask the worker to exit after its current task"""
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(5)
+        self.kill()
+
+    def _close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+
+class SupervisedPool:
+    """
+    Fixed set of worker slots; each slot thread feeds one worker process
+
+    handler / fallback_handler must be module-level functions so they can be
+    sent to spawn-started workers (Windows/macOS).
+    """
+
+    def __init__(self, handler: Callable, fallback_handler: Callable = None,
+                 size: int = None, timeout: float = None, fallback_timeout: float = None,
+                 memory_limit_mb: int = None, max_docs: int = None, max_rss_mb: int = None):
+        self.handler = handler
+        self.fallback_handler = fallback_handler
+        self.size = POOL_SIZE if size is None else size
+        self.timeout = FILE_TIMEOUT if timeout is None else timeout
+        self.fallback_timeout = FALLBACK_TIMEOUT if fallback_timeout is None else fallback_timeout
+        self.memory_limit_mb = WORKER_MEMORY_MB if memory_limit_mb is None else memory_limit_mb
+        self.max_docs = WORKER_MAX_DOCS if max_docs is None else max_docs
+        self.max_rss_mb = WORKER_MAX_RSS_MB if max_rss_mb is None else max_rss_mb
+
+        # (key, sequence, args, done, log context); shutdown entries sort after every task
+        self._tasks = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = [WorkerProcess(self.memory_limit_mb, self.max_docs, self.max_rss_mb)
+                         for _ in range(self.size)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start_threads(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for worker in self._workers:
+                thread = threading.Thread(target=self._slot_loop, args=(worker,), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _slot_loop(self, worker: WorkerProcess) -> None:
+        while True:
+            _, _, args, done, context = self._tasks.get()
+            if done is None:
+                worker.stop()
+                break
+            done(self._run_supervised(worker, args, context))
+
+    def _run_supervised(self, worker: WorkerProcess, args: tuple, context: Dict[str, str]) -> Dict[str, Any]:
+        """Run the handler; on failure try the fallback once, else return the error"""
+        start = time.perf_counter()
+        status, result = worker.run(self.handler, args, self.timeout, context)
+
+        if status != STATUS_OK and self.fallback_handler is not None:
+            fallback_status, fallback_result = worker.run(self.fallback_handler, args,
+                                                          self.fallback_timeout, context)
+            if fallback_status == STATUS_OK and fallback_result is not None:
+                fallback_result['error'] = result
+                status, result = STATUS_OK, fallback_result
+
+        return {'status': status, 'result': result, 'seconds': time.perf_counter() - start}
+
+    def run_batch(self, tasks: Iterable[tuple], cost: Callable[[tuple], float] = None,
+                  lookahead: int = None) -> List[Dict[str, Any]]:
+        """
+        Run handler(*args) for every task; results come back in task order
+
+        tasks may be a generator: each task is dispatched as soon as it is
+        yielded, so producing the next input (e.g. decompressing the next ZIP
+        member) overlaps with parsing. The producer blocks while lookahead
+        tasks (default twice the pool size) are in flight, which bounds the
+        memory held by queued inputs.
+
+        cost(args) estimates a task's seconds; queued tasks then run shortest
+        first instead of in order, within the lookahead window.
+        """
+        if self.size <= 0:
+            return [self._run_in_process(args) for args in tasks]
+
+        results: List[Optional[Dict[str, Any]]] = []
+        remaining = threading.Semaphore(0)
+        in_flight = threading.BoundedSemaphore(lookahead or self.size * 2)
+
+        for index, args in enumerate(tasks):
+            def done(outcome, index=index):
+                results[index] = outcome
+                in_flight.release()
+                remaining.release()
+            in_flight.acquire()
+            results.append(None)
+            self.submit(args, done, cost(args) if cost else None)
+
+        for _ in results:
+            remaining.acquire()
+
+        return results
+
+    def submit(self, args: tuple, done: Callable[[Dict[str, Any]], None], cost: float = None) -> None:
+        """
+        Queue one task; done(outcome) is called from the slot thread that ran it
+        (in-process mode: from the caller, before submit returns)
+        """
+        if self.size <= 0:
+            done(self._run_in_process(args))
+            return
+
+        self._start_threads()
+        key = time.monotonic() + (cost * SJF_WEIGHT if cost else 0)
+        # The worker logs with the submitting request's id
+        self._tasks.put((key, next(self._sequence), args, done, log_context()))
+
+    def _run_in_process(self, args: tuple) -> Dict[str, Any]:
+        """No isolation (INVOICE_WORKERS=0) - same result shape"""
+        start = time.perf_counter()
+        try:
+            with file_context(args[1]):
+                status, result = STATUS_OK, self.handler(*args)
+        except Exception as e:
+            status, result = STATUS_ERROR, {'type': type(e).__name__, 'message': str(e)}
+        return {'status': status, 'result': result, 'seconds': time.perf_counter() - start}
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-worker documents processed, RSS and restart counters"""
+        return {
+            'size': self.size,
+            'queued': self._tasks.qsize(),
+            'max_docs': self.max_docs,
+            'max_rss_mb': self.max_rss_mb,
+            'workers': [worker.stats() for worker in self._workers]
+        }
+
+    def shutdown(self) -> None:
+        """Stop all slot threads and their worker processes"""
+        with self._lock:
+            for _ in self._threads:
+                self._tasks.put((float('inf'), next(self._sequence), None, None, None))
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+
+_pool: Optional[SupervisedPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_invoice_pool() -> SupervisedPool:
+    """Process-wide pool running invoice_processing.process_invoice_file"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from invoice_processing import process_invoice_file, process_total_only
+            _pool = SupervisedPool(process_invoice_file, process_total_only)
+        return _pool
+
+
+def get_invoice_pool_stats() -> Optional[Dict[str, Any]]:
+    """Stats of the process-wide pool, None if it has not been started"""
+    return _pool.stats() if _pool is not None else None
+
+
+def shutdown_invoice_pool() -> None:
+    """Stop the process-wide pool (gunicorn worker exit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+if __name__ == "__main__":
+    print(f"Supervised pool: {POOL_SIZE} workers, {FILE_TIMEOUT:.0f}s per file, "
+          f"{WORKER_MEMORY_MB} MB cap")
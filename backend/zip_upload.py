@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+ZIP archive uploads
+Agencies send month-end invoices as one ZIP of PDFs. Members are read one
+at a time from the uploaded stream and handed over as bytes, so nothing is
+extracted to disk and each PDF can be dispatched for parsing while the
+next one is being decompressed.
+
+Configuration (environment):
+    ZIP_MAX_MEMBERS     PDF members accepted per archive (default 1000)
+    ZIP_MAX_MEMBER_MB   uncompressed size limit per member (default 50)
+    ZIP_MAX_TOTAL_MB    uncompressed size limit for all members together (default 500)
+"""
+
+import os
+import posixpath
+import zipfile
+from typing import BinaryIO, Dict, Iterator, Any, Optional, Tuple
+
+ZIP_MAX_MEMBERS = int(os.environ.get('ZIP_MAX_MEMBERS', '1000'))
+ZIP_MAX_MEMBER_MB = int(os.environ.get('ZIP_MAX_MEMBER_MB', '50'))
+ZIP_MAX_TOTAL_MB = int(os.environ.get('ZIP_MAX_TOTAL_MB', '500'))
+
+
+def is_zip_upload(filename: str) -> bool:
+    """Uploads are routed by extension, like the PDF check in the API"""
+    return bool(filename) and filename.lower().endswith('.zip')
+
+
+def is_pdf_member(info: zipfile.ZipInfo) -> bool:
+    """Skip folders, macOS resource forks and non-PDF members"""
+    name = info.filename
+    return (not info.is_dir()
+            and name.lower().endswith('.pdf')
+            and not name.startswith('__MACOSX/')
+            and not posixpath.basename(name).startswith('._'))
+
+
+def iter_pdf_members(stream: BinaryIO) -> Iterator[Tuple[str, Optional[bytes], Optional[Dict[str, Any]]]]:
+    """
+    Yield (member_name, pdf_bytes, error) for every PDF in the archive
+
+    error is set (and pdf_bytes None) for members that are too large or
+    cannot be decompressed; the rest of the archive is still read. Once the
+    members' sizes in the central directory, or the bytes actually
+    decompressed, reach ZIP_MAX_TOTAL_MB, every further member is an error.
+    """
+    max_bytes = ZIP_MAX_MEMBER_MB * 1024 * 1024
+    max_total = ZIP_MAX_TOTAL_MB * 1024 * 1024
+    total_error = {
+        'type': 'ArchiveTooLarge',
+        'message': f'Archive exceeds the {ZIP_MAX_TOTAL_MB} MB uncompressed limit'
+    }
+    declared_total = 0
+    read_total = 0
+
+    with zipfile.ZipFile(stream) as archive:
+        members = [info for info in archive.infolist() if is_pdf_member(info)]
+
+        for count, info in enumerate(members):
+            if count >= ZIP_MAX_MEMBERS:
+                yield info.filename, None, {
+                    'type': 'ArchiveTooLarge',
+                    'message': f'Archive has more than {ZIP_MAX_MEMBERS} PDF members'
+                }
+                continue
+
+            if info.file_size > max_bytes:
+                yield info.filename, None, {
+                    'type': 'MemberTooLarge',
+                    'message': f'{info.file_size / (1024 * 1024):.0f} MB exceeds the {ZIP_MAX_MEMBER_MB} MB limit'
+                }
+                continue
+
+            declared_total += info.file_size
+            if declared_total > max_total or read_total >= max_total:
+                yield info.filename, None, total_error
+                continue
+
+            # The header size can lie, so never read past either limit
+            limit = min(max_bytes, max_total - read_total)
+            try:
+                with archive.open(info) as member:
+                    data = member.read(limit + 1)
+            except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, RuntimeError) as e:
+                yield info.filename, None, {'type': type(e).__name__, 'message': str(e)}
+                continue
+            read_total += len(data)
+
+            if len(data) > limit:
+                yield info.filename, None, total_error if limit < max_bytes else {
+                    'type': 'MemberTooLarge',
+                    'message': f'Member exceeds the {ZIP_MAX_MEMBER_MB} MB limit'
+                }
+                continue
+
+            yield info.filename, data, None
+
+
+def unique_display_name(name: str, taken: set) -> str:
+    """name, or name with a numeric suffix before the extension while that is taken"""
+    if name not in taken:
+        return name
+    stem, extension = posixpath.splitext(name)
+    suffix = 2
+    while f"{stem} ({suffix}){extension}" in taken:
+        suffix += 1
+    return f"{stem} ({suffix}){extension}"
+
+
+def member_display_name(member_name: str, taken: set, archive_name: str) -> str:
+    """
+    Report key for a member: its basename, which the platform detection
+    relies on (5..., THTT..., 24...), or "archive.zip/path/name.pdf" if the
+    basename is taken (by a loose upload or another member), made unique
+    with a numeric suffix if needed
+    """
+    basename = posixpath.basename(member_name)
+    if basename not in taken:
+        return basename
+    return unique_display_name(f"{archive_name}/{member_name}", taken)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python zip_upload.py <archive.zip>")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'rb') as f:
+        for name, data, error in iter_pdf_members(f):
+            if error:
+                print(f"{name}: skipped - {error['message']}")
+            else:
+                print(f"{name}: {len(data):,} bytes")
@@ -15,7 +15,10 @@ export default function FileUpload({ onFilesSelected, isProcessing }: FileUpload
   const { getRootProps, getInputProps, isDragActive } = useDropzone({
     onDrop,
     accept: {
-      'application/pdf': ['.pdf']
+      'application/pdf': ['.pdf'],
+      // Month-end batches arrive as one ZIP of PDFs; the backend streams the members
+      'application/zip': ['.zip'],
+      'application/x-zip-compressed': ['.zip']
     },
     multiple: true,
     disabled: isProcessing
@@ -34,11 +37,11 @@ export default function FileUpload({ onFilesSelected, isProcessing }: FileUpload
       <input {...getInputProps()} />
       <CloudArrowUpIcon className="w-16 h-16 mx-auto mb-4 text-gray-400" />
       {isDragActive ? (
-        <p className="text-lg font-medium text-primary-600">Drop the PDF files here...</p>
+        <p className="text-lg font-medium text-primary-600">Drop the PDF or ZIP files here...</p>
       ) : (
         <>
           <p className="text-lg font-medium text-gray-700 mb-2">
-            Drag & drop invoice PDF files here
+            Drag & drop invoice PDF files or a ZIP archive here
           </p>
           <p className="text-sm text-gray-500">
             or click to select files
@@ -1,16 +1,66 @@
-import React, { useState } from 'react'
-import { InvoiceReport, InvoiceItem } from '@/types/invoice'
+import React, { useEffect, useState } from 'react'
+import { InvoiceReport, InvoiceItem, ReportPagination, SearchResult, StoredLineItem } from '@/types/invoice'
 import { DownloadIcon } from './icons'
 
+// Larger reports are only partly in the browser, so their search runs on the server
+const SERVER_SEARCH_MIN_ITEMS = 1000
+const SEARCH_DEBOUNCE_MS = 300
+
 interface InvoiceTableProps {
   report: InvoiceReport
+  // Set when report.files holds one page of a stored report
+  pagination?: ReportPagination | null
+  isLoadingPage?: boolean
+  onPageChange?: (page: number) => void
+  // Searches the whole stored report (GET /api/search with its batch_id)
+  onSearch?: (query: string, platform: string | null) => Promise<SearchResult>
   onExportCSV: () => void
   onExportJSON: () => void
 }
 
-export default function InvoiceTable({ report, onExportCSV, onExportJSON }: InvoiceTableProps) {
+export default function InvoiceTable({
+  report,
+  pagination,
+  isLoadingPage = false,
+  onPageChange,
+  onSearch,
+  onExportCSV,
+  onExportJSON,
+}: InvoiceTableProps) {
   const [selectedPlatform, setSelectedPlatform] = useState<string>('all')
   const [searchTerm, setSearchTerm] = useState('')
+  const [serverResults, setServerResults] = useState<SearchResult | null>(null)
+  const [isSearching, setIsSearching] = useState(false)
+
+  const useServerSearch = Boolean(onSearch) && (
+    report.summary.overall.total_items > SERVER_SEARCH_MIN_ITEMS || (pagination?.pages ?? 1) > 1
+  )
+
+  useEffect(() => {
+    const query = searchTerm.trim()
+    if (!useServerSearch || !onSearch || query === '') {
+      setServerResults(null)
+      return
+    }
+
+    let cancelled = false
+    const timer = setTimeout(async () => {
+      setIsSearching(true)
+      try {
+        const found = await onSearch(query, selectedPlatform === 'all' ? null : selectedPlatform)
+        if (!cancelled) setServerResults(found)
+      } catch (error) {
+        console.error('Error searching line items:', error)
+        if (!cancelled) setServerResults(null)
+      } finally {
+        if (!cancelled) setIsSearching(false)
+      }
+    }, SEARCH_DEBOUNCE_MS)
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
+    }
+  }, [searchTerm, selectedPlatform, useServerSearch, onSearch])
 
   // Get all items from all files
   const allItems: (InvoiceItem & { filename: string })[] = []
@@ -20,8 +70,8 @@ export default function InvoiceTable({ report, onExportCSV, onExportJSON }: Invo
     })
   })
 
-  // Filter items
-  const filteredItems = allItems.filter(item => {
+  // Filter items (the page in memory; server results replace them for large reports)
+  const filteredItems: (InvoiceItem | StoredLineItem)[] = serverResults ? serverResults.results : allItems.filter(item => {
     const matchesPlatform = selectedPlatform === 'all' || item.platform === selectedPlatform
     const matchesSearch = searchTerm === '' || 
       item.description.toLowerCase().includes(searchTerm.toLowerCase()) ||
@@ -148,8 +198,40 @@ export default function InvoiceTable({ report, onExportCSV, onExportJSON }: Invo
         </div>
       )}
 
-      <div className="mt-4 text-sm text-gray-600">
-        Showing {filteredItems.length} of {allItems.length} items
+      <div className="mt-4 flex justify-between items-center text-sm text-gray-600">
+        <span>
+          {serverResults ? (
+            <>Showing {filteredItems.length} of {serverResults.total} matches in this report</>
+          ) : (
+            <>
+              Showing {filteredItems.length} of {allItems.length} items
+              {pagination && pagination.pages > 1 && ' in these files'}
+            </>
+          )}
+          {isSearching && ' (searching…)'}
+        </span>
+        {pagination && pagination.pages > 1 && onPageChange && (
+          <div className="flex items-center gap-2">
+            <button
+              onClick={() => onPageChange(pagination.page - 1)}
+              disabled={isLoadingPage || pagination.page <= 1}
+              className="btn-secondary disabled:opacity-50"
+            >
+              Previous
+            </button>
+            <span>
+              Files {(pagination.page - 1) * pagination.limit + 1}–
+              {Math.min(pagination.page * pagination.limit, pagination.total_files)} of {pagination.total_files}
+            </span>
+            <button
+              onClick={() => onPageChange(pagination.page + 1)}
+              disabled={isLoadingPage || pagination.page >= pagination.pages}
+              className="btn-secondary disabled:opacity-50"
+            >
+              Next
+            </button>
+          </div>
+        )}
       </div>
     </div>
   )
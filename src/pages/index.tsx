@@ -4,13 +4,71 @@ import FileUpload from '@/components/FileUpload'
 import InvoiceTable from '@/components/InvoiceTable'
 import SummaryCard from '@/components/SummaryCard'
 import { SpinnerIcon } from '@/components/icons'
-import { InvoiceReport, ProcessingResult } from '@/types/invoice'
+import {
+  ColumnarReport,
+  InvoiceReport,
+  ProcessingResult,
+  ReportPage,
+  ReportPageResult,
+  ReportPagination,
+  SearchResult,
+} from '@/types/invoice'
+import { decodeReport } from '@/utils/columnar'
+import { getClientId, partitionByKnownHashes } from '@/utils/fileHash'
 import axios from 'axios'
 import toast from 'react-hot-toast'
 
+// The upload returns only the summary; files are read from the stored report a page at a time
+const FILES_PER_PAGE = 50
+const EXPORT_FILES_PER_PAGE = 500
+const ITEMS_PER_FILE = 5000
+const SEARCH_RESULTS_LIMIT = 200
+
+async function fetchFilesPage(
+  batchId: string,
+  page: number,
+  limit: number = FILES_PER_PAGE,
+  columnar: boolean = true
+): Promise<ReportPage> {
+  const response = await axios.get<ReportPageResult>(
+    `https://peepong.pythonanywhere.com/api/reports/${encodeURIComponent(batchId)}`,
+    {
+      params: {
+        page,
+        limit,
+        item_limit: ITEMS_PER_FILE,
+        include_summary: 0,
+        ...(columnar ? { format: 'columnar' } : {}),
+      },
+    }
+  )
+  if (!response.data.success || !response.data.data) {
+    throw new Error(response.data.message || 'Failed to load report')
+  }
+  return response.data.data
+}
+
+async function searchReportItems(
+  batchId: string,
+  query: string,
+  platform: string | null
+): Promise<SearchResult> {
+  const response = await axios.get<SearchResult>('https://peepong.pythonanywhere.com/api/search', {
+    params: {
+      q: query,
+      batch_id: batchId,
+      limit: SEARCH_RESULTS_LIMIT,
+      ...(platform ? { platform } : {}),
+    },
+  })
+  return response.data
+}
+
 export default function Home() {
   const [isProcessing, setIsProcessing] = useState(false)
   const [report, setReport] = useState<InvoiceReport | null>(null)
+  const [pagination, setPagination] = useState<ReportPagination | null>(null)
+  const [isLoadingPage, setIsLoadingPage] = useState(false)
   const [backendStatus, setBackendStatus] = useState<'checking' | 'online' | 'offline'>('checking')
 
   // Check backend status on mount
@@ -26,15 +84,40 @@ export default function Home() {
     checkBackend()
   }, [])
 
+  const loadFilesPage = async (batchId: string, page: number) => {
+    const data = await fetchFilesPage(batchId, page)
+    // Columnar pages decode like a columnar report; rows are rebuilt lazily
+    const decoded = decodeReport({ ...data, files: data.files ?? {} } as unknown as ColumnarReport)
+    setReport((current) => current && { ...current, files: decoded.files })
+    setPagination(data.pagination ?? null)
+  }
+
+  // Stable per report, so the table does not search again on every render
+  const batchId = report?.batch_id
+  const handleSearch = React.useCallback(
+    (query: string, platform: string | null) => searchReportItems(batchId as string, query, platform),
+    [batchId]
+  )
+
+  const handlePageChange = async (page: number) => {
+    if (!report?.batch_id) return
+
+    setIsLoadingPage(true)
+    try {
+      await loadFilesPage(report.batch_id, page)
+    } catch (error) {
+      console.error('Error loading report page:', error)
+      toast.error('Failed to load invoice files')
+    } finally {
+      setIsLoadingPage(false)
+    }
+  }
+
   const handleFilesSelected = async (files: File[]) => {
     if (files.length === 0) return
 
     setIsProcessing(true)
     const formData = new FormData()
-    
-    files.forEach((file) => {
-      formData.append('files', file)
-    })
 
     try {
       // First check if backend is running
@@ -46,19 +129,50 @@ export default function Home() {
         return
       }
 
+      // Only upload PDFs the server has not parsed before; cached ones are sent by hash
+      let upload = files
+      const clientHeaders = { 'X-Client-Id': getClientId() }
+      try {
+        const partition = await partitionByKnownHashes(files, async (hashes) => {
+          const known = await axios.post<{ known: string[] }>(
+            'https://peepong.pythonanywhere.com/api/known-hashes',
+            { hashes },
+            { headers: clientHeaders }
+          )
+          return known.data.known
+        })
+        upload = partition.upload
+        if (partition.cached.length > 0) {
+          formData.append('cached', JSON.stringify(partition.cached))
+        }
+      } catch (hashError) {
+        console.warn('Hash check failed, uploading all files:', hashError)
+      }
+
+      upload.forEach((file) => {
+        formData.append('files', file)
+      })
+
       const response = await axios.post<ProcessingResult>(
-        'https://peepong.pythonanywhere.com/api/process-invoices',
+        // Summary only: the files are paged in from the stored report below
+        'https://peepong.pythonanywhere.com/api/process-invoices?response=summary',
         formData,
         {
           headers: {
             'Content-Type': 'multipart/form-data',
+            ...clientHeaders,
           },
           timeout: 300000, // 5 minutes timeout
         }
       )
 
       if (response.data.success && response.data.data) {
-        setReport(response.data.data)
+        const summary = response.data.data as InvoiceReport
+        setReport({ ...summary, files: {} })
+        setPagination(null)
+        if (summary.batch_id) {
+          await loadFilesPage(summary.batch_id, 1)
+        }
         toast.success(`Successfully processed ${files.length} file(s)`)
       } else {
         toast.error(response.data.message || 'Failed to process invoices')
@@ -87,7 +201,8 @@ export default function Home() {
     try {
       const response = await axios.post(
         'https://peepong.pythonanywhere.com/api/export-csv',
-        report,
+        // Stored reports are exported by id; the browser only holds one page of files
+        report.batch_id ? { batch_id: report.batch_id } : report,
         {
           responseType: 'blob',
         }
@@ -106,10 +221,27 @@ export default function Home() {
     }
   }
 
-  const handleExportJSON = () => {
+  const handleExportJSON = async () => {
     if (!report) return
 
-    const dataStr = JSON.stringify(report, null, 2)
+    let exported = report
+    if (report.batch_id) {
+      try {
+        const files: InvoiceReport['files'] = {}
+        for (let page = 1, pages = 1; page <= pages; page++) {
+          const data = await fetchFilesPage(report.batch_id, page, EXPORT_FILES_PER_PAGE, false)
+          Object.assign(files, data.files)
+          pages = data.pagination?.pages ?? 1
+        }
+        exported = { ...report, files }
+      } catch (error) {
+        console.error('Error exporting JSON:', error)
+        toast.error('Failed to export JSON')
+        return
+      }
+    }
+
+    const dataStr = JSON.stringify(exported, null, 2)
     const blob = new Blob([dataStr], { type: 'application/json' })
     const link = document.createElement('a')
     link.href = URL.createObjectURL(blob)
@@ -183,6 +315,10 @@ export default function Home() {
               <SummaryCard report={report} />
               <InvoiceTable 
                 report={report}
+                pagination={pagination}
+                isLoadingPage={isLoadingPage}
+                onPageChange={handlePageChange}
+                onSearch={batchId ? handleSearch : undefined}
                 onExportCSV={handleExportCSV}
                 onExportJSON={handleExportJSON}
               />
@@ -1,3 +1,16 @@
+// Charge a credit line was linked to (possibly in another invoice)
+export interface MatchedCharge {
+  line_id: number;
+  matched_by: 'campaign_id' | 'project_period' | 'project_id';
+  filename: string;
+  invoice_number: string | null;
+  line_number: number | null;
+  project_id: string | null;
+  project_name: string | null;
+  period: string | null;
+  campaign_id: string | null;
+}
+
 export interface InvoiceItem {
   platform: string;
   filename: string;
@@ -14,6 +27,35 @@ export interface InvoiceItem {
   objective?: string | null;
   period?: string | null;
   campaign_id?: string | null;
+  matched_charge?: MatchedCharge | null;
+}
+
+export type ReconciliationStatus = 'matched' | 'mismatch' | 'no_items' | 'unverified';
+
+export interface Reconciliation {
+  status: ReconciliationStatus;
+  items_total: number;
+  printed_total: number | null;
+  difference: number | null;
+  initial_status: ReconciliationStatus;
+}
+
+export type ExtractionTier = 'text' | 'layout' | 'total_only';
+
+export interface ProcessingError {
+  type: string;
+  message: string;
+  traceback?: string;
+}
+
+export interface DuplicateFlag {
+  // batch: second copy in this upload, not counted in totals
+  // history: already seen in an earlier batch, still counted
+  scope: 'batch' | 'history';
+  matched_by: 'content' | 'invoice_number';
+  original_filename: string;
+  original_batch_id?: string;
+  first_seen_at?: string;
 }
 
 export interface InvoiceFile {
@@ -22,10 +64,16 @@ export interface InvoiceFile {
   total_amount: number;
   items_count: number;
   items: InvoiceItem[];
+  extraction_tier?: ExtractionTier | null;
+  reconciliation?: Reconciliation;
+  error?: ProcessingError;
+  cached?: boolean;
+  duplicate?: DuplicateFlag;
 }
 
 export interface InvoiceReport {
   generated_at: string;
+  batch_id?: string;
   invoice_set?: string;
   total_files: number;
   summary: {
@@ -42,6 +90,26 @@ export interface InvoiceReport {
       total_items: number;
       files_processed: number;
     };
+    reconciliation?: {
+      matched: number;
+      mismatch: number;
+      no_items: number;
+      unverified: number;
+      mismatched_files: string[];
+    };
+    by_tier?: {
+      [tier in ExtractionTier]?: number;
+    };
+    errors?: {
+      filename: string;
+      type: string;
+      message: string;
+    }[];
+    duplicates?: {
+      batch: number;
+      history: number;
+      files: (DuplicateFlag & { filename: string })[];
+    };
   };
   files: {
     [filename: string]: InvoiceFile;
@@ -51,6 +119,72 @@ export interface InvoiceReport {
 export interface ProcessingResult {
   success: boolean;
   message: string;
-  data?: InvoiceReport;
+  // Columnar when requested with ?format=columnar
+  data?: InvoiceReport | ColumnarReport;
   error?: string;
-}
\ No newline at end of file
+}
+
+export interface StoredLineItem extends Omit<InvoiceItem, 'invoice_id' | 'total' | 'matched_charge'> {
+  id: number;
+  batch_id: string;
+  created_at: string;
+}
+
+export interface SearchResult {
+  success: boolean;
+  total: number;
+  page: number;
+  limit: number;
+  results: StoredLineItem[];
+  took_ms: number;
+}
+
+// GET /api/reports/<batch_id> - one page of files, each with one page of items
+export interface ItemsPage {
+  page: number;
+  limit: number;
+  total: number;
+}
+
+export interface ReportPage extends Omit<InvoiceReport, 'files' | 'summary'> {
+  summary?: InvoiceReport['summary'];
+  files?: {
+    [filename: string]: InvoiceFile & { items_page: ItemsPage };
+  };
+  pagination?: ReportPagination;
+}
+
+export interface ReportPageResult {
+  success: boolean;
+  message?: string;
+  data?: ReportPage;
+}
+
+export interface ReportPagination {
+  page: number;
+  limit: number;
+  total_files: number;
+  pages: number;
+}
+
+// ?format=columnar - one header per file plus one array per field
+export interface ColumnarItems {
+  count: number;
+  fields: string[];
+  // Fields with the same value on every item
+  constants: { [field: string]: unknown };
+  // Plain values, or indexes into dictionaries[field] for encoded fields
+  columns: { [field: string]: unknown[] };
+  dictionaries: { [field: string]: (string | null)[] };
+}
+
+export interface ColumnarFile extends Omit<InvoiceFile, 'items'> {
+  items: ColumnarItems;
+}
+
+export interface ColumnarReport extends Omit<InvoiceReport, 'files'> {
+  format: 'columnar-v1';
+  files: {
+    [filename: string]: ColumnarFile;
+  };
+}
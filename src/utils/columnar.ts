@@ -0,0 +1,74 @@
+import {
+  ColumnarFile,
+  ColumnarItems,
+  ColumnarReport,
+  InvoiceFile,
+  InvoiceItem,
+  InvoiceReport,
+} from '@/types/invoice'
+
+export function isColumnarReport(report: InvoiceReport | ColumnarReport): report is ColumnarReport {
+  return (report as ColumnarReport).format === 'columnar-v1'
+}
+
+// Value of one field on one row, without building the row
+export function columnValue(items: ColumnarItems, field: string, index: number): unknown {
+  if (field in items.constants) return items.constants[field]
+  const column = items.columns[field]
+  if (!column) return undefined
+  const dictionary = items.dictionaries[field]
+  return dictionary ? dictionary[column[index] as number] : column[index]
+}
+
+// Build one row on demand
+export function itemAt(items: ColumnarItems, index: number): InvoiceItem {
+  const row: Record<string, unknown> = {}
+  for (const field of items.fields) {
+    row[field] = columnValue(items, field, index)
+  }
+  return row as unknown as InvoiceItem
+}
+
+// Array-like view whose rows are only built when read, then kept
+export function lazyItems(items: ColumnarItems): InvoiceItem[] {
+  const cache: (InvoiceItem | undefined)[] = new Array(items.count)
+  const target: InvoiceItem[] = []
+  return new Proxy(target, {
+    get(obj, prop, receiver) {
+      if (prop === 'length') return items.count
+      if (typeof prop === 'string' && /^\d+$/.test(prop)) {
+        const index = Number(prop)
+        if (index >= items.count) return undefined
+        return (cache[index] ??= itemAt(items, index))
+      }
+      if (prop === Symbol.iterator) {
+        return function* () {
+          for (let index = 0; index < items.count; index++) {
+            yield (cache[index] ??= itemAt(items, index))
+          }
+        }
+      }
+      // Array methods (map, filter, slice, ...) go through length and indexes above
+      const value = Reflect.get(Array.prototype, prop, receiver)
+      return typeof value === 'function' ? value.bind(receiver) : Reflect.get(obj, prop, receiver)
+    },
+    has(obj, prop) {
+      if (typeof prop === 'string' && /^\d+$/.test(prop)) return Number(prop) < items.count
+      return Reflect.has(obj, prop)
+    },
+  })
+}
+
+export function decodeFile(file: ColumnarFile): InvoiceFile {
+  return { ...file, items: lazyItems(file.items) }
+}
+
+// Columnar report -> the row-shaped report the components expect (rows built lazily)
+export function decodeReport(report: InvoiceReport | ColumnarReport): InvoiceReport {
+  if (!isColumnarReport(report)) return report
+  const files: InvoiceReport['files'] = {}
+  for (const [filename, file] of Object.entries(report.files)) {
+    files[filename] = decodeFile(file)
+  }
+  return { ...report, files }
+}
@@ -0,0 +1,55 @@
+// SHA-256 of a file's bytes as lowercase hex, matching the backend's parse cache key
+export async function sha256Hex(file: File): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer())
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, '0'))
+    .join('')
+}
+
+export interface CachedFile {
+  sha256: string
+  filename: string
+}
+
+// Split PDFs into those the server has already parsed and those that must be uploaded.
+// ZIP archives are always uploaded; their members are checked server-side.
+export async function partitionByKnownHashes(
+  files: File[],
+  fetchKnown: (hashes: string[]) => Promise<string[]>
+): Promise<{ upload: File[]; cached: CachedFile[] }> {
+  const pdfs = files.filter((file) => file.name.toLowerCase().endsWith('.pdf'))
+  const others = files.filter((file) => !file.name.toLowerCase().endsWith('.pdf'))
+  if (pdfs.length === 0 || typeof crypto === 'undefined' || !crypto.subtle) {
+    return { upload: files, cached: [] }
+  }
+
+  const hashes = await Promise.all(pdfs.map(sha256Hex))
+  const known = new Set(await fetchKnown(hashes))
+
+  const upload: File[] = [...others]
+  const cached: CachedFile[] = []
+  pdfs.forEach((file, index) => {
+    if (known.has(hashes[index])) {
+      cached.push({ sha256: hashes[index], filename: file.name })
+    } else {
+      upload.push(file)
+    }
+  })
+  return { upload, cached }
+}
+
+const CLIENT_ID_KEY = 'invoice-reader-client-id'
+
+// Random id that scopes this browser's parse cache on the server (X-Client-Id header):
+// cached results are only served back to the client that uploaded the file
+export function getClientId(): string {
+  let id = window.localStorage.getItem(CLIENT_ID_KEY)
+  if (!id) {
+    const bytes = crypto.getRandomValues(new Uint8Array(16))
+    id = Array.from(bytes)
+      .map((byte) => byte.toString(16).padStart(2, '0'))
+      .join('')
+    window.localStorage.setItem(CLIENT_ID_KEY, id)
+  }
+  return id
+}